@@ -0,0 +1,116 @@
+"""
+Benchmarks deployment package creation on a synthetic site-packages tree.
+
+Compares the serial ZipFile.write loop _zip_files used to run with
+PackageBuilder for a range of job counts, plus an incremental rebuild
+after a one-file change.
+
+    $ python benchmarks/bench_zip.py --size-mb 200 --jobs 1 4 16
+"""
+
+import argparse
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from maniplecli.util.package_builder import PackageBuilder  # noqa: E402
+
+
+def make_site_packages(root, size_mb, seed=0):
+    """
+    Creates packages of python sources (compressible) and shared objects
+    (mostly random, barely compressible) until size_mb is reached.
+    """
+    rng = random.Random(seed)
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(8))
+             for _ in range(500)]
+    target = size_mb * 1024 * 1024
+    written = 0
+    pkg = 0
+    while written < target:
+        pkg_dir = os.path.join(root, 'package_{}'.format(pkg))
+        os.makedirs(pkg_dir)
+        for i in range(40):
+            lines = ['def {}_{}(x):\n    return x + {}\n'.format(
+                rng.choice(words), j, j) for j in range(rng.randint(50, 400))]
+            data = ''.join(lines).encode()
+            with open(os.path.join(pkg_dir, 'module_{}.py'.format(i)), 'wb') as f:
+                f.write(data)
+            written += len(data)
+        so_size = rng.randint(256, 2048) * 1024
+        with open(os.path.join(pkg_dir, '_speedups.so'), 'wb') as f:
+            f.write(os.urandom(so_size // 2) + b'\0' * (so_size // 2))
+        written += so_size
+        pkg += 1
+    return written
+
+
+def list_files(root):
+    files = []
+    for dirname, subdirs, filenames in os.walk(root):
+        for filename in filenames:
+            abs_name = os.path.abspath(os.path.join(dirname, filename))
+            files.append((abs_name, abs_name[len(root) + 1:]))
+    return files
+
+
+def serial_zip(files, zip_path):
+    """The loop _zip_files ran before PackageBuilder."""
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_:
+        for abs_name, arc_name in files:
+            zip_.write(abs_name, arc_name)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size-mb', type=int, default=200)
+    parser.add_argument('--jobs', type=int, nargs='+',
+                        default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        root = os.path.join(tmp_dir, 'site-packages')
+        os.makedirs(root)
+        written = make_site_packages(root, args.size_mb)
+        files = list_files(root)
+        zip_path = os.path.join(tmp_dir, 'package.zip')
+        print('{} files, {:.1f} MB, {} cpus'.format(
+            len(files), written / 1024 / 1024, os.cpu_count()))
+
+        baseline = timed(serial_zip, files, zip_path)
+        print('{:<28}{:>8.2f}s'.format('serial ZipFile.write', baseline))
+
+        for jobs in sorted(set(args.jobs)):
+            for path in (zip_path, PackageBuilder.manifest_path(zip_path)):
+                if os.path.exists(path):
+                    os.remove(path)
+            elapsed = timed(PackageBuilder.build, files, zip_path, jobs)
+            print('{:<28}{:>8.2f}s {:>6.2f}x'.format(
+                'PackageBuilder jobs={}'.format(jobs),
+                elapsed, baseline / elapsed))
+
+        with open(files[0][0], 'ab') as f:
+            f.write(b'# changed\n')
+        elapsed = timed(PackageBuilder.build, files, zip_path, max(args.jobs))
+        print('{:<28}{:>8.2f}s {:>6.2f}x'.format(
+            'incremental, 1 file changed', elapsed, baseline / elapsed))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,7 @@ import click
 logger = logging.getLogger(__name__)
 
 MANIPLE_COMMAND_PACKAGES = {
+    'maniplecli.commands.cache',
     'maniplecli.commands.logs',
     'maniplecli.commands.pack',
     'maniplecli.commands.config',
@@ -0,0 +1,69 @@
+import click
+import datetime
+import sys
+
+from maniplecli.util.dependency_cache import DependencyCache
+from maniplecli.util.package_analyzer import format_size
+
+HELP_TEXT = """
+Inspect and prune the cache of installed dependencies used when creating
+deployment packages. Set MANIPLE_CACHE_DIR to move the cache and
+MANIPLE_CACHE_MAX_SIZE_MB to change its maximum size.\n
+\b
+List cached dependencies (least recently used first).
+$ maniple cache -l \n
+\b
+Evict least recently used dependencies until the cache is under 500 MB.
+$ maniple cache -p -m 500 \n
+\b
+Delete the whole cache.
+$ maniple cache -c
+"""
+
+
+@click.command('cache', help=HELP_TEXT,
+               short_help='Inspect and prune the dependency cache.')
+@click.option('-l', '--list', 'list_',
+              help='List cached dependencies.', is_flag=True)
+@click.option('-p', '--prune',
+              help='Evict least recently used dependencies.', is_flag=True)
+@click.option('-m', '--max-size',
+              help='Size in MB to prune the cache to. Defaults to '
+                   'MANIPLE_CACHE_MAX_SIZE_MB.', type=int, default=None)
+@click.option('-c', '--clear',
+              help='Delete all cached dependencies.', is_flag=True)
+def cli(list_, prune, max_size, clear):
+    if clear:
+        click.confirm('Are you sure you want to clear the dependency cache?',
+                      abort=True)
+        DependencyCache.clear()
+        click.secho('Cache cleared.', fg='green')
+    if prune:
+        if max_size is None:
+            max_size_bytes = DependencyCache.max_size()
+        else:
+            max_size_bytes = max_size * 1024 * 1024
+        removed = DependencyCache.evict(max_size_bytes)
+        click.secho('Evicted {} entries ({}).'.format(
+            len(removed), format_size(sum(meta['size'] for meta in removed))),
+            fg='green')
+    if list_ or not (clear or prune):
+        list_entries()
+    sys.exit(0)
+
+
+def list_entries():
+    entries = DependencyCache.entries()
+    click.echo('Cache: {}'.format(DependencyCache.cache_dir()))
+    for meta in entries:
+        click.echo('{}  {:>10}  {:>4} hits  last used {}  {}'.format(
+            meta['key'][:12],
+            format_size(meta['size']),
+            meta.get('hits', 0),
+            datetime.datetime.fromtimestamp(meta['last_used']).strftime(
+                '%Y-%m-%d %H:%M'),
+            meta['description']))
+    click.echo('{} entries, {} of {}.'.format(
+        len(entries),
+        format_size(sum(meta['size'] for meta in entries)),
+        format_size(DependencyCache.max_size())))
@@ -115,7 +115,7 @@ def get_saved_configs(ctx, param, value):
               help='List saved configs.', is_flag=True,
               callback=get_saved_configs, is_eager=True)
 @click.option('-t', '--tf-file',
-              help='TF file, defaults to main.tf', default=None)
+              help='TF file or directory, defaults to main.tf', default=None)
 @click.option('-s3', '--s3-bucket',
               help='Set s3 bucket', default=None)
 @click.option('-k', '--s3-key',
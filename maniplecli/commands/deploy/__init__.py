@@ -1,14 +1,39 @@
+import hashlib
+import json
 import logging
 import click
 import os
+import shutil
 import sys
+import time
 
-from maniplecli.commands.pack.command import (create_package_fn,
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from maniplecli.commands.pack.command import (DIRECT_UPLOAD_LIMIT,
+                                              LAMBDA_CALLS_PER_SECOND,
+                                              LAMBDA_RATE_LIMITER,
+                                              UPLOAD_MODES,
+                                              _zip_path,
+                                              create_package_fn,
+                                              deploy_code_fn,
+                                              install_dependencies_fn,
+                                              package_digest,
                                               update_script_fn,
                                               upload_package_fn,
-                                              update_function_fn)
-from maniplecli.util.config_loader import ConfigLoader
+                                              update_function_fn,
+                                              publish_layer_fn,
+                                              script_files,
+                                              stream_package_fn,
+                                              wait_for_updates_fn)
+from maniplecli.util.aws_clients import AwsClients
+from maniplecli.util.config_loader import ConfigError, ConfigLoader
+from maniplecli.util.deploy_state import DeployState
+from maniplecli.util.package_analyzer import format_size
+from maniplecli.util.project_index import ProjectIndex
+from maniplecli.util.s3_uploader import S3Uploader, MIN_CHUNK_SIZE_MB
 from maniplecli.util.shell import Shell
+from maniplecli.util.tf_evaluator import TerraformEvaluator
+from maniplecli.util.timings import Timings
+from maniplecli.util.update_waiter import UpdateWaiter
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -28,14 +53,59 @@ HELP_TEXT = """
     Deploy all functions and run terraform apply
     $ maniple deploy -a -n \n
     \b
+    Deploy all functions, 4 at a time. Functions that haven't changed since
+    their last deploy are skipped.
+    $ maniple deploy -a -j 4 \n
+    \b
+    Show what deploy -a would rebuild, upload, update and apply without
+    building anything or calling AWS, as JSON with --json
+    $ maniple deploy -a --plan \n
+    \b
+    Deploy all functions, changed or not
+    $ maniple deploy -a --force \n
+    \b
+    Return as soon as the updates are sent instead of waiting for the
+    functions to run the new code
+    $ maniple deploy -a --no-wait \n
+    \b
     Only updates the script of the function and deploys it.
     $ maniple deploy -u \n
     \b
     Deploy lambda and use terraform to create the resource (ie run terraform apply)
     $ maniple deploy -n \n
     \b
-    Deploy all lambda resources in a file with user terraform file name (defaults to 'main.tf')
-    $ maniple deploy -a -n -t my_resources.tf
+    Deploy all lambda resources of a terraform file or directory (defaults to
+    'main.tf'), every terraform file of its directory is loaded
+    $ maniple deploy -a -n -m my_resources.tf \n
+    $ maniple deploy -a -n -m infra \n
+    \b
+    Deploy all changed functions, terraform apply only targets them and
+    changes up to 20 resources at a time
+    $ maniple deploy -a -n --parallelism 20 \n
+    \b
+    Deploy all functions with the variables of a var file, terraform apply
+    uses it too
+    $ maniple deploy -a -n --var-file prod.tfvars \n
+    \b
+    Deploy your function using 8 cores to compress the package
+    $ maniple deploy -j 8 \n
+    \b
+    Deploy your function with its dependencies in a Lambda layer. Code-only
+    changes then upload just the script.
+    $ maniple deploy --layer \n
+    \b
+    Deploy your function with slimmed libraries
+    $ maniple deploy --slim --exclude "*.md" \n
+    \b
+    Show where the time of a deploy goes and save it as JSON
+    $ maniple deploy -a --timings --timings-json timings.json \n
+    \b
+    Deploy your function zipping the package while it uploads
+    $ maniple deploy --stream \n
+    \b
+    Send the package straight to the function if it's small enough, without
+    updating the s3 object
+    $ maniple deploy --upload-mode direct
 """
 
 
@@ -50,100 +120,722 @@ HELP_TEXT = """
               help='Deploys a new AWS resource with Terraform Apply',
               is_flag=True, default=False)
 @click.option('-m', '--main_tf_file',
-              help='Name of terraform file (Default=main.tf) for use with .tf.json files',
+              help='Terraform file or directory (Default=main.tf), every terraform '
+                   'file of its directory is loaded',
               default='main.tf')
 @click.option('-t', '--target',
-              help='Target terraform resource, must be in form of resource.aws_lambda_function.name',
+              help='Target terraform address, aws_lambda_function.name or module.name',
               default=None)
-def cli(all, update, new_function, main_tf_file, target):
-    run_cli(all, update, new_function, main_tf_file, target)
+@click.option('--parallelism',
+              help='Number of resources terraform apply changes at the same time.',
+              type=int, default=None)
+@click.option('--var-file',
+              help='Terraform variables file, applied after terraform.tfvars '
+                   'and *.auto.tfvars. Can be repeated.',
+              type=click.Path(exists=True, dir_okay=False), multiple=True)
+@click.option('-j', '--jobs',
+              help='Number of files compressed in parallel, with --all the '
+                   'number of functions deployed in parallel.',
+              type=int, default=1)
+@click.option('--api-rate',
+              help='Maximum Lambda API calls per second (Default={}).'.format(
+                  LAMBDA_CALLS_PER_SECOND),
+              type=float, default=LAMBDA_CALLS_PER_SECOND)
+@click.option('--chunk-size',
+              help='Size in MB of each part of a multipart upload, at least {}.'.format(
+                  MIN_CHUNK_SIZE_MB),
+              type=click.FloatRange(min=MIN_CHUNK_SIZE_MB), default=None)
+@click.option('--upload-concurrency',
+              help='Number of parts uploaded at the same time.',
+              type=int, default=None)
+@click.option('--layer',
+              help='Package the dependencies in a Lambda layer.',
+              is_flag=True, default=False)
+@click.option('--slim',
+              help='Remove files not needed at runtime from the libraries.',
+              is_flag=True, default=False)
+@click.option('--exclude',
+              help='Pattern of library files to remove, implies --slim.',
+              multiple=True)
+@click.option('--stream',
+              help='Zip the package while uploading it instead of writing it to disk.',
+              is_flag=True, default=False)
+@click.option('--upload-mode',
+              help='direct sends packages under 50 MB straight to the function '
+                   'and skips the s3 upload (Default=s3).',
+              type=click.Choice(UPLOAD_MODES), default='s3')
+@click.option('--wait/--no-wait',
+              help='Wait until updated functions run the new code (Default=wait).',
+              default=True)
+@click.option('-f', '--force',
+              help='With --all, deploy functions that haven\'t changed too.',
+              is_flag=True, default=False)
+@click.option('--plan',
+              help='Show what deploy --all would do without deploying anything.',
+              is_flag=True, default=False)
+@click.option('--json', 'json_output',
+              help='Print the plan as JSON.', is_flag=True, default=False)
+@click.option('--timings',
+              help='Print the time spent in each stage of the deploy.',
+              is_flag=True, default=False)
+@click.option('--timings-json',
+              help='Write the stage timings to this JSON file.',
+              type=click.Path(dir_okay=False), default=None)
+def cli(all, update, new_function, main_tf_file, target, parallelism, var_file,
+        jobs, api_rate, chunk_size, upload_concurrency, layer, slim, exclude,
+        stream, upload_mode, wait, force, plan, json_output, timings,
+        timings_json):
+    run_cli(all, update, new_function, main_tf_file, target, jobs, chunk_size,
+            upload_concurrency, layer, slim, exclude, stream, api_rate, force,
+            upload_mode, wait, parallelism, timings, timings_json, plan,
+            json_output, var_file)
 
 
-def run_cli(all, update, new_function, main_tf_file, target):
-    if all:
-        _deploy_all(new_function, main_tf_file)
-    else:
-        if update:
-            _update()
+def run_cli(all, update, new_function, main_tf_file, target, jobs=1,
+            chunk_size=None, upload_concurrency=None, layer=False, slim=False,
+            exclude=(), stream=False, api_rate=LAMBDA_CALLS_PER_SECOND,
+            force=False, upload_mode='s3', wait=True, parallelism=None,
+            timings=False, timings_json=None, plan=False, json_output=False,
+            var_files=()):
+    if timings or timings_json:
+        Timings.enable()
+    if var_files:
+        TerraformEvaluator.configure(var_files)
+    LAMBDA_RATE_LIMITER.set_rate(api_rate)
+    transfer_config = S3Uploader.transfer_config(chunk_size, upload_concurrency)
+    # With --all every function uploads its parts at the same time
+    AwsClients.configure(transfer_config.max_concurrency * (max(1, jobs) if all else 1))
+    package_options = {
+        'jobs': jobs,
+        'layer': layer,
+        'slim': slim or bool(exclude),
+        'excludes': exclude,
+        'stream': stream,
+        'upload_mode': upload_mode,
+        'wait': wait,
+        'parallelism': parallelism
+    }
+    try:
+        if plan:
+            _plan(new_function, main_tf_file, package_options, force,
+                  json_output)
+        elif all:
+            _deploy_all(new_function, main_tf_file, transfer_config,
+                        package_options, force)
+        elif update:
+            _update(transfer_config, package_options)
         elif new_function:
-            _new_function(target)
+            _new_function(target, transfer_config, package_options)
         else:
-            _deploy()
+            _deploy(transfer_config, package_options)
+    finally:
+        # Also reported when the deploy fails
+        if timings or timings_json:
+            Timings.finish(timings, timings_json)
     sys.exit(0)
 
 
-def _deploy():
+def _deploy(transfer_config=None, package_options=None):
+    package_options = package_options or {}
+    layer = package_options.get('layer', False)
     config = ConfigLoader.add_defaults(ConfigLoader.load_config())
-    create_package_fn(config['script'], config['requirements'], config['package'])
-    upload_package_fn(config['s3_bucket'], config['s3_key'], config['package'])
-    update_function_fn(config['name'], config['s3_bucket'], config['s3_key'])
+    _create_package(config, package_options)
+    if layer:
+        publish_layer_fn(config['name'], config['s3_bucket'], config['s3_key'],
+                         config['package'], transfer_config,
+                         tf_file=config['tf_file'])
+    if _upload_and_update(config, transfer_config, package_options):
+        _wait_for_update(config, package_options)
 
 
-def _update():
+def _update(transfer_config=None, package_options=None):
+    package_options = package_options or {}
     config = ConfigLoader.add_defaults(ConfigLoader.load_config())
-    update_script_fn(config['package'], config['script'])
-    upload_package_fn(config['s3_bucket'], config['s3_key'], config['package'])
-    update_function_fn(config['name'], config['s3_bucket'], config['s3_key'])
+    if not package_options.get('stream'):
+        update_script_fn(config['package'], config['script'],
+                         package_options.get('jobs', 1))
+    if _upload_and_update(config, transfer_config, package_options):
+        _wait_for_update(config, package_options)
+
 
+def _wait_for_update(config, package_options):
+    if not package_options.get('wait', True):
+        return
+    results = wait_for_updates_fn([config['name']])
+    if UpdateWaiter.failed(results):
+        sys.exit(1)
 
-def _new_function(target):
+
+def _new_function(target, transfer_config=None, package_options=None):
+    package_options = package_options or {}
+    layer = package_options.get('layer', False)
     config = ConfigLoader.add_defaults(ConfigLoader.load_config())
-    create_package_fn(config['script'], config['requirements'], config['package'])
-    upload_package_fn(config['s3_bucket'], config['s3_key'], config['package'])
-    _terraform_apply(target)
+    _create_package(config, package_options)
+    _upload(config, transfer_config, package_options)
+    _terraform_apply([target] if target else None,
+                     package_options.get('parallelism'))
+    # The function has to exist before a layer can be attached to it
+    if layer:
+        publish_layer_fn(config['name'], config['s3_bucket'], config['s3_key'],
+                         config['package'], transfer_config,
+                         tf_file=config['tf_file'])
+
 
+def _deploy_all(apply_flag, tf_file, transfer_config=None, package_options=None,
+                force=False):
+    """
+    Deploys every Lambda resource in the terraform file. Up to jobs functions
+    are built, uploaded and updated at the same time, each in its own
+    package directory. A function that fails doesn't stop the others, the
+    command ends with a summary of every function.
 
-def _deploy_all(apply_flag, tf_file):
+    Functions whose script, requirements, terraform resource and package
+    options haven't changed since their last deploy are skipped unless
+    force is set. The libraries of functions with the same requirements and
+    runtime are installed once and linked into each of their packages.
 
-    resources_to_deploy = ConfigLoader.get_possible_resources(
-        ConfigLoader.load_terraform(tf_file)
-    )
+    Unless wait is turned off the updated functions are polled together
+    until they all run the new code, a function whose update fails is
+    reported as failed.
+    """
+    package_options = dict(package_options or {})
+    workers = max(1, package_options.get('jobs', 1))
+    # Functions are deployed in parallel instead of their files
+    package_options['jobs'] = 1
+
+    functions, errors = _load_functions(tf_file)
+    state = DeployState.load()
+    fingerprints = _fingerprints(functions, tf_file, package_options)
+    changes = _changes(functions, state, fingerprints)
+    changed = [(config, runtime) for config, runtime in functions
+               if changes[config['name']] or force]
+    skipped = len(functions) - len(changed)
+    if skipped:
+        click.echo('Skipping {} unchanged functions, use --force to deploy them.'.format(
+            skipped))
     logger.debug('Resources to deploy: {}'.format(
-        resources_to_deploy
-    ))
-    for resource in resources_to_deploy:
-        # resource = (int_value, name, resource_or_module)
-        temp_config = ConfigLoader.reset_config()
-        temp_config['name'] = resource[1]
-        temp_config = ConfigLoader.add_defaults(temp_config)
-        create_package_fn(
-            temp_config['script'],
-            temp_config['requirements'],
-            temp_config['package'])
-        upload_package_fn(
-            temp_config['s3_bucket'],
-            temp_config['s3_key'],
-            temp_config['package'])
-        logger.debug('Created and uploaded {} resource'.format(temp_config['name']))
-        if apply_flag is False:
-            update_function_fn(
-                temp_config['name'],
-                temp_config['s3_bucket'],
-                temp_config['s3_key'])
+        [config['name'] for config, runtime in changed]))
+
+    shared = _install_shared_dependencies(changed, package_options, workers)
+
+    def deploy(config, runtime):
+        uploaded = _deploy_function(config, runtime, apply_flag,
+                                    transfer_config, package_options,
+                                    shared.get(config['name']))
+        if apply_flag:
+            return 'uploaded' if uploaded else 'unchanged'
+        return 'updated' if uploaded else 'unchanged'
+
+    try:
+        results = _run_pipelines(changed, deploy, workers)
+    finally:
+        for directory in set(shared.values()):
+            shutil.rmtree(directory, ignore_errors=True)
+
+    if not apply_flag and package_options.get('wait', True):
+        waited = wait_for_updates_fn(
+            [name for name, status, seconds, error in results if status == 'updated'])
+        # Functions whose update failed still run their old code
+        not_updated = set(UpdateWaiter.failed(waited))
+        results = [(name, 'failed', seconds, 'update {}: {}'.format(
+                        waited[name]['status'], waited[name]['reason']))
+                   if name in not_updated else (name, status, seconds, error)
+                   for name, status, seconds, error in results]
+
+    failed = [name for name, status, seconds, error in results if status == 'failed']
+    if apply_flag and not failed:
+        if changed:
+            # Only the rebuilt functions are applied, a full apply refreshes
+            # every resource in the stack
+            _terraform_apply(
+                _terraform_targets(tf_file, [config['name'] for config, runtime in changed]),
+                package_options.get('parallelism'))
+        if package_options.get('layer'):
+            # The functions have to exist before a layer can be attached
+            def attach(config, runtime):
+                publish_layer_fn(config['name'], config['s3_bucket'],
+                                 config['s3_key'], config['package'],
+                                 transfer_config, runtime, config['tf_file'])
+                return 'layer attached'
+            attached = _run_pipelines(changed, attach, workers)
+            results = [attach_result if attach_result[1] == 'failed' else result
+                       for result, attach_result in zip(results, attached)]
+    elif apply_flag:
+        click.secho('Skipping terraform apply.', fg='red')
+        # Uploaded functions weren't applied, they are deployed next time
+        results = [(name, 'not applied' if status != 'failed' else status,
+                    seconds, error)
+                   for name, status, seconds, error in results]
+
+    configs = {config['name']: config for config, runtime in functions}
+    recorded = False
+    for name, status, seconds, error in results:
+        if status not in ['failed', 'not applied']:
+            state[name] = DeployState.record(
+                fingerprints[name],
+                package_digest(configs[name]['package'], configs[name]['script'],
+                               package_options.get('stream', False)),
+                seconds)
+            recorded = True
+    if recorded:
+        DeployState.save(state)
+
+    deployed = {result[0]: result for result in results}
+    results = [deployed.get(config['name'], (config['name'], 'skipped', 0.0, None))
+               for config, runtime in functions]
+    # Functions whose config couldn't be resolved weren't deployed
+    results.extend((name, 'failed', 0.0, error) for name, error in errors)
+    failed = [name for name, status, seconds, error in results if status == 'failed']
+    _print_summary(results)
+    if failed:
+        click.secho('{} of {} functions failed: {}'.format(
+            len(failed), len(results), ', '.join(failed)), fg='red')
+        sys.exit(1)
+
+
+def _fingerprints(functions, tf_file, package_options):
+    """
+    Returns:
+        A dictionary of the DeployState fingerprint of each function by name.
+    """
+    tf = ConfigLoader.load_terraform(tf_file)
+    options = {
+        'layer': package_options.get('layer', False),
+        'slim': package_options.get('slim', False),
+        'excludes': sorted(package_options.get('excludes', ()))
+    }
+    return {
+        config['name']: DeployState.fingerprint(
+            config, runtime,
+            ConfigLoader.load_lambda_resource(config['name'], tf), options,
+            _script_files(config))
+        for config, runtime in functions
+    }
 
-    if apply_flag:
-        _terraform_apply(None)
 
+def _script_files(config):
+    """
+    Returns:
+        The script files packaged for the function, the same list the
+        package is zipped from so files it leaves out don't count as
+        changes.
+    """
+    if not os.path.exists(config['script']):
+        return []
+    return script_files(config['package'], config['script'])
 
-def _terraform_apply(target):
-    logger.debug('Target: {}'.format(target))
-    if target is not None:
-        terraform_commands = [
-            ['terraform', 'init'],
-            ['terraform', 'apply', '-target={}'.format(target),
-             '-auto-approve']
-        ]
+
+def _plan(apply_flag, tf_file, package_options, force=False, json_output=False):
+    """
+    Works out what deploy --all would do from the terraform file, the deploy
+    state and the files on disk, without building anything or calling AWS.
+    Package sizes are those of the last build, or of the unzipped files if
+    the function hasn't been built, and durations those of the last deploy.
+    The upload of a package that turns out to be unchanged is skipped when
+    deploying, the plan can't know that offline.
+    """
+    functions, errors = _load_functions(tf_file)
+    state = DeployState.load()
+    fingerprints = _fingerprints(functions, tf_file, package_options)
+    changes = _changes(functions, state, fingerprints)
+    addresses = _terraform_addresses(tf_file) if apply_flag else {}
+    rows = [_plan_function(config, changes[config['name']],
+                           state.get(config['name']), apply_flag,
+                           addresses.get(config['name']), package_options, force)
+            for config, runtime in functions]
+    rows.extend(_plan_error(name, error) for name, error in errors)
+    plan = {
+        'functions': rows,
+        'summary': _plan_summary(rows, max(1, package_options.get('jobs', 1)))
+    }
+    if json_output:
+        click.echo(json.dumps(plan, indent=2))
     else:
-        terraform_commands = [
-            ['terraform', 'init'],
-            ['terraform', 'apply' '-auto-approve']
-        ]
+        _print_plan(plan)
+    return plan
+
+
+def _plan_function(config, changes, entry, apply_flag, address, package_options,
+                   force):
+    size, size_source = _estimate_size(config)
+    row = {
+        'function': config['name'],
+        'action': 'deploy' if changes or force else 'skip',
+        'changes': changes,
+        'upload': None,
+        'update': False,
+        'apply': None,
+        'estimated_bytes': size,
+        'size_source': size_source,
+        'estimated_seconds': entry.get('seconds') if entry else None
+    }
+    if row['action'] == 'skip':
+        return row
+    upload_mode = package_options.get('upload_mode', 's3')
+    if not apply_flag and not package_options.get('stream') \
+            and upload_mode == 'direct' and size <= DIRECT_UPLOAD_LIMIT:
+        row['upload'] = 'direct'
+    else:
+        row['upload'] = 's3'
+    row['update'] = not apply_flag
+    row['apply'] = address
+    return row
+
+
+def _plan_error(name, error):
+    return {
+        'function': name,
+        'action': 'error',
+        'changes': [],
+        'upload': None,
+        'update': False,
+        'apply': None,
+        'estimated_bytes': 0,
+        'size_source': None,
+        'estimated_seconds': None,
+        'error': error
+    }
+
+
+def _estimate_size(config):
+    """
+    Returns:
+        The estimated size in bytes of the function's package and where it
+        comes from.
+    """
+    zip_path = _zip_path(config['package'])
+    if os.path.isfile(zip_path):
+        return os.path.getsize(zip_path), 'last build'
+    return _tree_size(config['package']) + _tree_size(config['script']), 'unzipped files'
+
+
+def _tree_size(path):
+    if path is None or not os.path.exists(path):
+        return 0
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for dirname, subdirs, files in os.walk(path):
+        for filename in files:
+            size += os.lstat(os.path.join(dirname, filename)).st_size
+    return size
+
+
+def _plan_summary(rows, workers):
+    deployed = [row for row in rows if row['action'] == 'deploy']
+    known = [row['estimated_seconds'] for row in deployed
+             if row['estimated_seconds'] is not None]
+    errors = [row for row in rows if row['action'] == 'error']
+    return {
+        'deploy': len(deployed),
+        'skip': len(rows) - len(deployed) - len(errors),
+        'errors': len(errors),
+        'upload_bytes': sum(row['estimated_bytes'] for row in deployed),
+        's3_uploads': len([row for row in deployed if row['upload'] == 's3']),
+        'direct_uploads': len([row for row in deployed if row['upload'] == 'direct']),
+        'updates': len([row for row in deployed if row['update']]),
+        'applies': len([row for row in deployed if row['apply']]),
+        # The functions are deployed workers at a time
+        'estimated_seconds': max([sum(known) / workers] + known) if known else 0.0,
+        'unknown_seconds': len(deployed) - len(known)
+    }
+
+
+def _print_plan(plan):
+    click.echo('{:<30} {:<7} {:<7} {:<7} {:>10} {:>8}  {}'.format(
+        'Function', 'Action', 'Upload', 'Update', 'Size', 'Seconds', 'Changes'))
+    for row in plan['functions']:
+        seconds = row['estimated_seconds']
+        line = '{:<30} {:<7} {:<7} {:<7} {:>10} {:>8}  {}'.format(
+            row['function'][:30], row['action'], row['upload'] or '-',
+            'yes' if row['update'] else '-', format_size(row['estimated_bytes']),
+            '{:.1f}'.format(seconds) if seconds is not None else '?',
+            ', '.join(row['changes']))
+        if row['action'] == 'deploy':
+            click.secho(line, fg='yellow')
+        elif row['action'] == 'error':
+            click.secho('{:<30} {:<7} {}'.format(row['function'][:30], 'error',
+                                                 row['error']), fg='red')
+        else:
+            click.echo(line)
+    summary = plan['summary']
+    click.echo('')
+    click.echo('{} to deploy, {} unchanged. Up to {} to upload, {} through s3 '
+               'and {} directly.'.format(
+                   summary['deploy'], summary['skip'],
+                   format_size(summary['upload_bytes']), summary['s3_uploads'],
+                   summary['direct_uploads']))
+    if summary['errors']:
+        click.secho('{} functions can\'t be deployed until their config is '
+                    'fixed.'.format(summary['errors']), fg='red')
+    if summary['applies']:
+        click.echo('terraform apply targets: {}'.format(', '.join(
+            row['apply'] for row in plan['functions'] if row['apply'])))
+    estimate = 'About {:.0f}s'.format(summary['estimated_seconds'])
+    if summary['unknown_seconds']:
+        estimate += ' plus {} functions never deployed before'.format(
+            summary['unknown_seconds'])
+    click.echo(estimate + '.')
+
+
+def _changes(functions, state, fingerprints):
+    """
+    Returns:
+        A dictionary by function name of what changed since its last
+        deploy, empty for unchanged functions.
+    """
+    changes = {}
+    for config, runtime in functions:
+        changes[config['name']] = DeployState.changes(
+            state.get(config['name']), fingerprints[config['name']])
+        logger.debug('{} changed: {}'.format(config['name'], changes[config['name']]))
+    return changes
+
+
+def _load_functions(tf_file):
+    """
+    Resolves the config and runtime of every Lambda resource in the terraform
+    file in one pass, without prompting or changing the current config.
+
+    Returns:
+        A list of (config, runtime) tuples of the functions that were
+        resolved and a list of (name, error) tuples of those that weren't.
+    """
+    try:
+        results = ConfigLoader.resolve_all(tf_file)
+    except ConfigError as e:
+        click.secho(str(e), fg='red')
+        sys.exit(1)
+    functions = [(result['config'], result['runtime']) for result in results
+                 if result['error'] is None]
+    errors = [(result['name'], result['error']) for result in results
+              if result['error'] is not None]
+    return functions, errors
+
+
+def _install_shared_dependencies(functions, package_options, workers):
+    """
+    Groups the functions by the content of their requirements file and their
+    runtime and installs the libraries of each group with more than one
+    function once. If a group fails its functions install their libraries
+    themselves, so the error is reported for each of them.
+
+    Returns:
+        A dictionary of the directory with the installed libraries by
+        function name.
+    """
+    groups = {}
+    for config, runtime in functions:
+        key = _dependencies_key(config['requirements'], runtime)
+        if key is not None:
+            groups.setdefault(key, []).append((config, runtime))
+    groups = [(key, members) for key, members in groups.items()
+              if len(members) > 1]
+
+    def install(key, members):
+        config, runtime = members[0]
+        directory = os.path.join(os.path.dirname(config['package']),
+                                 '.shared', key[:16])
+        names = [member[0]['name'] for member in members]
+        click.echo('Installing libraries once for {}...'.format(', '.join(names)))
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+        try:
+            install_dependencies_fn(config['script'], config['requirements'],
+                                    directory, runtime,
+                                    slim=package_options.get('slim', False),
+                                    excludes=package_options.get('excludes', ()))
+        except (SystemExit, Exception) as e:
+            logger.debug('Shared install for {} failed: {}'.format(names, e))
+            shutil.rmtree(directory, ignore_errors=True)
+            return {}
+        return {name: directory for name in names}
+
+    shared = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for installed in executor.map(lambda group: install(*group), groups):
+            shared.update(installed)
+    return shared
+
+
+def _dependencies_key(requirements, runtime):
+    """
+    Returns a hash of the requirements file and the runtime, or None if the
+    function has no requirements file.
+    """
+    if requirements is None or not os.path.isfile(requirements):
+        return None
+    sha = hashlib.sha256(runtime.encode('utf-8'))
+    with open(requirements, 'rb') as f:
+        sha.update(f.read())
+    return sha.hexdigest()
+
+
+def _deploy_function(config, runtime, apply_flag, transfer_config,
+                     package_options, dependencies=None):
+    """
+    Builds and uploads a function and updates it unless terraform apply
+    will. dependencies is a directory with the function's libraries already
+    installed.
+
+    Returns:
+        True if the package was uploaded or the function updated, False if
+        it was unchanged.
+    """
+    layer = package_options.get('layer', False)
+    _create_package(config, package_options, runtime, dependencies)
+    if apply_flag:
+        # terraform apply reads the package from s3
+        uploaded = _upload(config, transfer_config, package_options)
+        logger.debug('Created and uploaded {} resource'.format(config['name']))
+        return uploaded
+    if layer:
+        publish_layer_fn(config['name'], config['s3_bucket'], config['s3_key'],
+                         config['package'], transfer_config, runtime,
+                         config['tf_file'])
+    return _upload_and_update(config, transfer_config, package_options)
+
+
+def _run_pipelines(functions, pipeline, workers):
+    """
+    Runs pipeline(config, runtime) for every function in a pool of workers
+    threads.
+
+    Returns:
+        A list of (name, status, seconds, error) tuples in the order of
+        functions. The status is what pipeline returned or 'failed'.
+    """
+    def run(config, runtime):
+        start = time.time()
+        try:
+            with Timings.function(config['name']):
+                status, error = pipeline(config, runtime), None
+        except SystemExit as e:
+            # Errors are printed before exiting
+            status, error = 'failed', 'exit code {}'.format(e.code)
+        except Exception as e:
+            logger.debug('{} failed'.format(config['name']), exc_info=True)
+            click.secho('{} failed: {}'.format(config['name'], e), fg='red')
+            status, error = 'failed', str(e)
+        return config['name'], status, time.time() - start, error
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run, config, runtime)
+                   for config, runtime in functions]
+        for future in as_completed(futures):
+            name, status, seconds, error = future.result()
+            logger.debug('{} {} in {:.1f}s'.format(name, status, seconds))
+        return [future.result() for future in futures]
+
+
+def _print_summary(results):
+    click.echo('')
+    click.echo('{:<40} {:<15} {:>10}'.format('Function', 'Status', 'Seconds'))
+    for name, status, seconds, error in results:
+        line = '{:<40} {:<15} {:>10.1f}'.format(name, status, seconds)
+        if status == 'failed':
+            click.secho('{}  {}'.format(line, error), fg='red')
+        else:
+            click.echo(line)
+
+
+def _create_package(config, package_options, runtime=None, dependencies=None):
+    create_package_fn(config['script'], config['requirements'], config['package'],
+                      package_options.get('jobs', 1),
+                      package_options.get('layer', False),
+                      package_options.get('slim', False),
+                      package_options.get('excludes', ()),
+                      package_options.get('stream', False),
+                      runtime=runtime, dependencies=dependencies)
+
+
+def _upload_and_update(config, transfer_config, package_options):
+    """
+    Returns:
+        True if the function was updated, False if its code was unchanged.
+    """
+    if not package_options.get('stream'):
+        return deploy_code_fn(config['name'], config['s3_bucket'],
+                              config['s3_key'], config['package'],
+                              transfer_config,
+                              package_options.get('upload_mode', 's3'))
+    # A streamed package only exists in s3, the function's code can't be
+    # compared with it so the function is updated even if the upload was
+    # skipped
+    _upload(config, transfer_config, package_options)
+    if not update_function_fn(config['name'], config['s3_bucket'],
+                              config['s3_key']):
+        sys.exit(1)
+    return True
+
+
+def _upload(config, transfer_config, package_options):
+    if package_options.get('stream'):
+        return stream_package_fn(config['s3_bucket'], config['s3_key'],
+                                 config['package'], config['script'],
+                                 package_options.get('jobs', 1), transfer_config)
+    return upload_package_fn(config['s3_bucket'], config['s3_key'],
+                             config['package'], transfer_config)
+
+
+@Timings.timed('terraform')
+def _terraform_apply(targets=None, parallelism=None):
+    """
+    Runs terraform init and apply, limited to the targets if any are given.
+
+    Args:
+        targets: terraform addresses such as aws_lambda_function.name or
+            module.name, all of them are applied in a single run
+        parallelism: number of resources terraform changes at the same time
+    """
+    logger.debug('Targets: {}'.format(targets))
+    apply_cmd = ['terraform', 'apply', '-auto-approve']
+    for target in targets or []:
+        apply_cmd.append('-target={}'.format(_terraform_address(target)))
+    if parallelism is not None:
+        apply_cmd.append('-parallelism={}'.format(parallelism))
+    for var_file in TerraformEvaluator.var_files:
+        apply_cmd.append('-var-file={}'.format(os.path.abspath(var_file)))
+    terraform_commands = [
+        ['terraform', 'init'],
+        apply_cmd
+    ]
     for cmd in terraform_commands:
         return_code, out, err = Shell.run(cmd, os.getcwd())
         if return_code == 0:
-            click.secho('{} ran successfully.'.format(cmd), fg='green')
+            click.secho('{} ran successfully.'.format(' '.join(cmd)), fg='green')
             logger.debug(out)
         else:
-            click.secho('{} failed.'.format(cmd), fg='red')
+            click.secho('{} failed.'.format(' '.join(cmd)), fg='red')
             logger.debug(err)
             sys.exit(1)
+
+
+def _terraform_address(target):
+    # Addresses used to be documented with a resource. prefix terraform
+    # doesn't accept
+    if target.startswith('resource.'):
+        return target[len('resource.'):]
+    return target
+
+
+def _terraform_targets(tf_file, names):
+    """
+    Returns:
+        The terraform address of each Lambda resource or module in names,
+        in the order of the terraform file.
+    """
+    return [address for name, address in _terraform_addresses(tf_file).items()
+            if name in names]
+
+
+def _terraform_addresses(tf_file):
+    """
+    Returns:
+        A dictionary of the terraform address of each Lambda resource or
+        module by name, in the order of the terraform file. Functions in
+        nested modules get the full module path.
+    """
+    index = ProjectIndex.for_terraform(ConfigLoader.load_terraform(tf_file))
+    return {name: entry['address'] for name, entry in index.entries.items()}
@@ -3,7 +3,7 @@ import logging
 import os
 import sys
 
-from maniplecli.util.config_loader import ConfigLoader
+from maniplecli.util.config_loader import ConfigError, ConfigLoader
 from maniplecli.util.shell import Shell
 
 logger = logging.getLogger(__name__)
@@ -34,8 +34,8 @@ def cli(watch, error_logs, lambda_name):
 
 def run_cli(watch, error_logs, lambda_name):
     if lambda_name is None:
-        config = ConfigLoader.add_defaults(ConfigLoader.load_config())
-        lambda_name = config['name']
+        config = ConfigLoader.load_config()
+        lambda_name = config['name'] or _only_function(config['tf_file'])
     if watch:
         _watch(lambda_name)
     if error_logs:
@@ -43,6 +43,25 @@ def run_cli(watch, error_logs, lambda_name):
     sys.exit(0)
 
 
+def _only_function(tf_file):
+    """
+    Returns the name of the only function in the terraform project, there
+    is no prompt so logs can be watched unattended.
+    """
+    try:
+        results = ConfigLoader.resolve_all(tf_file)
+    except ConfigError as e:
+        click.secho(str(e), fg='red')
+        sys.exit(1)
+    # Logs only need the name, a function with an incomplete config is fine
+    names = [result['name'] for result in results]
+    if len(names) != 1:
+        click.secho('Set the function with -l, one of: {}'.format(
+            ', '.join(names)), fg='red')
+        sys.exit(1)
+    return names[0]
+
+
 def _watch(lambda_name):
     cmd = ['sam', 'logs', '-n', lambda_name, '--tail']
     return_code, out, err = Shell.run(cmd, os.getcwd())
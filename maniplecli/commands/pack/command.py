@@ -1,21 +1,52 @@
-import boto3
+import base64
 import click
+import fnmatch
+import hashlib
+import json
 import logging
 import os
 import shutil
 import sys
-import zipfile
+import time
 
+from botocore.exceptions import BotoCoreError, ClientError
 from maniplecli.util.lambda_packages import lambda_packages
 
+from maniplecli.util.aws_clients import AwsClients
 from maniplecli.util.config_loader import ConfigLoader
+from maniplecli.util.file_index import FileIndex
+from maniplecli.util.package_analyzer import PackageAnalyzer, MB, ZIPPED_LIMIT
+from maniplecli.util.package_builder import PackageBuilder
 from maniplecli.util.package_downloader import PackageDownloader
+from maniplecli.util.package_slimmer import PackageSlimmer
+from maniplecli.util.rate_limiter import RateLimiter
+from maniplecli.util.s3_uploader import S3Uploader, MIN_CHUNK_SIZE_MB
+from maniplecli.util.timings import Timings
+from maniplecli.util.update_waiter import UpdateWaiter, TIMEOUT as UPDATE_TIMEOUT
 from pathlib import Path
-from zipfile import ZipFile
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+DIGEST_METADATA_KEY = 'maniple-digest'
+LAYER_DESCRIPTION_PREFIX = 'maniple:'
+# Lambda throttles control plane calls, deploys of many functions at once
+# share this limit
+LAMBDA_CALLS_PER_SECOND = 10
+LAMBDA_RATE_LIMITER = RateLimiter(LAMBDA_CALLS_PER_SECOND)
+AwsClients.register('lambda', 'before-call.lambda',
+                    LAMBDA_RATE_LIMITER.botocore_hook, 'maniple-rate-limit')
+# Packages up to this size can be sent with the update_function_code call
+# instead of going through s3 in the direct upload mode
+DIRECT_UPLOAD_LIMIT = ZIPPED_LIMIT
+UPLOAD_MODES = ['s3', 'direct']
+# Files that aren't packaged when the script directory is the project root:
+# terraform files and state, requirements and what maniple writes next to a
+# package. Hidden directories and installed libraries are skipped too.
+SCRIPT_EXCLUDES = ['.*', '*.tf', '*.tf.json', '*.tfvars', '*.tfvars.json',
+                   '*.tfstate', '*.tfstate.backup', 'requirements.txt',
+                   '*.manifest.json', '*.upload.json']
+
 HELP_TEXT = """
 Use this command to zip site-packages, update deployment packages with new code, create deployment packages, send to s3\n
 
@@ -35,6 +66,36 @@ $ maniple pack -c -up -uf \n
 Update the python script in your deployment function, upload it, update the function, and invoke it.
 $ maniple pack -us -up -uf -i\n
 \b
+Create a deployment package using 8 cores to compress the files.
+$ maniple pack -c -j 8 \n
+\b
+Upload a package in 16 MB parts, 4 parts at a time.
+$ maniple pack -up --chunk-size 16 --upload-concurrency 4 \n
+\b
+Zip the package while it uploads, without writing the zip to disk.
+$ maniple pack -c -up --stream \n
+\b
+Send packages under 50 MB straight to the function instead of uploading them to s3.
+The s3 object terraform deploys from is left as it was.
+$ maniple pack -c -uf --upload-mode direct \n
+\b
+Show what takes up space in the package and how close it is to the Lambda limits.
+$ maniple pack --analyze \n
+\b
+Print the analysis as JSON and fail if the zipped package is over 20 MB.
+$ maniple pack --analyze --json --budget 20 \n
+\b
+Show how long config, pip, zipping, the upload and the update took.
+$ maniple pack -c -up -uf --timings \n
+\b
+Put the dependencies in a Lambda layer so the function package only holds the script.
+The layer is published when its content changes.
+$ maniple pack -c -up -uf --layer \n
+\b
+Remove bytecode caches and install records from the libraries and strip their shared objects.
+Test packages and other files can be excluded with --exclude.
+$ maniple pack -c --slim --exclude "*.md" --exclude tests \n
+\b
 Upload a zipped deployment package with only the python script included. Set the requirements parameter
 to None and then use --update-script and --upload-package
 $ maniple config -r None
@@ -68,40 +129,148 @@ def list_libraries(ctx, param, value):
 @click.option('-libs', '--libraries',
               help='List libraries that can be replaced.', is_flag=True,
               is_eager=True, callback=list_libraries, default=False)
+@click.option('-j', '--jobs',
+              help='Number of files compressed in parallel.',
+              type=int, default=1)
+@click.option('--chunk-size',
+              help='Size in MB of each part of a multipart upload, at least {}.'.format(
+                  MIN_CHUNK_SIZE_MB),
+              type=click.FloatRange(min=MIN_CHUNK_SIZE_MB), default=None)
+@click.option('--upload-concurrency',
+              help='Number of parts uploaded at the same time.',
+              type=int, default=None)
+@click.option('--layer',
+              help='Package the dependencies in a Lambda layer.',
+              is_flag=True, default=False)
+@click.option('--slim',
+              help='Remove files not needed at runtime from the libraries.',
+              is_flag=True, default=False)
+@click.option('--exclude',
+              help='Pattern of library files to remove, implies --slim.',
+              multiple=True)
+@click.option('--stream',
+              help='Zip the package while uploading it instead of writing it to disk.',
+              is_flag=True, default=False)
+@click.option('--analyze',
+              help='Report the size of the package against the Lambda limits.',
+              is_flag=True, default=False)
+@click.option('--json', 'json_output',
+              help='Print the analysis as JSON.', is_flag=True, default=False)
+@click.option('--budget',
+              help='Fail the analysis if the zipped package is over this many MB.',
+              type=float, default=None)
+@click.option('--upload-mode',
+              help='How the code reaches the function with -uf: direct sends '
+                   'packages under 50 MB with the update call and skips the s3 '
+                   'upload (Default=s3).',
+              type=click.Choice(UPLOAD_MODES), default='s3')
+@click.option('--timings',
+              help='Print the time spent in each stage.',
+              is_flag=True, default=False)
+@click.option('--timings-json',
+              help='Write the stage timings to this JSON file.',
+              type=click.Path(dir_okay=False), default=None)
 def cli(create_package, invoke, update_script, update_function, libraries,
-        upload_package):
+        upload_package, jobs, chunk_size, upload_concurrency, layer, slim,
+        exclude, stream, analyze, json_output, budget, upload_mode, timings,
+        timings_json):
     run_cli(create_package, invoke, update_script, update_function, libraries,
-            upload_package)
+            upload_package, jobs, chunk_size, upload_concurrency, layer,
+            slim, exclude, stream, analyze, json_output, budget, upload_mode,
+            timings, timings_json)
 
 
 def run_cli(create_package, invoke, update_script, update_function, libraries,
-            upload_package):
-    config = ConfigLoader.add_defaults(ConfigLoader.load_config())
-
-    if update_script:
-        update_script_fn(config['package'], config['script'])
-    if create_package:
-        create_package_fn(config['script'],
-                          config['requirements'],
-                          config['package'])
-    if upload_package:
+            upload_package, jobs=1, chunk_size=None, upload_concurrency=None,
+            layer=False, slim=False, exclude=(), stream=False, analyze=False,
+            json_output=False, budget=None, upload_mode='s3', timings=False,
+            timings_json=None):
+    if stream and not upload_package:
+        click.secho('--stream only works with --upload-package.', fg='red')
+        sys.exit(1)
+    if timings or timings_json:
+        Timings.enable()
+    try:
+        config = ConfigLoader.add_defaults(ConfigLoader.load_config())
+        transfer_config = S3Uploader.transfer_config(chunk_size, upload_concurrency)
+        AwsClients.configure(transfer_config.max_concurrency)
+
+        # When streaming the script is read straight from its location
+        if update_script and not stream:
+            update_script_fn(config['package'], config['script'], jobs)
+        if create_package:
+            create_package_fn(config['script'],
+                              config['requirements'],
+                              config['package'],
+                              jobs,
+                              layer,
+                              slim or bool(exclude),
+                              exclude,
+                              stream)
+        if analyze:
+            analyze_package_fn(config['package'], layer, json_output, budget)
+        if layer and update_function:
+            click.echo('Publishing layer...')
+            publish_layer_fn(config['name'],
+                             config['s3_bucket'],
+                             config['s3_key'],
+                             config['package'],
+                             transfer_config,
+                             tf_file=config['tf_file'])
+        # -up always uploads to s3, the direct mode only replaces it when
+        # the package isn't uploaded
+        if update_function and upload_mode == 'direct' and not upload_package:
+            click.echo('Deploying function code...')
+            deploy_code_fn(config['name'],
+                           config['s3_bucket'],
+                           config['s3_key'],
+                           config['package'],
+                           transfer_config,
+                           upload_mode)
+        else:
+            _upload_and_update(config, upload_package, update_function, jobs,
+                               stream, transfer_config)
+        if invoke:
+            click.echo('Invoking lambda...')
+            _invoke(config['name'])
+    finally:
+        # Also reported when a step fails
+        if timings or timings_json:
+            Timings.finish(timings, timings_json)
+
+    sys.exit(0)
+
+
+def _upload_and_update(config, upload_package, update_function, jobs=1,
+                       stream=False, transfer_config=None):
+    if upload_package and stream:
+        click.echo('Streaming package to s3 bucket...')
+        stream_package_fn(config['s3_bucket'],
+                          config['s3_key'],
+                          config['package'],
+                          config['script'],
+                          jobs,
+                          transfer_config)
+    elif upload_package:
         click.echo('Uploading file to s3 bucket...')
         upload_package_fn(config['s3_bucket'],
                           config['s3_key'],
-                          config['package'])
-    if update_function:
+                          config['package'],
+                          transfer_config)
+    # A streamed package isn't on disk to compare with the function's code
+    if update_function and not stream and _function_code_unchanged(
+            config['name'], _zip_path(config['package'])):
+        click.secho('Function code unchanged, skipping update.', fg='green')
+    elif update_function:
         click.echo('Updating function on AWS...')
-        click.echo(update_function_fn(config['name'],
-                                      config['s3_bucket'],
-                                      config['s3_key']))
-    if invoke:
-        click.echo('Invoking lambda...')
-        _invoke(config['name'])
+        update_function_fn(config['name'],
+                           config['s3_bucket'],
+                           config['s3_key'])
 
-    sys.exit(0)
 
-
-def create_package_fn(script, requirements, package):
+def create_package_fn(script, requirements, package, jobs=1, layer=False,
+                      slim=False, excludes=(), stream=False, runtime=None,
+                      dependencies=None):
     """
     Creates a zipped package with all libraries and scripts necesary to run
     the function on AWS.
@@ -110,54 +279,489 @@ def create_package_fn(script, requirements, package):
         script: file or dir that holds the main script/s of the function
         requirements: location of the requirements file
         package: file location of where the deployment package 
+        jobs: number of files compressed in parallel
+        layer: install the libraries in a layer package next to the
+            deployment package, which then only holds the script
+        slim: remove files not needed at runtime from the libraries
+        excludes: extra patterns of library files to remove when slimming
+        stream: only install the libraries, the package is zipped while it
+            is streamed to s3 by stream_package_fn
+        runtime: runtime of the function, read from the terraform file of
+            the configured function if None
+        dependencies: directory with the libraries already installed by
+            install_dependencies_fn, they are linked into the package
+            instead of being installed again
     """
-    try:
-        logger.debug('Attempting to make package dir at {}'.format(package))
-        os.makedirs(package)
-        logger.debug('Made package dir at {}'.format(package))
-    except FileExistsError:
-        shutil.rmtree(package)
-        os.makedirs(package)
-        logger.debug('Deleted previous dir and made a new one'.format(package))
+    _make_empty_dir(package)
+
+    if layer:
+        create_layer_fn(script, requirements, package, jobs, slim, excludes,
+                        runtime, dependencies)
+    elif dependencies is not None:
+        _link_tree(dependencies, package)
+    else:
+        install_dependencies_fn(script, requirements, package, runtime, jobs,
+                                slim, excludes)
+
+    if not stream:
+        _zip_files(package, script, jobs)
+    click.secho('Package created.', fg='green')
 
-    PackageDownloader.download_packages(script, requirements, package)
 
-    _zip_files()
-    click.secho('Package created.', fg='green')
+def install_dependencies_fn(script, requirements, directory, runtime=None,
+                            jobs=1, slim=False, excludes=()):
+    """
+    Installs the libraries of a function into directory.
+
+    Args:
+        script: file or dir that holds the main script/s of the function
+        requirements: location of the requirements file
+        directory: directory to install the libraries in
+        runtime: runtime of the function, read from the terraform file of
+            the configured function if None
+        jobs: number of shared objects stripped in parallel
+        slim: remove files not needed at runtime from the libraries
+        excludes: extra patterns of library files to remove when slimming
+    """
+    PackageDownloader.download_packages(script, requirements, directory,
+                                        runtime)
+    if slim:
+        _slim(directory, excludes, jobs)
+
+
+def analyze_package_fn(package, layer=False, json_output=False, budget=None):
+    """
+    Reports the zipped and unzipped size of the deployment package and exits
+    with an error if it's over the unzipped Lambda limit or the budget.
+
+    Args:
+        package: file location of where the deployment package
+        layer: include the layer of the package in the unzipped size
+        json_output: print the report as JSON
+        budget: maximum zipped size of the package in MB
+    """
+    zip_path = _zip_path(package)
+    layer_zip_path = _zip_path(layer_dir(package)) if layer else None
+    for path in [zip_path, layer_zip_path]:
+        if path is not None and not os.path.exists(path):
+            click.secho('{} not found, create it with --create-package.'.format(
+                path), fg='red')
+            sys.exit(1)
+
+    report = PackageAnalyzer.analyze(zip_path, layer_zip_path)
+    errors = PackageAnalyzer.over_limits(
+        report, budget * MB if budget is not None else None)
+    if json_output:
+        report['errors'] = errors
+        click.echo(json.dumps(report, indent=2))
+    else:
+        PackageAnalyzer.print_report(report)
+        for error in errors:
+            click.secho(error, fg='red')
+    if errors:
+        sys.exit(1)
+
+
+def create_layer_fn(script, requirements, package, jobs=1, slim=False,
+                    excludes=(), runtime=None, dependencies=None):
+    """
+    Creates a zipped Lambda layer with the libraries of the function. Python
+    libraries are installed under python/ and node modules under
+    nodejs/node_modules, where the runtime looks for them.
+
+    Args:
+        script: file or dir that holds the main script/s of the function
+        requirements: location of the requirements file
+        package: file location of where the deployment package
+        jobs: number of files compressed in parallel
+        slim: remove files not needed at runtime from the libraries
+        excludes: extra patterns of library files to remove when slimming
+        runtime: runtime of the function, read from the terraform file of
+            the configured function if None
+        dependencies: directory with the libraries already installed by
+            install_dependencies_fn
+    """
+    layer = layer_dir(package)
+    if runtime is None:
+        runtime = ConfigLoader.get_runtime()
+    target = os.path.join(layer, 'nodejs' if 'nodejs' in runtime else 'python')
+    _make_empty_dir(layer)
+
+    if dependencies is not None:
+        _link_tree(dependencies, target)
+    else:
+        os.makedirs(target)
+        install_dependencies_fn(script, requirements, target, runtime, jobs,
+                                slim, excludes)
+
+    with Timings.stage('zip'):
+        stats = PackageBuilder.build(_list_files(layer), _zip_path(layer), jobs)
+        Timings.add_bytes(os.path.getsize(_zip_path(layer)))
+    logger.debug('Reused {} and compressed {} layer files.'.format(
+        stats['reused'], stats['compressed']))
+    click.secho('Layer created.', fg='green')
+
+
+def package_digest(package, script, stream=False):
+    """
+    Returns the content digest of the deployment package. Streamed packages
+    aren't written to disk so their digest is computed from their files.
+    """
+    zip_path = _zip_path(package)
+    if stream:
+        return PackageBuilder.scan(_package_files(package, script), zip_path)
+    return PackageBuilder.load_digest(zip_path)
+
+
+def _slim(package, excludes, jobs):
+    click.echo('Slimming libraries...')
+    report = PackageSlimmer.slim(package, excludes, jobs)
+    PackageSlimmer.print_report(report)
+
+
+def _zip_path(package):
+    """
+    Returns the path of the zip of a deployment package or layer directory,
+    next to the directory.
+    """
+    return '{}.zip'.format(package)
 
 
-def update_script_fn(package, script):
+def layer_dir(package):
+    """
+    Returns the directory the layer of a deployment package is built in.
+    """
+    return '{}-layer'.format(package)
+
+
+def update_script_fn(package, script, jobs=1):
     """
     Updates only the user created code of a function
 
     Args:
         script: file or dir that holds the main script/s of the function
         package: file location of where the deployment package 
+        jobs: number of files compressed in parallel
     """    
-    _zip_files()
+    _zip_files(package, script, jobs)
     click.secho('Script updated.', fg='green')
 
 
-def upload_package_fn(s3_bucket, s3_key, package):
+@Timings.timed('s3 upload')
+def upload_package_fn(s3_bucket, s3_key, package, transfer_config=None):
     """
-    Creates a zipped package with all libraries and scripts necesary to run
-    the function on AWS.
+    Uploads the deployment package to s3. The upload is skipped if the
+    object at s3_bucket/s3_key was uploaded from a package with the same
+    content digest.
 
     Args:
-        script: file or dir that holds the main script/s of the function
-        requirements: location of the requirements file
+        s3_bucket: s3_bucket to upload the deployment package to
+        s3_key: s3_key of the deployment package
         package: file location of where the deployment package 
+        transfer_config: TransferConfig with the multipart chunk size and
+            concurrency
+
+    Returns:
+        True if the package was uploaded, False otherwise.
     """
+    zip_path = _zip_path(package)
+    digest = PackageBuilder.load_digest(zip_path)
     try:
-        s3 = boto3.resource('s3')
-        s3.Bucket(s3_bucket).upload_file(
-            os.path.join(package, '{}.zip'.format(package)),
-            s3_key)
-        click.secho('Upload successful.', fg='green')
-    except Exception as e:
+        s3 = AwsClients.client('s3')
+        if digest is not None and _remote_digest(s3, s3_bucket, s3_key) == digest:
+            click.secho('Package unchanged, skipping upload.', fg='green')
+            return False
+        metadata = {DIGEST_METADATA_KEY: digest} if digest is not None else None
+        stats = S3Uploader.upload(s3, zip_path, s3_bucket, s3_key,
+                                  transfer_config, metadata)
+    except (BotoCoreError, ClientError, IOError) as e:
         click.secho('Upload failed: {}'.format(e), fg='red')
+        if os.path.exists(S3Uploader.state_path(zip_path)):
+            click.echo('Upload again to resume from the parts already sent.')
+        sys.exit(1)
+    Timings.add_bytes(stats['bytes'])
+    click.secho('Upload successful: {:.1f} MB in {:.1f}s ({:.1f} MB/s).'.format(
+        stats['bytes'] / 1024 / 1024, stats['seconds'], stats['mbps']),
+        fg='green')
+    return True
+
+
+@Timings.timed('s3 upload')
+def stream_package_fn(s3_bucket, s3_key, package, script, jobs=1,
+                      transfer_config=None):
+    """
+    Zips the deployment package straight into a multipart upload, parts are
+    sent while the next ones are compressed and no zip is written to disk.
+    Like upload_package_fn the upload is skipped if the uploaded package has
+    the same content digest.
+
+    Args:
+        s3_bucket: s3_bucket to upload the deployment package to
+        s3_key: s3_key of the deployment package
+        package: file location of where the deployment package
+        script: file or dir that holds the main script/s of the function
+        jobs: number of files compressed in parallel
+        transfer_config: TransferConfig with the part size and concurrency
+
+    Returns:
+        True if the package was uploaded, False otherwise.
+    """
+    files = _package_files(package, script)
+    zip_path = _zip_path(package)
+    digest = PackageBuilder.scan(files, zip_path, jobs)
+    try:
+        s3 = AwsClients.client('s3')
+        if _remote_digest(s3, s3_bucket, s3_key) == digest:
+            click.secho('Package unchanged, skipping upload.', fg='green')
+            return False
+        stats = S3Uploader.stream(
+            s3, lambda writer: PackageBuilder.build(files, zip_path, jobs, writer),
+            s3_bucket, s3_key, transfer_config, {DIGEST_METADATA_KEY: digest})
+    except (BotoCoreError, ClientError, IOError) as e:
+        click.secho('Upload failed: {}'.format(e), fg='red')
+        sys.exit(1)
+    Timings.add_bytes(stats['bytes'])
+    click.secho('Upload successful: {:.1f} MB in {} parts and {:.1f}s ({:.1f} MB/s).'.format(
+        stats['bytes'] / 1024 / 1024, stats['parts'], stats['seconds'],
+        stats['mbps']), fg='green')
+    return True
+
 
+@Timings.timed('layer publish')
+def publish_layer_fn(function_name, s3_bucket, s3_key, package,
+                     transfer_config=None, runtime=None, tf_file=None):
+    """
+    Publishes the layer built by create_layer_fn and attaches it to the
+    function. A new layer version is only published when the content digest
+    of the layer differs from the one stored in the description of the
+    latest version. terraform apply detaches layers its resource doesn't
+    list, a warning with the layer's ARN is printed when it lists none.
+
+    Args:
+        function_name: name of the function
+        s3_bucket: s3_bucket to upload the layer to
+        s3_key: s3_key of the deployment package, the layer is uploaded next
+            to it
+        package: file location of where the deployment package
+        transfer_config: TransferConfig with the multipart chunk size and
+            concurrency
+        runtime: runtime of the function, read from the terraform file of
+            the configured function if None
+        tf_file: terraform file of the function, the configured one if None
+
+    Returns:
+        The ARN of the layer version attached to the function.
+    """
+    layer = layer_dir(package)
+    digest = PackageBuilder.load_digest(_zip_path(layer))
+    if digest is None:
+        click.secho('No layer found, create it with --create-package --layer.',
+                    fg='red')
+        sys.exit(1)
+
+    layer_name = '{}-dependencies'.format(function_name)
+    description = LAYER_DESCRIPTION_PREFIX + digest
+    client = AwsClients.client('lambda')
+    try:
+        versions = client.list_layer_versions(
+            LayerName=layer_name, MaxItems=1)['LayerVersions']
+        if versions and versions[0].get('Description') == description:
+            arn = versions[0]['LayerVersionArn']
+            click.secho('Layer unchanged, skipping publish.', fg='green')
+        else:
+            layer_key = '{}-layer.zip'.format(os.path.splitext(s3_key)[0])
+            upload_package_fn(s3_bucket, layer_key, layer, transfer_config)
+            response = client.publish_layer_version(
+                LayerName=layer_name,
+                Description=description,
+                Content={'S3Bucket': s3_bucket, 'S3Key': layer_key},
+                CompatibleRuntimes=[runtime or ConfigLoader.get_runtime()])
+            arn = response['LayerVersionArn']
+            click.secho('Published {} version {}.'.format(
+                layer_name, response['Version']), fg='green')
+        _attach_layer(client, function_name, arn)
+    except ClientError as e:
+        click.secho('Publish layer failed: {}'.format(e), fg='red')
+        sys.exit(1)
+    if not _terraform_layers(function_name, tf_file):
+        click.secho('The terraform resource of {} has no layers, the next terraform '
+                    'apply detaches {}. Add the layer to its layers, e.g. from an '
+                    'aws_lambda_layer_version data source of {}.'.format(
+                        function_name, arn, layer_name), fg='yellow')
+    return arn
+
+
+def _terraform_layers(function_name, tf_file=None):
+    """
+    Returns the layers attribute of the function's terraform resource,
+    None if it has none.
+    """
+    if tf_file is None:
+        tf_file = ConfigLoader.load_config()['tf_file']
+    tf = ConfigLoader.load_terraform(tf_file)
+    return ConfigLoader.load_lambda_resource(function_name, tf).get('layers')
 
+
+def _attach_layer(client, function_name, arn):
+    """
+    Points the function at the layer version, replacing older versions of
+    the same layer and keeping any other layers it uses.
+    """
+    response = client.get_function_configuration(FunctionName=function_name)
+    current = [layer['Arn'] for layer in response.get('Layers', [])]
+    if arn in current:
+        logger.debug('{} already uses {}'.format(function_name, arn))
+        return
+    layer_arn = arn.rsplit(':', 1)[0]
+    layers = [a for a in current if a.rsplit(':', 1)[0] != layer_arn] + [arn]
+    UpdateWaiter.record_update(function_name)
+    client.update_function_configuration(FunctionName=function_name,
+                                         Layers=layers)
+    _wait_for_update(client, function_name)
+    click.secho('{} now uses {}'.format(function_name, arn), fg='green')
+
+
+def _wait_for_update(client, function_name, timeout=60):
+    """
+    Waits for a configuration update to finish, Lambda rejects code updates
+    while one is in progress.
+    """
+    result = UpdateWaiter.wait(
+        client, [function_name], timeout,
+        updated_at=UpdateWaiter.update_times([function_name]))[function_name]
+    if result['status'] != 'Successful':
+        logger.debug('{} update {}: {}'.format(
+            function_name, result['status'], result['reason']))
+
+
+@Timings.timed('wait')
+def wait_for_updates_fn(function_names, timeout=UPDATE_TIMEOUT):
+    """
+    Waits until the updates of all the functions have settled and prints
+    how long each took to become active, counted from its update call.
+
+    Args:
+        function_names: names of the updated functions
+        timeout: seconds to wait for each function
+
+    Returns:
+        A dictionary by function name of the status, seconds and reason
+        returned by UpdateWaiter.wait.
+    """
+    if not function_names:
+        return {}
+    click.echo('Waiting for {} function update(s) to finish...'.format(
+        len(function_names)))
+    results = UpdateWaiter.wait(AwsClients.client('lambda'), function_names, timeout,
+                                updated_at=UpdateWaiter.update_times(function_names))
+    UpdateWaiter.print_report(results)
+    return results
+
+
+def _remote_digest(s3, s3_bucket, s3_key):
+    """
+    Returns the content digest stored in the metadata of the uploaded
+    package or None if there is no package.
+    """
+    try:
+        response = s3.head_object(Bucket=s3_bucket, Key=s3_key)
+    except ClientError as e:
+        logger.debug('head_object {}/{}: {}'.format(s3_bucket, s3_key, e))
+        return None
+    return response.get('Metadata', {}).get(DIGEST_METADATA_KEY)
+
+
+def _function_code_unchanged(function_name, zip_path):
+    """
+    Returns True if the function already runs the code of the zip. An
+    unchanged s3 object doesn't mean that: an earlier update may have failed
+    or the function may have been updated directly since.
+    """
+    with open(zip_path, 'rb') as f:
+        code_sha256 = _code_sha256(f.read())
+    client = AwsClients.client('lambda')
+    try:
+        current = client.get_function_configuration(FunctionName=function_name)
+    except ClientError as e:
+        logger.debug('get_function_configuration {}: {}'.format(function_name, e))
+        return False
+    return current.get('CodeSha256') == code_sha256
+
+
+def _code_sha256(data):
+    """
+    Returns the sha256 of a zip the way Lambda reports it in CodeSha256.
+    """
+    return base64.b64encode(hashlib.sha256(data).digest()).decode('utf-8')
+
+
+def deploy_code_fn(function_name, s3_bucket, s3_key, package,
+                   transfer_config=None, upload_mode='s3'):
+    """
+    Gets the deployment package to the function. The package is uploaded
+    to s3 and the function updated from there, unless the direct mode is
+    asked for: packages up to DIRECT_UPLOAD_LIMIT are then sent with the
+    update_function_code call and the s3 object isn't updated, larger ones
+    still go through s3. Either way the update is skipped if the function
+    already runs the package's code.
+
+    Args:
+        function_name: name of the function
+        s3_bucket: s3_bucket to upload the deployment package to
+        s3_key: s3_key of the deployment package
+        package: file location of where the deployment package
+        transfer_config: TransferConfig with the multipart chunk size and
+            concurrency
+        upload_mode: s3 or direct
+
+    Returns:
+        True if the function was updated, False if its code was unchanged.
+    """
+    zip_path = _zip_path(package)
+    size = os.path.getsize(zip_path) if os.path.exists(zip_path) else None
+    if upload_mode == 'direct' and size is not None and size <= DIRECT_UPLOAD_LIMIT:
+        return _update_function_direct(function_name, zip_path)
+    if size is not None and upload_mode == 'direct':
+        click.echo('Package is over {:.0f} MB, deploying through s3.'.format(
+            DIRECT_UPLOAD_LIMIT / MB))
+    upload_package_fn(s3_bucket, s3_key, package, transfer_config)
+    if _function_code_unchanged(function_name, zip_path):
+        click.secho('Function code unchanged, skipping update.', fg='green')
+        return False
+    if not update_function_fn(function_name, s3_bucket, s3_key):
+        sys.exit(1)
+    return True
+
+
+@Timings.timed('lambda update')
+def _update_function_direct(function_name, zip_path):
+    """
+    Sends the zip with the update_function_code call. The update is skipped
+    if the function already runs code with the same sha256.
+    """
+    with open(zip_path, 'rb') as f:
+        data = f.read()
+    Timings.add_bytes(len(data))
+    client = AwsClients.client('lambda')
+    try:
+        current = client.get_function_configuration(FunctionName=function_name)
+        if current.get('CodeSha256') == _code_sha256(data):
+            click.secho('Function code unchanged, skipping update.', fg='green')
+            return False
+        start = time.time()
+        UpdateWaiter.record_update(function_name)
+        client.update_function_code(FunctionName=function_name, ZipFile=data)
+    except (BotoCoreError, ClientError) as e:
+        click.secho('Update function failed: {}'.format(e), fg='red')
+        sys.exit(1)
+    click.secho('{} updated directly with the {:.1f} MB package in {:.1f}s, '
+                'the s3 object was left as it was.'.format(
+                    function_name, len(data) / MB, time.time() - start),
+                fg='green')
+    return True
+
+
+@Timings.timed('lambda update')
 def update_function_fn(function_name, s3_bucket, s3_key):
     """
     Notifies AWS that the function code has been updated.
@@ -166,19 +770,26 @@ def update_function_fn(function_name, s3_bucket, s3_key):
         function_name: name of the function
         s3_bucket: s3_bucket that holds the deployment package
         s3_key: s3_key of the deployment package
+
+    Returns:
+        True if the function was updated, False otherwise.
     """
-    client = boto3.client('lambda')
+    client = AwsClients.client('lambda')
     try:
+        UpdateWaiter.record_update(function_name)
         response = client.update_function_code(FunctionName=function_name,
                                                S3Bucket=s3_bucket,
                                                S3Key=s3_key)
         if response['ResponseMetadata']['HTTPStatusCode'] != 200:
             click.secho('Update function failed: {}'.format(
                 response['ResponseMetadata']['HTTPStatusCode']), fg='red')
-        else:
-            click.secho('{} updated successfully'.format(function_name), fg='green')
-    except client.exceptions.ResourceNotFoundError as e:
-        click.secho(e, fg='red')
+            return False
+        click.secho('{} updated successfully from s3://{}/{}'.format(
+            function_name, s3_bucket, s3_key), fg='green')
+        return True
+    except client.exceptions.ResourceNotFoundException as e:
+        click.secho(str(e), fg='red')
+        return False
 
 
 def _invoke(lambda_name):
@@ -188,39 +799,121 @@ def _invoke(lambda_name):
     Args:
         lambda_name: name of the lambda function on AWS
     """
-    client = boto3.client('lambda')
+    client = AwsClients.client('lambda')
     try:
         response = client.invoke(FunctionName=lambda_name)
         click.echo('Function Response:')
         click.echo(response)
         click.echo('View more logs with: maniple sam -w')
-    except client.exceptions.ResourceNotFoundError as e:
-        click.secho(e, fg='red')
-
-
-def _zip_files():
-    """
-    Zip all necesary files for the deployment package.
-    """
-    config = ConfigLoader.load_config()
-
-    with ZipFile(os.path.join(config['package'], '{}.zip'.format(config['package'])), 'w',
-                 zipfile.ZIP_DEFLATED) as zip:
-        # Zip packages from requirements
-        for dirname, subdirs, files in os.walk(config['package']):
-            for filename in files:
-                abs_name = os.path.abspath(os.path.join(dirname, filename))
-                arc_name = abs_name[len(config['package']) + 1:]
-                logger.debug('Zipped {} : {}'.format(abs_name, arc_name))
-                zip.write(abs_name, arc_name)
-
-        script = Path(config['script'])
-        if script.is_dir():
-            for dirname, subdirs, files in os.walk(config['script']):
-                for filename in files:
-                    abs_name = os.path.abspath(os.path.join(dirname, filename))
-                    arc_name = abs_name[len(config['script']) + 1:]
-                    logger.debug('Zipped {} : {}'.format(abs_name, arc_name))
-                    zip.write(abs_name, arc_name)
-        else:
-            zip.write(config['script'], script.name)
+    except client.exceptions.ResourceNotFoundException as e:
+        click.secho(str(e), fg='red')
+
+
+@Timings.timed('zip')
+def _zip_files(package, script, jobs=1):
+    """
+    Zip all necesary files for the deployment package. Entries of files that
+    haven't changed since the last build are reused from the previous zip.
+
+    Args:
+        package: file location of where the deployment package
+        script: file or dir that holds the main script/s of the function
+        jobs: number of files compressed in parallel
+    """
+    stats = PackageBuilder.build(_package_files(package, script),
+                                 _zip_path(package), jobs)
+    Timings.add_bytes(os.path.getsize(_zip_path(package)))
+    logger.debug('Reused {} and compressed {} files.'.format(
+        stats['reused'], stats['compressed']))
+
+
+def _package_files(package, script):
+    """
+    Returns the (absolute path, archive name) tuples of the files of a
+    deployment package: the installed libraries and the script.
+    """
+    # Zip packages from requirements
+    return _list_files(package) + script_files(package, script)
+
+
+def script_files(package, script):
+    """
+    Returns the (absolute path, archive name) tuples of the script files
+    packaged in a deployment package.
+
+    Args:
+        package: file location of where the deployment package
+        script: file or dir that holds the main script/s of the function
+    """
+    script_path = Path(script)
+    if script_path.is_dir():
+        return _list_script_files(script, package)
+    return [(os.path.abspath(script), script_path.name)]
+
+
+def _list_files(directory):
+    """
+    Returns a list of (absolute path, archive name) tuples of the files in
+    directory, with archive names relative to it.
+    """
+    root = os.path.abspath(directory)
+    files = []
+    for dirname, subdirs, filenames in os.walk(root):
+        for filename in filenames:
+            abs_name = os.path.join(dirname, filename)
+            files.append((abs_name, abs_name[len(root) + 1:]))
+    return files
+
+
+def _list_script_files(script, package):
+    """
+    Returns the (absolute path, archive name) tuples of the files of a
+    script directory, without the package's own build output. A script
+    found for a handler with a path, such as src/app.handler, only packages
+    src and its files keep the src/ prefix. When the script directory is
+    the project root the files matching SCRIPT_EXCLUDES, hidden directories
+    and installed libraries aren't packaged either.
+    """
+    root, path = (os.path.abspath(p) for p in FileIndex.script_root(script))
+    project = path == os.getcwd()
+    build_dirs = {os.path.abspath(package), os.path.abspath(layer_dir(package))}
+    build_files = {os.path.abspath(_zip_path(directory)) for directory in build_dirs}
+    files = []
+    for dirname, subdirs, filenames in os.walk(path):
+        subdirs[:] = [subdir for subdir in subdirs
+                      if not (project and FileIndex.pruned(subdir))
+                      and os.path.join(dirname, subdir) not in build_dirs]
+        for filename in filenames:
+            abs_name = os.path.join(dirname, filename)
+            if abs_name in build_files or project and any(
+                    fnmatch.fnmatch(filename, pattern) for pattern in SCRIPT_EXCLUDES):
+                continue
+            files.append((abs_name, abs_name[len(root) + 1:]))
+    return files
+
+
+def _link_tree(src, dst):
+    """
+    Recreates the directory tree src at dst with hard links to its files,
+    copying them where links aren't possible (e.g. across file systems).
+    """
+    def link_or_copy(src_file, dst_file):
+        try:
+            os.link(src_file, dst_file)
+        except OSError:
+            shutil.copy2(src_file, dst_file)
+
+    if os.path.exists(dst):
+        shutil.rmtree(dst)
+    shutil.copytree(src, dst, symlinks=True, copy_function=link_or_copy)
+
+
+def _make_empty_dir(path):
+    try:
+        logger.debug('Attempting to make dir at {}'.format(path))
+        os.makedirs(path)
+        logger.debug('Made dir at {}'.format(path))
+    except FileExistsError:
+        shutil.rmtree(path)
+        os.makedirs(path)
+        logger.debug('Deleted previous dir at {} and made a new one'.format(path))
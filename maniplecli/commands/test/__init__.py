@@ -6,7 +6,7 @@ import platform
 
 from pathlib import Path
 
-from maniplecli.util.config_loader import ConfigLoader
+from maniplecli.util.config_loader import ConfigError, ConfigLoader
 from maniplecli.util.shell import Shell
 
 logger = logging.getLogger(__name__)
@@ -28,50 +28,87 @@ $ maniple test -f test_handler.py
 @click.option('-f', '--filename', help='Run a single test file.',
                  default=None)
 def cli(filename):
-    config = ConfigLoader.add_defaults(ConfigLoader.load_config())
-
-    if 'python' in ConfigLoader.get_runtime(config):
-        run_py_tests(config, filename)
-    elif 'nodejs' in ConfigLoader.get_runtime(config):
-        run_js_tests(config, filename)
+    config = ConfigLoader.load_config()
+    # Without a current function the tests of every function's runtime run
+    names = [config['name']] if config['name'] is not None else None
+    runtimes = get_runtimes(config['tf_file'], names)
+
+    # Each suite runs from its own directory, the project's cwd is kept
+    status = 0
+    if any('python' in runtime for runtime in runtimes):
+        status = max(status, run_py_tests(config, filename))
+    if any('nodejs' in runtime for runtime in runtimes):
+        status = max(status, run_js_tests(config, filename))
+    sys.exit(status)
+
+
+def get_runtimes(tf_file, names=None):
+    """
+    Resolves the runtimes of the functions without prompting, so tests can
+    run unattended. Functions whose config can't be resolved are reported.
+    """
+    try:
+        results = ConfigLoader.resolve_all(tf_file, names)
+    except ConfigError as e:
+        click.secho(str(e), fg='red')
+        sys.exit(1)
+    for result in results:
+        if result['error'] is not None:
+            click.secho('{}: {}'.format(result['name'], result['error']), fg='red')
+    runtimes = {result['runtime'] for result in results if result['error'] is None}
+    if not runtimes:
+        sys.exit(1)
+    return runtimes
 
 
 def run_py_tests(config, test_file):
+    """
+    Runs each python test file from its directory.
+
+    Returns:
+        0 if every test passed, 1 otherwise.
+    """
     if not Path('./tests').exists():
         click.echo('No \'tests\' or \'test\' folder exists.')
-        sys.exit(1)
+        return 1
 
     if test_file is not None:
         test_path = Path('./tests', test_file)
         if not test_path.exists():
             click.echo('No file found.')
-            sys.exit(1)
-        os.chdir(test_path.parent)
-        run_test('python -m unittest {}'.format(test_path.name), 'python')
-        sys.exit(0)
-
-    tests_to_run = get_test_files('./tests', [])
+            return 1
+        tests_to_run = [test_path]
+    else:
+        # The js tests of a mixed project are run by npm
+        tests_to_run = [t for t in get_test_files('./tests', []) if t.suffix == '.py']
+    status = 0
     for t in tests_to_run:
-        os.chdir(t.parent)
-        run_test('python -m unittest {}'.format(t.name), 'python')
-    
+        status = max(status, run_test('python -m unittest {}'.format(t.name),
+                                      'python', t.parent.resolve()))
+    return status
+
 
 def run_js_tests(config, test_file):
+    """
+    Runs npm test from the project directory.
+
+    Returns:
+        0 if the tests passed or were skipped, 1 otherwise.
+    """
     if not Path('./tests').exists():
         click.echo('No \'tests\' or \'test\' folder exists.')
-        sys.exit(1)        
+        return 1
 
     if test_file is not None:
         click.echo('Single file tests not supported for nodejs yet.')
         click.echo('Change package.json values to perform individual tests.')
-        sys.exit(0)
+        return 0
 
     # Windows requires .cmd to be added to the command to work
     if platform.system() == 'Windows':
-        run_test('npm.cmd test', 'nodejs')
-    else:
-        run_test(['npm', 'test'], 'nodejs')
-    
+        return run_test('npm.cmd test', 'nodejs', os.getcwd())
+    return run_test(['npm', 'test'], 'nodejs', os.getcwd())
+
 
 def get_test_files(dir_, test_list):
     for f in Path(dir_).iterdir():
@@ -83,8 +120,12 @@ def get_test_files(dir_, test_list):
     return test_list
 
 
-def run_test(cmd, runtime):
-    return_code, out, err = Shell.run(cmd, os.getcwd())
+def run_test(cmd, runtime, cwd):
+    """
+    Returns:
+        0 if the tests passed, 1 otherwise.
+    """
+    return_code, out, err = Shell.run(cmd, cwd)
     if return_code == 0:
         if runtime == 'nodejs':
             click.echo(out)
@@ -92,7 +133,7 @@ def run_test(cmd, runtime):
             click.echo(out)  # Prints vars from print() statements
             click.echo(err)  # Prints results of unit test
         logger.debug(out)
-    else:
-        click.secho('{} failed.'.format(cmd), fg='red')
-        logger.debug(err)
-        sys.exit(1)
+        return 0
+    click.secho('{} failed.'.format(cmd), fg='red')
+    logger.debug(err)
+    return 1
@@ -0,0 +1,92 @@
+import boto3
+import logging
+import threading
+
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# botocore's default pool size, raised to the number of requests a command
+# makes at the same time
+MAX_POOL_CONNECTIONS = 10
+CONNECT_TIMEOUT = 10
+# Direct code updates send up to 50 MB in one request
+READ_TIMEOUT = 120
+# Adaptive mode backs off on throttling errors across all the threads using
+# a client
+RETRIES = {'mode': 'adaptive', 'max_attempts': 10}
+
+_lock = threading.Lock()
+
+
+class AwsClients():
+    """
+    Process wide registry of boto3 clients. Every AWS call goes through it so
+    credentials are resolved once and each service keeps one pool of
+    connections shared by all threads. boto3 clients are thread safe, the
+    session isn't, so clients are created one at a time.
+    """
+
+    session = None
+    clients = {}
+    pool_size = MAX_POOL_CONNECTIONS
+    # Event handlers registered on every client of a service
+    handlers = {}
+
+    @staticmethod
+    def client(service):
+        with _lock:
+            client = AwsClients.clients.get(service)
+            if client is None:
+                if AwsClients.session is None:
+                    AwsClients.session = boto3.session.Session()
+                client = AwsClients.session.client(service,
+                                                   config=AwsClients.config())
+                for event, handler, unique_id in AwsClients.handlers.get(service, []):
+                    client.meta.events.register(event, handler, unique_id=unique_id)
+                AwsClients.clients[service] = client
+                logger.debug('Created {} client'.format(service))
+            return client
+
+    @staticmethod
+    def config():
+        return Config(max_pool_connections=AwsClients.pool_size,
+                      connect_timeout=CONNECT_TIMEOUT,
+                      read_timeout=READ_TIMEOUT,
+                      retries=RETRIES)
+
+    @staticmethod
+    def configure(concurrency):
+        """
+        Sizes the connection pools for concurrency requests at the same time.
+        Clients created with a smaller pool are replaced.
+        """
+        pool_size = max(MAX_POOL_CONNECTIONS, concurrency)
+        with _lock:
+            if pool_size != AwsClients.pool_size:
+                AwsClients.pool_size = pool_size
+                AwsClients.clients = {}
+
+    @staticmethod
+    def register(service, event, handler, unique_id):
+        """
+        Registers a botocore event handler on the client of the service,
+        including the clients created later.
+        """
+        with _lock:
+            AwsClients.handlers.setdefault(service, []).append(
+                (event, handler, unique_id))
+            if service in AwsClients.clients:
+                AwsClients.clients[service].meta.events.register(
+                    event, handler, unique_id=unique_id)
+
+    @staticmethod
+    def reset():
+        """
+        Drops the session and clients, the next call resolves credentials
+        again.
+        """
+        with _lock:
+            AwsClients.session = None
+            AwsClients.clients = {}
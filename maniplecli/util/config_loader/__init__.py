@@ -1,11 +1,14 @@
 import click
-import hcl
 import json
 import logging
 import os
 import sys
-import re
 
+from maniplecli.util.file_index import FileIndex
+from maniplecli.util.project_index import ProjectIndex
+from maniplecli.util.tf_directory import TerraformDirectory
+from maniplecli.util.tf_evaluator import TerraformEvaluator
+from maniplecli.util.timings import Timings
 from pathlib import Path
 from typing import Dict
 
@@ -20,12 +23,21 @@ logger.setLevel(logging.INFO)
 # TODO: complete refactor
 
 
+class ConfigError(Exception):
+    """
+    The config of a function can't be resolved from the terraform and
+    project files.
+    """
+    pass
+
+
 class ConfigLoader():
 
     @staticmethod
     def load_config():
         try:
-            with open(os.path.join(Path(__file__).parent, 'config.json'), 'r') as f:
+            with Timings.stage('config'), \
+                    open(os.path.join(Path(__file__).parent, 'config.json'), 'r') as f:
                 return json.load(f)
         except json.decoder.JSONDecodeError:
             click.echo('Config may be corrupted. Resetting...')
@@ -37,14 +49,20 @@ class ConfigLoader():
 
     @staticmethod
     def save_config(config):
-        with open(os.path.join(Path(__file__).parent, 'config.json'), 'w') as f:
+        with Timings.stage('config'), \
+                open(os.path.join(Path(__file__).parent, 'config.json'), 'w') as f:
             json.dump(config, f, indent=2, sort_keys=True)
 
     @staticmethod
     def load_terraform(tf_file):
+        """
+        Loads every terraform file of the directory of tf_file, or of tf_file
+        if it is a directory, as one dictionary.
+        """
         try:
-            with open(tf_file, 'r') as f:
-                return hcl.load(f)
+            if not os.path.exists(tf_file):
+                raise FileNotFoundError(tf_file)
+            return TerraformDirectory.load(TerraformDirectory.directory_of(tf_file))[0]
         except FileNotFoundError:
             click.secho('Main terraform file not found.', fg='red')
             sys.exit(1)
@@ -105,49 +123,116 @@ class ConfigLoader():
                             len(possible_names)
                         ))
 
-        tf_vars = ConfigLoader.load_lambda_resource(config['name'], tf)
-        logger.debug('add_defaults: Variables to load to config: {}'.format(tf_vars))
+        index = ConfigLoader._project_index(tf)
+        if index.get(config['name']) is None:
+            logger.error('add_defaults: User tried to -load from different config.')
+            click.echo('Config file doesn\'t match directory.')
+            click.confirm('Reset config and load?', abort=True)
+            return ConfigLoader.add_defaults(ConfigLoader.reset_config())
+        try:
+            config = ConfigLoader._resolve(config, tf, index)[0]
+        except ConfigError as e:
+            click.secho(str(e), fg='red')
+            sys.exit(1)
+        ConfigLoader.save_config(config)
+        logger.debug('add_defaults: Default config loaded as:\n{}'.format(config))
+        return config
+
+    @staticmethod
+    def resolve_all(tf_file='main.tf', names=None):
+        """
+        Resolves the config of every Lambda function of the terraform
+        project, or of the functions in names, in one pass over the parsed
+        terraform and project files. Nothing is prompted or saved as the
+        current config, a function that can't be resolved gets an error
+        instead of ending the command.
+
+        Args:
+            tf_file: main terraform file of the project
+            names: names of the functions to resolve, all of them by default
+
+        Returns:
+            A list of dictionaries with the name, config, runtime and
+            error of each function, error is None if its config was
+            resolved. Module sources that don't exist are listed as errors.
+
+        Raises:
+            ConfigError: if the terraform files can't be loaded
+        """
+        with Timings.stage('config'):
+            if not os.path.exists(tf_file):
+                raise ConfigError('Main terraform file not found.')
+            try:
+                tf = TerraformDirectory.load(TerraformDirectory.directory_of(tf_file))[0]
+            except (OSError, ValueError) as e:
+                raise ConfigError('Unable to load terraform files: {}'.format(e))
+            index = ProjectIndex.for_terraform(tf)
+
+            results = []
+            if names is None:
+                names = list(index.entries)
+                results = [_result(module_name, error='Module {} source doesn\'t exist'.format(
+                    module_name)) for module_name, path in index.missing]
+            for name in names:
+                config = ConfigLoader.reset_config()
+                config['name'] = name
+                config['tf_file'] = tf_file
+                try:
+                    config, runtime = ConfigLoader._resolve(config, tf, index)
+                except ConfigError as e:
+                    logger.debug('{}: {}'.format(name, e))
+                    results.append(_result(name, config, error=str(e)))
+                    continue
+                results.append(_result(name, config, runtime))
+        return results
+
+    @staticmethod
+    def _resolve(config, tf, index):
+        """
+        Fills in the config of the function named in config from its
+        terraform resource and the files of the project.
+
+        Returns:
+            The config and the runtime of the function.
+
+        Raises:
+            ConfigError: if the config can't be resolved
+        """
+        tf_vars = index.attributes(config['name'])
+        if tf_vars is None:
+            raise ConfigError('Unable to determine lambda resource {}'.format(
+                config['name']))
+        logger.debug('Variables to load to config: {}'.format(tf_vars))
         try:
             runtime = tf_vars['runtime']
-            handler = tf_vars['handler'].split('.')[0]
+            handler = tf_vars['handler']
         except KeyError as e:
-            click.echo('Terraform file missing required fields:\nruntime\nhandler')
             logger.error('{}: Terraform file missing either runtime or handler'.format(e))
-            sys.exit(1)
-        except TypeError as e:
-            logger.error('add_defaults: User tried to -load from different config. \n{}'.format(e))
-            click.echo('Config file doesn\'t match directory.')
-            user_input = click.confirm('Reset config and load?', abort=True)
-            return ConfigLoader.add_defaults(ConfigLoader.reset_config())
+            raise ConfigError('Terraform file missing required fields:\nruntime\nhandler')
 
         # Have to find the package if it doesn't exist
         package_dir = Path(os.path.join(
             Path(__file__).parent,
             '..', '..', 'deployment_packages', config['name']))
-        if package_dir.exists() is False:
-            os.makedirs(package_dir)
+        try:
+            os.makedirs(package_dir, exist_ok=True)
+        except OSError as e:
+            raise ConfigError('Unable to create package directory: {}'.format(e))
         config['package'] = package_dir.resolve().__str__()
         # Load files and directories
-        path = Path('.')
-        for x in path.iterdir():
-            if x.is_dir():
-                config = ConfigLoader.handle_load_dirs(config, handler, x)
-            else:
-                config = ConfigLoader.handle_load_files(config, runtime, handler, tf_vars, tf, x)
-        for key, value in config.items():
-            if value is None:
-                click.secho('Warning: config variable {} not set!'.format(key))
-                logger.debug('add_defaults failed to add {}: {}'.format(key, value))
-                sys.exit(1)
-        ConfigLoader.save_config(config)
-        logger.debug('add_defaults: Default config loaded as:\n{}'.format(config))
-        return config
+        config = ConfigLoader.handle_load_files(config, runtime, handler, tf_vars, tf)
+        missing = [key for key, value in config.items() if value is None]
+        if missing:
+            raise ConfigError('Warning: config variable {} not set!'.format(
+                ', '.join(missing)))
+        return config, runtime
 
     @staticmethod
     def get_possible_resources(tf: Dict) -> Dict[str, str]:
         """
         Gets all possible lambda resources from a main.tf file.
-        These could be resources or modules.
+        These could be resources or modules, including modules nested in
+        other modules.
 
         Args:
             tf: main.tf file loaded as a dictionary
@@ -155,44 +240,14 @@ class ConfigLoader():
         Returns:
             A dictionary with all lambda resources/modules
         """
-        fns = []
-        count = 1
-        try:
-            modules = tf['module']
-            for module_name, values in modules.items():
-                source = values['source']
-                if source[0] == '/':
-                    del source[0]
-                try:
-                    with open(os.path.join(os.getcwd(), source, 'main.tf'), 'r') as f:
-                        tf_module = hcl.load(f)
-                    try:
-                        if tf_module['resource']['aws_lambda_function'] is not None:
-                            fns.append((count, module_name, 'module'))
-                            count += 1
-                    except KeyError:
-                        continue  # No lambda resource
-                except FileNotFoundError:
-                    click.secho('Module {} source doesn\'t exist'.format(
-                        module_name), fg='red')
-                    sys.exit(1)
-        except KeyError:
-            pass
-        try:
-            for name, values in tf['resource']['aws_lambda_function'].items():
-                fns.append((count, name, 'resource'))
-                count += 1
-        except KeyError:
-            pass
-        return fns
+        index = ConfigLoader._project_index(tf)
+        return index.possible_resources()
 
     @staticmethod
     def load_lambda_resource(name, tf):
         """
-        Loads a specific TF aws_lambda_function
-
-        TODO: remove in and add regex
-        Handle TF vars
+        Loads a specific TF aws_lambda_function, the variables of a module's
+        function are replaced with the values the module is given.
 
         Args:
             name: name of lambda function
@@ -201,105 +256,29 @@ class ConfigLoader():
         Returns:
             A dictionary of all values related to the specific function.
         """
-        try:
-            lambda_resource = tf['resource']['aws_lambda_function'][name]
-            return lambda_resource
-        except KeyError:  # Module
-            module_resource = None
-            found_source = False
-            module_key = ''
-            tf_vars = {}
-            try:
-                for mod in tf['module']:
-                    for key, val in tf['module'][mod].items():
-                        if name == val:
-                            found_source = True
-                            module_key = key
-                    if found_source:
-                        module_resource = ConfigLoader._find_resource_from_var(
-                            name,
-                            tf['module'][mod]['source'],
-                            module_key
-                        )
-                        source_vars = tf['module'][mod]
-                        break
-            except KeyError:
-                logger.debug('load_lambda_resource: no module in main')                   
-
-            if module_resource is None:
-                click.secho('Unable to determine lambda resource in module',
-                            fg='red')
-                sys.exit(1)
-
-            ConfigLoader.replace_module_vars(
-                source_vars,
-                module_resource
-            )
-
-            return module_resource
+        lambda_resource = ConfigLoader._project_index(tf).attributes(name)
+        if lambda_resource is None:
+            click.secho('Unable to determine lambda resource in module',
+                        fg='red')
+            sys.exit(1)
+        return lambda_resource
 
     @staticmethod
-    def _load_module_source(name, source):
-        """
-        Loads a specific TF module from the source aws_lambda_function
-
-        Args:
-            name: name of lambda function
-            source: source main.tf values as a dictionary
-
-        Returns:
-            A dictionary of all values related to the specific module.
-        """
-        try:
-            with open(os.path.join(os.getcwd(), source, 'main.tf')) as f:
-                tf_module = hcl.load(f)
-            try:
-                # Each variable needs to fit the lambda module
-                return tf_module['resource']['aws_lambda_function']
-            except KeyError:
-                click.secho('No lambda resource in module with {}'.format(name))
-        except FileNotFoundError:
+    def _project_index(tf):
+        index = ProjectIndex.for_terraform(tf)
+        for module_name, path in index.missing:
+            logger.debug('load_module: {} not found'.format(path))
             click.secho('Module {} source doesn\'t exist'.format(
-                name), fg='red')
+                module_name), fg='red')
             sys.exit(1)
+        return index
 
     @staticmethod
-    def _find_resource_from_var(name, source, module_key):
+    def handle_load_files(config, runtime, handler, tf_vars, tf):
         """
-        Finds a resource from a modules value.
-        e.g. function_name = ${var.lambda_name}
-        in the module.
-        """
-        module_lambda_resources = ConfigLoader._load_module_source(name, source)
-        for lambda_resource in module_lambda_resources:
-            if module_key in module_lambda_resources[lambda_resource]['function_name']:
-                return module_lambda_resources[lambda_resource]
-        return None
-        
-    @staticmethod
-    def handle_load_dirs(config, handler, dir_):
-        """
-        Searches directories for the script with the handler specified.
-
-        Args:
-            config: config dict
-            handler: the handler value from the TF file
-            dir_: directory to search
-
-        Returns:
-            An updated config dict
-        """
-        for f in dir_.iterdir():
-            if f.is_file():
-                possible_script = f.name
-                if possible_script.split('.')[0] == handler:
-                    config['script'] = dir_.resolve().__str__()
-        return config
-
-    @staticmethod
-    def handle_load_files(config, runtime, handler, tf_vars, tf, file_):
-        """
-        Finds files not in a directory. TODO: update
+        Finds the script and requirements of the function in the project and
+        sets the S3 location from the terraform file. Values already in the
+        config are kept.
 
         Args:
             config: config dict
@@ -307,25 +286,24 @@ class ConfigLoader():
             handler: the handler value from the TF file
             tf_vars: variables from the TF file
             tf: loaded TF file
-            file__: file to handle
 
         Returns:
             An updated config dict
+
+        Raises:
+            ConfigError: if the S3 bucket or key aren't set
         """
-        filename = file_.name.split('.')
-        if config['script'] is None:
-            if filename[-1] == 'js' and 'nodejs' in runtime and handler == filename[0]:
-                config['script'] = file_.resolve().__str__()
-            if filename[-1] == 'py' and 'python' in runtime and handler == filename[0]:
-                config['script'] = file_.resolve().__str__()
-        if filename[-1] == 'txt' or filename[-1] == 'json':
-            if config['name'] == filename[0]:
-                config['requirements'] = file_.resolve().__str__()
-            if file_.name == 'requirements.txt' and 'python' in runtime:
-                config['requirements'] = file_.resolve().__str__()
-            if file_.name == 'package.json' and 'nodejs' in runtime:
-                config['requirements'] = file_.resolve().__str__()
-        if file_.name == config['tf_file']:
+        files = FileIndex.for_directory(os.getcwd())
+        found = files.find_handler(handler, runtime)
+        directory = None
+        if found is not None:
+            script, directory = found
+            if config['script'] is None:
+                config['script'] = script
+        if config['requirements'] is None:
+            config['requirements'] = files.find_requirements(
+                config['name'], runtime, directory)
+        if os.path.exists(config['tf_file']):
             try:
                 if config['s3_bucket'] is None:
                     config['s3_bucket'] = tf_vars['s3_bucket']
@@ -335,53 +313,22 @@ class ConfigLoader():
                         tf)
             except KeyError:
                 logger.debug('Missing S3 bucket or key.')
-                click.echo('S3 Bucket or S3 Key aren\'t set in the terraform file.')
-                sys.exit(1)
+                raise ConfigError('S3 Bucket or S3 Key aren\'t set in the terraform file.')
         return config
 
     @staticmethod
     def determine_version(key, tf):
         """
-        Determines version in the terraform main file.
-
-        This works with variable blocks but not for modules.
-        
+        Determines version in the terraform main file, evaluating the
+        variables, tfvars and locals the S3 key uses.
         """
-        parsed_key = []
-        for x in key.strip('/').split('/'):
-            try:
-                match = re.match('\${var\.(.*)}', x)
-                if match is not None:
-                    parsed_key.append(x.replace(x, tf['variable'][match.group(1)]['default']))
-                else:
-                    parsed_key.append(x)
-            except KeyError:
-                logger.debug('Unable to set proper version to files.')
-                click.secho('Failed to handle S3 Key terraform variables.', fg='red')
-                click.secho('Set s3 key manually: maniple config --s3-key [KEY]')
-        return '/'.join(parsed_key)
-
-    @staticmethod
-    def replace_module_vars(source_vars, module_vars):
-        """
-        Replaces terraform variables in a module's source with the TF vars
-        from main.tf
-        """
-        module_no_tf_vars = {}
-        for key, value in source_vars.items():
-            key_hcl_format = '${var.' + key + '}'
-            for mod_key, mod_value in module_vars.items():
-                try:
-                    if key_hcl_format in mod_value:
-                        modified_value = mod_value.replace(
-                            key_hcl_format,
-                            value
-                        )
-                        module_no_tf_vars[mod_key] = modified_value
-                except TypeError:
-                    continue
-        module_vars.update(module_no_tf_vars)
-        return module_vars
+        parsed_key = TerraformEvaluator.for_terraform(tf).evaluate(key)
+        if not isinstance(parsed_key, str) or '${' in parsed_key:
+            logger.debug('Unable to set proper version to files.')
+            click.secho('Failed to handle S3 Key terraform variables.', fg='red')
+            click.secho('Set s3 key manually: maniple config --s3-key [KEY]')
+            return key.strip('/')
+        return parsed_key.strip('/')
 
     @staticmethod
     def get_runtime(config=None):
@@ -443,3 +390,7 @@ class ConfigLoader():
             click.echo('Load correct resource/module with \'maniple config -n resource_name\' or \'maniple config -c\'')
             sys.exit(1)
         return None
+
+
+def _result(name, config=None, runtime=None, error=None):
+    return {'name': name, 'config': config, 'runtime': runtime, 'error': error}
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_MAX_SIZE_MB = 2048
+# Like pip, a # only starts a comment at the start of a line or after
+# whitespace, #egg= and #subdirectory= fragments of URLs are kept
+COMMENT_PATTERN = re.compile(r'(^|\s+)#.*$')
+# A plain requirement such as Boto3 == 1.9.73, names are case insensitive
+REQUIREMENT_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*')
+INCLUDE_PATTERN = re.compile(
+    r'^(-r|--requirement|-c|--constraint)(?:\s*=\s*|\s+)(\S+)$')
+
+# Guards the entries of the cache directory, deploys of many functions
+# restore and store entries from several threads at once
+_lock = threading.Lock()
+# key -> number of restores copying the entry, it isn't removed meanwhile
+_in_use = {}
+
+
+class DependencyCache():
+    """
+    Installed dependencies kept between builds. Each entry is a copy of a
+    package directory right after its requirements were installed, keyed by
+    the normalized requirements, the Lambda runtime and the install options.
+
+    The cache lives in ~/.maniple/cache unless MANIPLE_CACHE_DIR is set and
+    is kept under MANIPLE_CACHE_MAX_SIZE_MB (2048 by default) by evicting the
+    least recently used entries.
+    """
+
+    @staticmethod
+    def cache_dir():
+        return os.environ.get(
+            'MANIPLE_CACHE_DIR',
+            os.path.join(str(Path.home()), '.maniple', 'cache'))
+
+    @staticmethod
+    def max_size():
+        return int(os.environ.get('MANIPLE_CACHE_MAX_SIZE_MB',
+                                  DEFAULT_MAX_SIZE_MB)) * 1024 * 1024
+
+    @staticmethod
+    def normalize_requirements(text, directory=None):
+        """
+        Drops comments, blank lines, the case of package names and ordering
+        from a requirements file so equivalent files share a cache entry.
+        URLs, paths and options are kept as they are.
+
+        Args:
+            text: content of the requirements file
+            directory: directory of the requirements file, the files it
+                includes with -r or -c are looked up relative to it and
+                replaced by the digest of their normalized content
+
+        Returns:
+            The normalized requirements, one per line.
+        """
+        return DependencyCache._normalize(text, directory, set())
+
+    @staticmethod
+    def _normalize(text, directory, seen):
+        lines = set()
+        for line in text.splitlines():
+            line = COMMENT_PATTERN.sub('', line).strip()
+            if not line:
+                continue
+            include = INCLUDE_PATTERN.match(line)
+            name = REQUIREMENT_PATTERN.match(line)
+            if include is not None and directory is not None:
+                option = '-c' if include.group(1) in ('-c', '--constraint') else '-r'
+                line = DependencyCache._include(option, include.group(2), directory, seen)
+            elif name is not None and not re.search(r'[/\\:@]', line):
+                # Not a URL, path or direct reference
+                line = name.group(0).lower() + line[name.end():].replace(' ', '')
+            lines.add(line)
+        return '\n'.join(sorted(lines))
+
+    @staticmethod
+    def _include(option, path, directory, seen):
+        """
+        Returns the line of an included requirements or constraints file,
+        with the digest of its content so editing it changes the key.
+        """
+        path = os.path.normpath(os.path.join(directory, path))
+        if path in seen:
+            return '{} {}'.format(option, path)
+        try:
+            with open(path, 'r') as f:
+                text = f.read()
+        except IOError:
+            logger.debug('Unable to read included requirements {}'.format(path))
+            return '{} {}'.format(option, path)
+        normalized = DependencyCache._normalize(text, os.path.dirname(path),
+                                                seen | {path})
+        return '{} sha256:{}'.format(
+            option, hashlib.sha256(normalized.encode('utf-8')).hexdigest())
+
+    @staticmethod
+    def key(requirements, runtime, options):
+        """
+        Args:
+            requirements: normalized requirements
+            runtime: Lambda runtime of the function
+            options: install options, e.g. the pip arguments and the
+                packages replaced from lambda_packages
+
+        Returns:
+            The cache key as a hex string.
+        """
+        data = json.dumps({
+            'requirements': requirements,
+            'runtime': runtime,
+            'options': options
+        }, sort_keys=True)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def restore(key, package):
+        """
+        Populates the package directory from the cache. The entry can't be
+        evicted or replaced by this process while it is copied.
+
+        Returns:
+            True on a cache hit, False otherwise.
+        """
+        entry = os.path.join(DependencyCache.cache_dir(), key)
+        with _lock:
+            meta = DependencyCache._load_meta(entry)
+            if meta is None:
+                return False
+            _in_use[key] = _in_use.get(key, 0) + 1
+        try:
+            if os.path.exists(package):
+                shutil.rmtree(package)
+            shutil.copytree(os.path.join(entry, 'package'), package, symlinks=True)
+        except (OSError, shutil.Error) as e:
+            # Removed by another process while it was copied
+            logger.debug('Unable to restore cache entry {}: {}'.format(key, e))
+            shutil.rmtree(package, ignore_errors=True)
+            os.makedirs(package, exist_ok=True)
+            return False
+        finally:
+            with _lock:
+                _in_use[key] -= 1
+                if not _in_use[key]:
+                    del _in_use[key]
+        with _lock:
+            meta['last_used'] = time.time()
+            meta['hits'] = meta.get('hits', 0) + 1
+            if os.path.isdir(entry):
+                DependencyCache._save_meta(entry, meta)
+        logger.debug('Restored {} from cache entry {}'.format(package, key))
+        return True
+
+    @staticmethod
+    def store(key, package, description):
+        """
+        Copies an installed package directory into the cache and evicts old
+        entries if the cache grew past its maximum size. The entry is copied
+        to a temporary directory first and renamed into place, so it is
+        never seen half written.
+
+        Args:
+            key: cache key
+            package: package directory with the installed dependencies
+            description: short text shown by 'maniple cache'
+        """
+        cache_dir = DependencyCache.cache_dir()
+        os.makedirs(cache_dir, exist_ok=True)
+        entry = os.path.join(cache_dir, key)
+        # Unique per call, functions with the same key may be stored at once
+        tmp_entry = tempfile.mkdtemp(prefix='{}.tmp'.format(key), dir=cache_dir)
+        shutil.copytree(package, os.path.join(tmp_entry, 'package'), symlinks=True)
+        now = time.time()
+        DependencyCache._save_meta(tmp_entry, {
+            'key': key,
+            'description': description,
+            'size': DependencyCache._dir_size(tmp_entry),
+            'created': now,
+            'last_used': now,
+            'hits': 0
+        })
+        trash = None
+        with _lock:
+            stored = DependencyCache._load_meta(entry) is not None
+            if not stored:
+                # A broken entry, left by a build that was interrupted
+                trash = DependencyCache._discard(entry)
+                try:
+                    os.rename(tmp_entry, entry)
+                except OSError:
+                    stored = True
+        if trash is not None:
+            shutil.rmtree(trash, ignore_errors=True)
+        if stored:
+            logger.debug('Cache entry {} was stored by another build.'.format(key))
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        DependencyCache.evict(DependencyCache.max_size())
+
+    @staticmethod
+    def entries():
+        """
+        Returns:
+            A list of the cache entries' metadata, least recently used first.
+        """
+        cache_dir = DependencyCache.cache_dir()
+        if not os.path.isdir(cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(cache_dir):
+            meta = DependencyCache._load_meta(os.path.join(cache_dir, name))
+            # Skips entries that are still being stored
+            if meta is not None and meta.get('key') == name:
+                entries.append(meta)
+        return sorted(entries, key=lambda meta: meta['last_used'])
+
+    @staticmethod
+    def evict(max_size):
+        """
+        Removes the least recently used entries until the cache is no larger
+        than max_size bytes. Entries being restored are kept.
+
+        Returns:
+            A list of the removed entries' metadata.
+        """
+        removed = []
+        trash = []
+        with _lock:
+            entries = DependencyCache.entries()
+            total = sum(meta['size'] for meta in entries)
+            for meta in entries:
+                if total <= max_size:
+                    break
+                if meta['key'] in _in_use:
+                    continue
+                trash.append(DependencyCache._discard(
+                    os.path.join(DependencyCache.cache_dir(), meta['key'])))
+                total -= meta['size']
+                removed.append(meta)
+                logger.debug('Evicted cache entry {}'.format(meta['key']))
+        for path in trash:
+            shutil.rmtree(path, ignore_errors=True)
+        return removed
+
+    @staticmethod
+    def clear():
+        if os.path.isdir(DependencyCache.cache_dir()):
+            shutil.rmtree(DependencyCache.cache_dir())
+
+    @staticmethod
+    def _discard(entry):
+        """
+        Renames the entry out of the way so it is either complete or gone
+        for the other builds.
+
+        Returns:
+            The directory to delete once the lock is released, None if there
+            was no entry.
+        """
+        if not os.path.exists(entry):
+            return None
+        trash = tempfile.mkdtemp(prefix='{}.del'.format(os.path.basename(entry)),
+                                 dir=os.path.dirname(entry))
+        os.rename(entry, os.path.join(trash, 'entry'))
+        return trash
+
+    @staticmethod
+    def _load_meta(entry):
+        try:
+            with open(os.path.join(entry, 'meta.json'), 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    @staticmethod
+    def _save_meta(entry, meta):
+        with open(os.path.join(entry, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def _dir_size(path):
+        size = 0
+        for dirname, subdirs, files in os.walk(path):
+            for filename in files:
+                size += os.lstat(os.path.join(dirname, filename)).st_size
+        return size
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+STATE_FILE = os.path.join('.maniple', 'deploy_state.json')
+
+
+class DeployState():
+    """
+    Hashes of what each function was last deployed from, kept in
+    .maniple/deploy_state.json next to the terraform file. A function whose
+    script, requirements, terraform resource and package options hash the
+    same as in the state doesn't need to be deployed again.
+    """
+
+    @staticmethod
+    def path():
+        return os.path.join(os.getcwd(), STATE_FILE)
+
+    @staticmethod
+    def load():
+        """
+        Returns:
+            A dictionary of the state of each function by name.
+        """
+        try:
+            with open(DeployState.path(), 'r') as f:
+                return json.load(f)['functions']
+        except (IOError, ValueError, KeyError):
+            return {}
+
+    @staticmethod
+    def save(functions):
+        path = DeployState.path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'functions': functions}, f, indent=2, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def fingerprint(config, runtime, resource, options, script_files):
+        """
+        Hashes the inputs of a function's deployment.
+
+        Args:
+            config: config of the function
+            runtime: runtime of the function
+            resource: the function's resource block from the terraform file
+            options: package options that change the built package
+            script_files: (absolute path, archive name) tuples of the script
+                files the package is built with
+
+        Returns:
+            A dictionary of hashes of the script, requirements, terraform
+            resource and options.
+        """
+        return {
+            'script': DeployState.hash_files(script_files),
+            'requirements': DeployState.hash_file(config['requirements'],
+                                                  runtime),
+            'terraform': _hash_json({
+                'resource': resource,
+                's3_bucket': config['s3_bucket'],
+                's3_key': config['s3_key']
+            }),
+            'options': _hash_json(options)
+        }
+
+    @staticmethod
+    def changes(entry, fingerprint):
+        """
+        Returns:
+            A list of the parts of fingerprint that changed since entry was
+            recorded, empty if the function doesn't need to be deployed.
+        """
+        if entry is None:
+            return ['new function']
+        changed = [part for part in sorted(fingerprint)
+                   if entry.get(part) != fingerprint[part]]
+        if entry.get('artifact') is None:
+            changed.append('artifact')
+        return changed
+
+    @staticmethod
+    def record(fingerprint, artifact, seconds=None):
+        """
+        Returns:
+            The state entry of a function deployed from fingerprint with a
+            package of the artifact digest in seconds.
+        """
+        entry = dict(fingerprint)
+        entry['artifact'] = artifact
+        entry['deployed'] = time.time()
+        entry['seconds'] = seconds
+        return entry
+
+    @staticmethod
+    def hash_file(path, salt=''):
+        """
+        Hashes the name and contents of a file, only the salt if there is
+        no file.
+        """
+        if path is None or not os.path.isfile(path):
+            return DeployState.hash_files([], salt)
+        return DeployState.hash_files([(path, os.path.basename(path))], salt)
+
+    @staticmethod
+    def hash_files(files, salt=''):
+        """
+        Hashes the archive names, modes and contents of (absolute path,
+        archive name) tuples.
+        """
+        sha = hashlib.sha256(salt.encode('utf-8'))
+        for abs_name, name in sorted(files, key=lambda f: f[1]):
+            sha.update('{}\0{}\0'.format(
+                name.replace(os.sep, '/'),
+                os.stat(abs_name).st_mode & 0o111).encode('utf-8'))
+            with open(abs_name, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha.update(chunk)
+        return sha.hexdigest()
+
+
+def _hash_json(value):
+    data = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
@@ -0,0 +1,177 @@
+import logging
+import os
+import threading
+
+from maniplecli.util.timings import Timings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Directories that never hold a handler or its requirements, hidden ones
+# such as .git, .terraform and .maniple are skipped too
+PRUNE_DIRS = {'node_modules', '__pycache__', 'site-packages', 'venv'}
+HANDLER_EXTENSIONS = {
+    'python': ('.py',),
+    'nodejs': ('.js', '.mjs', '.cjs')
+}
+# Marks where archive names start in the script of a handler with a path,
+# e.g. /project/./src for src/app.handler, the same way as rsync -R
+SCRIPT_ROOT_MARKER = os.sep + os.curdir + os.sep
+REQUIREMENTS_FILES = {
+    'python': 'requirements.txt',
+    'nodejs': 'package.json'
+}
+
+_lock = threading.Lock()
+
+
+class FileIndex():
+    """
+    The files of a project by name, found in a single walk of its directory
+    that skips hidden directories and installed libraries. The walk runs
+    once per project, handlers and requirements of every function are then
+    looked up in it.
+    """
+
+    _indexes = {}
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        # stem -> paths relative to root, shallowest first
+        self.stems = {}
+        # relative paths of every file
+        self.paths = set()
+
+    @staticmethod
+    def for_directory(root='.'):
+        """
+        Returns the index of root, walked the first time it is asked for.
+        """
+        root = os.path.abspath(root)
+        with _lock:
+            index = FileIndex._indexes.get(root)
+            if index is None:
+                index = FileIndex(root)
+                index._walk()
+                FileIndex._indexes[root] = index
+            return index
+
+    @staticmethod
+    def clear():
+        with _lock:
+            FileIndex._indexes = {}
+
+    def find_handler(self, handler, runtime):
+        """
+        Finds the file of a handler such as app.handler, src/app.handler or,
+        for python, src.app.handler.
+
+        Args:
+            handler: handler attribute of the Lambda resource
+            runtime: Lambda runtime
+
+        Returns:
+            The absolute path of the script to package and the directory the
+            handler's module path starts from. The script is the handler's
+            file when it is at the root of the project, the top-level
+            directory of the module path when the handler has one, written
+            with SCRIPT_ROOT_MARKER so it keeps its prefix in the package,
+            otherwise the directory holding the handler. None if the handler
+            isn't found.
+        """
+        module = handler.rsplit('.', 1)[0] if '.' in handler else handler
+        if _language(runtime) == 'python':
+            module = module.replace('.', '/')
+        parts = [part for part in module.split('/') if part not in ('', '.')]
+        if not parts:
+            return None
+        extensions = HANDLER_EXTENSIONS.get(_language(runtime))
+
+        for path in self.stems.get(parts[-1], []):
+            dirs = path.split(os.sep)
+            filename = dirs.pop()
+            if extensions is not None and filename not in [parts[-1] + extension
+                                                           for extension in extensions]:
+                continue
+            depth = len(dirs) - len(parts) + 1
+            if depth < 0 or dirs[depth:] != parts[:-1]:
+                continue
+            base = os.path.join(self.root, *dirs[:depth])
+            if len(parts) == 1 and not dirs:
+                return os.path.join(self.root, path), self.root
+            if len(parts) > 1:
+                return os.path.join(base, os.curdir, parts[0]), base
+            return base, base
+        return None
+
+    def find_requirements(self, name, runtime, directory=None):
+        """
+        Returns:
+            The absolute path of name.txt or name.json at the root of the
+            project, or else of the requirements.txt or package.json nearest
+            to directory up to the root. None if there isn't one.
+        """
+        for extension in ('.txt', '.json'):
+            if name + extension in self.paths:
+                return os.path.join(self.root, name + extension)
+        filename = REQUIREMENTS_FILES.get(_language(runtime))
+        if filename is None:
+            return None
+        relative = os.path.relpath(directory or self.root, self.root)
+        dirs = [] if relative == os.curdir else relative.split(os.sep)
+        while True:
+            path = os.path.join(*(dirs + [filename]))
+            if path in self.paths:
+                return os.path.join(self.root, path)
+            if not dirs or dirs[0] == os.pardir:
+                return None
+            dirs.pop()
+
+    @staticmethod
+    def script_root(script):
+        """
+        Returns the directory the archive names of a script directory start
+        from and the directory to package, the same one unless the script
+        was written with SCRIPT_ROOT_MARKER by find_handler.
+        """
+        if SCRIPT_ROOT_MARKER in script:
+            root, path = script.split(SCRIPT_ROOT_MARKER, 1)
+            return root, os.path.join(root, path)
+        return script, script
+
+    @staticmethod
+    def pruned(name):
+        """
+        Returns True for the directories that are never searched or packaged.
+        """
+        return name.startswith('.') or name in PRUNE_DIRS
+
+    def _walk(self):
+        with Timings.stage('discovery'):
+            stack = ['']
+            while stack:
+                relative = stack.pop()
+                try:
+                    entries = list(os.scandir(os.path.join(self.root, relative)))
+                except OSError as e:
+                    logger.debug('Unable to list {}: {}'.format(relative, e))
+                    continue
+                for entry in entries:
+                    path = os.path.join(relative, entry.name) if relative else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if not FileIndex.pruned(entry.name):
+                            stack.append(path)
+                    elif entry.is_file():
+                        self.paths.add(path)
+                        stem = entry.name.split('.')[0]
+                        self.stems.setdefault(stem, []).append(path)
+            for paths in self.stems.values():
+                paths.sort(key=lambda path: (path.count(os.sep), path))
+        logger.debug('Indexed {} files in {}'.format(len(self.paths), self.root))
+
+
+def _language(runtime):
+    for language in HANDLER_EXTENSIONS:
+        if runtime and runtime.startswith(language):
+            return language
+    return None
@@ -0,0 +1,137 @@
+import click
+import os
+
+from zipfile import ZipFile
+
+MB = 1024 * 1024
+# Lambda limits for a zip uploaded directly and for the unzipped function
+# code including its layers
+ZIPPED_LIMIT = 50 * MB
+UNZIPPED_LIMIT = 250 * MB
+LARGEST_FILES = 10
+
+
+class PackageAnalyzer():
+
+    @staticmethod
+    def analyze(zip_path, layer_zip_path=None, largest=LARGEST_FILES):
+        """
+        Breaks down the size of a deployment package.
+
+        Args:
+            zip_path: file location of the deployment package
+            layer_zip_path: file location of the layer of the package, its
+                unzipped size counts against the unzipped limit
+            largest: number of largest files to list
+
+        Returns:
+            A dictionary with the zipped and unzipped bytes of the package,
+            per top level package and per file extension, the largest files
+            and the headroom left against the Lambda limits.
+        """
+        report = PackageAnalyzer._analyze_zip(zip_path, largest)
+        unzipped = report['unzipped']
+        if layer_zip_path is not None:
+            report['layer'] = PackageAnalyzer._analyze_zip(layer_zip_path, largest)
+            unzipped += report['layer']['unzipped']
+        report['limits'] = {'zipped': ZIPPED_LIMIT, 'unzipped': UNZIPPED_LIMIT}
+        report['headroom'] = {
+            'zipped': ZIPPED_LIMIT - report['zipped'],
+            'unzipped': UNZIPPED_LIMIT - unzipped
+        }
+        return report
+
+    @staticmethod
+    def over_limits(report, budget=None):
+        """
+        Returns:
+            A list of messages for each limit the package is over, the
+            unzipped Lambda limit and the zipped budget in bytes if given.
+        """
+        errors = []
+        if report['headroom']['unzipped'] < 0:
+            errors.append('Unzipped size is {} over the Lambda limit of {}.'.format(
+                format_size(-report['headroom']['unzipped']),
+                format_size(UNZIPPED_LIMIT)))
+        if budget is not None and report['zipped'] > budget:
+            errors.append('Zipped size {} is over the budget of {}.'.format(
+                format_size(report['zipped']), format_size(budget)))
+        return errors
+
+    @staticmethod
+    def print_report(report):
+        PackageAnalyzer._print_zip(report)
+        if 'layer' in report:
+            click.echo('')
+            click.secho('Layer', bold=True)
+            PackageAnalyzer._print_zip(report['layer'])
+        click.echo('')
+        for limit in ['zipped', 'unzipped']:
+            headroom = report['headroom'][limit]
+            click.secho('Headroom {}: {} of {}'.format(
+                limit, format_size(headroom), format_size(report['limits'][limit])),
+                fg='green' if headroom >= 0 else 'red')
+
+    @staticmethod
+    def _analyze_zip(zip_path, largest):
+        packages = {}
+        extensions = {}
+        files = []
+        with ZipFile(zip_path, 'r') as zip_:
+            for info in zip_.infolist():
+                if info.is_dir():
+                    continue
+                package = info.filename.split('/', 1)[0]
+                extension = os.path.splitext(info.filename)[1].lower() or '(none)'
+                for totals, name in [(packages, package), (extensions, extension)]:
+                    total = totals.setdefault(
+                        name, {'name': name, 'zipped': 0, 'unzipped': 0, 'files': 0})
+                    total['zipped'] += info.compress_size
+                    total['unzipped'] += info.file_size
+                    total['files'] += 1
+                files.append({'name': info.filename,
+                              'zipped': info.compress_size,
+                              'unzipped': info.file_size})
+
+        for row in list(packages.values()) + list(extensions.values()) + files:
+            row['ratio'] = _ratio(row['zipped'], row['unzipped'])
+        by_size = lambda row: (-row['unzipped'], row['name'])
+        unzipped = sum(row['unzipped'] for row in files)
+        return {
+            'package': zip_path,
+            'zipped': os.path.getsize(zip_path),
+            'unzipped': unzipped,
+            'files': len(files),
+            'ratio': _ratio(sum(row['zipped'] for row in files), unzipped),
+            'packages': sorted(packages.values(), key=by_size),
+            'extensions': sorted(extensions.values(), key=by_size),
+            'largest_files': sorted(files, key=by_size)[:largest]
+        }
+
+    @staticmethod
+    def _print_zip(report, limit=20):
+        click.echo('{} ({} files): {} zipped, {} unzipped'.format(
+            report['package'], report['files'], format_size(report['zipped']),
+            format_size(report['unzipped'])))
+        for title, rows in [('Package', report['packages']),
+                            ('Extension', report['extensions']),
+                            ('Largest files', report['largest_files'])]:
+            click.echo('')
+            click.echo('{:<50} {:>10} {:>10} {:>6}'.format(
+                title, 'Zipped', 'Unzipped', 'Ratio'))
+            for row in rows[:limit]:
+                click.echo('{:<50} {:>10} {:>10} {:>6.2f}'.format(
+                    row['name'][-50:], format_size(row['zipped']),
+                    format_size(row['unzipped']), row['ratio']))
+            if len(rows) > limit:
+                click.echo('... {} more'.format(len(rows) - limit))
+
+
+def format_size(size):
+    if abs(size) < MB:
+        return '{:.1f} KB'.format(size / 1024)
+    return '{:.2f} MB'.format(size / MB)
+
+
+def _ratio(zipped, unzipped):
+    return zipped / unzipped if unzipped else 1.0
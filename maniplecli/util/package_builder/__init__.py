@@ -0,0 +1,396 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import struct
+import zipfile
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZipFile, ZipInfo
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CHUNK_SIZE = 1024 * 1024
+# Limit on the size of the files being compressed by the pool at a time,
+# their compressed data is held in memory until it is written
+MAX_PENDING_BYTES = 64 * CHUNK_SIZE
+# When streaming, larger files are compressed chunk by chunk straight into
+# the stream instead of in the pool
+STREAM_IN_CHUNKS_SIZE = 8 * CHUNK_SIZE
+DATA_DESCRIPTOR_FLAG = 0x08
+# Fixed entry attributes so the same content always produces the same zip
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+FILE_MODE = 0o644
+EXECUTABLE_MODE = 0o755
+
+
+class PackageBuilder():
+
+    @staticmethod
+    def build(files, zip_path, jobs=1, stream=None):
+        """
+        Builds a deployment package incrementally. A manifest of every entry
+        (path, size, mtime and content hash) is kept next to the zip so the
+        compressed data of unchanged files can be copied straight from the
+        previous archive instead of being deflated again.
+
+        Files are hashed and deflated by a pool of jobs threads (zlib and
+        hashlib release the GIL). The archive is reproducible: entries are
+        sorted by name and get fixed timestamps and permissions, so the
+        same content always builds the same zip for any number of jobs.
+
+        When stream is given the archive is written to it instead of
+        zip_path. The zip and manifest on disk are left untouched, entries
+        are still reused from them. Files over STREAM_IN_CHUNKS_SIZE are
+        then compressed chunk by chunk into the stream, so memory stays
+        bounded by MAX_PENDING_BYTES whatever the size of the files.
+
+        Args:
+            files: list of (abs_name, arc_name) tuples to add to the package
+            zip_path: file location of the deployment package
+            jobs: number of files compressed in parallel
+            stream: writable file object, it doesn't have to be seekable
+
+        Returns:
+            A dictionary with the number of reused and compressed entries
+            and the content digest of the package.
+        """
+        files = sorted(files, key=lambda f: f[1])
+        previous = PackageBuilder.load_manifest(zip_path)
+        old_zip = None
+        if previous and os.path.exists(zip_path):
+            try:
+                old_zip = ZipFile(zip_path, 'r')
+            except zipfile.BadZipFile:
+                logger.debug('Previous package is corrupted, rebuilding.')
+
+        manifest = {}
+        stats = {'reused': 0, 'compressed': 0}
+        tmp_path = zip_path + '.tmp'
+        try:
+            target = tmp_path if stream is None else stream
+            with ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as zip_:
+                in_chunks_size = STREAM_IN_CHUNKS_SIZE if stream is not None else None
+                processed = PackageBuilder._process_files(
+                    files, previous, old_zip, jobs, in_chunks_size)
+                for arc_name, entry, old_info, zinfo, data in processed:
+                    if old_info is not None:
+                        PackageBuilder._copy_raw(old_zip, old_info, zip_, zinfo)
+                        stats['reused'] += 1
+                        logger.debug('Reused {} : {}'.format(entry['path'], arc_name))
+                    else:
+                        if data is None:
+                            entry['sha256'] = PackageBuilder._write_in_chunks(
+                                zip_, zinfo, entry['path'])
+                        else:
+                            PackageBuilder._write_raw(zip_, zinfo, [data])
+                        stats['compressed'] += 1
+                        logger.debug('Zipped {} : {}'.format(entry['path'], arc_name))
+                    manifest[arc_name] = entry
+        finally:
+            if old_zip is not None:
+                old_zip.close()
+
+        stats['digest'] = PackageBuilder.content_digest(manifest)
+        if stream is None:
+            os.replace(tmp_path, zip_path)
+            PackageBuilder.save_manifest(zip_path, manifest, stats['digest'])
+        return stats
+
+    @staticmethod
+    def scan(files, zip_path, jobs=1):
+        """
+        Computes the content digest of a package without building it. Hashes
+        of files whose size and mtime match the manifest of the last build
+        are reused.
+
+        Args:
+            files: list of (abs_name, arc_name) tuples of the package
+            zip_path: file location of the deployment package
+            jobs: number of files hashed in parallel
+
+        Returns:
+            The content digest the package would have.
+        """
+        previous = PackageBuilder.load_manifest(zip_path)
+
+        def hash_entry(file_):
+            abs_name, arc_name = file_
+            entry = PackageBuilder._new_entry(abs_name)
+            old_entry = previous.get(arc_name)
+            if old_entry is not None and old_entry['size'] == entry['size'] \
+                    and old_entry['mtime'] == entry['mtime']:
+                entry['sha256'] = old_entry['sha256']
+            else:
+                entry['sha256'] = PackageBuilder._hash_file(abs_name)
+            return arc_name, entry
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs or 1)) as executor:
+            manifest = dict(executor.map(hash_entry, files))
+        return PackageBuilder.content_digest(manifest)
+
+    @staticmethod
+    def manifest_path(zip_path):
+        return os.path.splitext(zip_path)[0] + '.manifest.json'
+
+    @staticmethod
+    def load_manifest(zip_path):
+        try:
+            with open(PackageBuilder.manifest_path(zip_path), 'r') as f:
+                return json.load(f)['entries']
+        except (IOError, ValueError, KeyError):
+            return {}
+
+    @staticmethod
+    def load_digest(zip_path):
+        """
+        Returns the content digest of the last build of a package or None if
+        the package hasn't been built.
+        """
+        try:
+            with open(PackageBuilder.manifest_path(zip_path), 'r') as f:
+                return json.load(f)['digest']
+        except (IOError, ValueError, KeyError):
+            return None
+
+    @staticmethod
+    def save_manifest(zip_path, manifest, digest):
+        with open(PackageBuilder.manifest_path(zip_path), 'w') as f:
+            json.dump({'digest': digest, 'entries': manifest}, f,
+                      indent=2, sort_keys=True)
+
+    @staticmethod
+    def content_digest(manifest):
+        """
+        Hashes the name, mode and content hash of every entry. Unlike a hash
+        of the zip itself it doesn't depend on the compression.
+        """
+        sha = hashlib.sha256()
+        for arc_name in sorted(manifest):
+            entry = manifest[arc_name]
+            sha.update('{}\0{:o}\0{}\n'.format(
+                arc_name, entry['mode'], entry['sha256']).encode('utf-8'))
+        return sha.hexdigest()
+
+    @staticmethod
+    def _process_files(files, previous, old_zip, jobs, in_chunks_size=None):
+        """
+        Yields the processed files in order. At most a few files per job,
+        and no more than MAX_PENDING_BYTES of them, are held in memory at a
+        time.
+        """
+        if jobs is None or jobs <= 1:
+            for abs_name, arc_name in files:
+                yield PackageBuilder._process_file(
+                    abs_name, arc_name, previous, old_zip, in_chunks_size)
+            return
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            pending = collections.deque()
+            pending_bytes = 0
+            for abs_name, arc_name in files:
+                size = os.path.getsize(abs_name)
+                if in_chunks_size is not None and size > in_chunks_size:
+                    # Left for the writer, nothing is held for it
+                    size = 0
+                while pending and (len(pending) >= jobs * 4
+                                   or pending_bytes + size > MAX_PENDING_BYTES):
+                    future, future_size = pending.popleft()
+                    pending_bytes -= future_size
+                    yield future.result()
+                pending.append((executor.submit(
+                    PackageBuilder._process_file, abs_name, arc_name, previous,
+                    old_zip, in_chunks_size), size))
+                pending_bytes += size
+            while pending:
+                yield pending.popleft()[0].result()
+
+    @staticmethod
+    def _process_file(abs_name, arc_name, previous, old_zip, in_chunks_size=None):
+        """
+        Checks if a file can be reused from the previous package and
+        compresses it if it can't.
+
+        Returns:
+            A tuple of the arc name, the manifest entry, the reusable ZipInfo
+            of the previous package, the ZipInfo of the new entry and the
+            compressed data of the file. The data is None when the entry is
+            reused or the file is over in_chunks_size, it is then written
+            with _write_in_chunks.
+        """
+        entry, old_info = PackageBuilder._check_entry(
+            abs_name, arc_name, previous, old_zip)
+        zinfo = ZipInfo(arc_name, ZIP_DATE_TIME)
+        zinfo.create_system = 3  # Unix, so external_attr holds the mode
+        zinfo.external_attr = (0o100000 | entry['mode']) << 16
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        if old_info is not None:
+            return arc_name, entry, old_info, zinfo, None
+        if in_chunks_size is not None and entry['size'] > in_chunks_size:
+            return arc_name, entry, None, zinfo, None
+
+        entry['sha256'], zinfo.CRC, data = PackageBuilder._compress_file(abs_name)
+        zinfo.file_size = entry['size']
+        zinfo.compress_size = len(data)
+        return arc_name, entry, None, zinfo, data
+
+    @staticmethod
+    def _check_entry(abs_name, arc_name, previous, old_zip):
+        """
+        Creates the manifest entry of a file and decides if its compressed
+        data can be reused from the previous package.
+
+        Returns:
+            A tuple of the manifest entry and the ZipInfo of the reusable
+            entry in the previous package (None if it has to be compressed).
+        """
+        entry = PackageBuilder._new_entry(abs_name)
+        old_entry = previous.get(arc_name)
+        if old_zip is None or old_entry is None or old_entry['size'] != entry['size']:
+            return entry, None
+        try:
+            old_info = old_zip.getinfo(arc_name)
+        except KeyError:
+            return entry, None
+
+        if old_entry['mtime'] == entry['mtime']:
+            entry['sha256'] = old_entry['sha256']
+            return entry, old_info
+
+        # The file was touched (e.g. reinstalled), compare the contents
+        entry['sha256'] = PackageBuilder._hash_file(abs_name)
+        if entry['sha256'] == old_entry['sha256']:
+            return entry, old_info
+        return entry, None
+
+    @staticmethod
+    def _new_entry(abs_name):
+        stat = os.stat(abs_name)
+        return {
+            'path': abs_name,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'mode': EXECUTABLE_MODE if stat.st_mode & 0o111 else FILE_MODE,
+            'sha256': None
+        }
+
+    @staticmethod
+    def _hash_file(abs_name):
+        sha = hashlib.sha256()
+        with open(abs_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    @staticmethod
+    def _compress_file(abs_name):
+        """
+        Deflates a file the same way zipfile does for ZIP_DEFLATED entries.
+
+        Returns:
+            A tuple of the sha256 hex digest, the CRC32 and the compressed data.
+        """
+        sha = hashlib.sha256()
+        crc = 0
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                      zlib.DEFLATED, -15)
+        data = []
+        with open(abs_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+                crc = zlib.crc32(chunk, crc)
+                data.append(compressor.compress(chunk))
+        data.append(compressor.flush())
+        return sha.hexdigest(), crc & 0xffffffff, b''.join(data)
+
+    @staticmethod
+    def _copy_raw(old_zip, old_info, zip_, zinfo):
+        """
+        Copies the compressed data of an entry from one archive to another
+        without decompressing it.
+
+        Args:
+            old_zip: archive to copy from
+            old_info: ZipInfo of the entry in old_zip
+            zip_: archive to copy to
+            zinfo: ZipInfo of the new entry, its CRC and sizes are taken
+                from old_info
+        """
+        fp = old_zip.fp
+        fp.seek(old_info.header_offset)
+        header = fp.read(zipfile.sizeFileHeader)
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        fp.seek(old_info.header_offset + zipfile.sizeFileHeader
+                + name_length + extra_length)
+
+        zinfo.compress_type = old_info.compress_type
+        zinfo.CRC = old_info.CRC
+        zinfo.file_size = old_info.file_size
+        zinfo.compress_size = old_info.compress_size
+
+        def chunks(remaining):
+            while remaining > 0:
+                chunk = fp.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise zipfile.BadZipFile(
+                        'Truncated entry {}'.format(old_info.filename))
+                remaining -= len(chunk)
+                yield chunk
+
+        PackageBuilder._write_raw(zip_, zinfo, chunks(old_info.compress_size))
+
+    @staticmethod
+    def _write_in_chunks(zip_, zinfo, abs_name):
+        """
+        Deflates a file chunk by chunk straight into an open archive. The
+        CRC and sizes aren't known when the local header is written, they
+        follow the data in a data descriptor.
+
+        Returns:
+            The sha256 hex digest of the file.
+        """
+        sha = hashlib.sha256()
+        crc = 0
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                      zlib.DEFLATED, -15)
+        zinfo.flag_bits |= DATA_DESCRIPTOR_FLAG
+        zinfo.file_size = zinfo.compress_size = 0
+
+        def chunks():
+            nonlocal crc
+            with open(abs_name, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    sha.update(chunk)
+                    crc = zlib.crc32(chunk, crc)
+                    zinfo.file_size += len(chunk)
+                    data = compressor.compress(chunk)
+                    zinfo.compress_size += len(data)
+                    yield data
+            data = compressor.flush()
+            zinfo.compress_size += len(data)
+            yield data
+            zinfo.CRC = crc & 0xffffffff
+            yield struct.pack('<4sLLL', b'PK\x07\x08', zinfo.CRC,
+                              zinfo.compress_size, zinfo.file_size)
+
+        PackageBuilder._write_raw(zip_, zinfo, chunks())
+        return sha.hexdigest()
+
+    @staticmethod
+    def _write_raw(zip_, zinfo, chunks):
+        """
+        Writes an already compressed entry to an open archive. The CRC and
+        sizes of zinfo must already be set, unless they follow the data in a
+        data descriptor.
+        """
+        zinfo.header_offset = zip_.fp.tell()
+        zip_.fp.write(zinfo.FileHeader())
+        for chunk in chunks:
+            zip_.fp.write(chunk)
+        zip_.filelist.append(zinfo)
+        zip_.NameToInfo[zinfo.filename] = zinfo
+        zip_.start_dir = zip_.fp.tell()
+        zip_._didModify = True
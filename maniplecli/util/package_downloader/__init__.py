@@ -1,33 +1,47 @@
 import click
 import logging
 import json
+import os
 import shutil
 import sys
 import tarfile
+import tempfile
+import threading
+import time
 
 from pathlib import Path
 from zipfile import ZipFile
 from maniplecli.util.config_loader import ConfigLoader
+from maniplecli.util.dependency_cache import DependencyCache
 from maniplecli.util.shell import Shell
 from maniplecli.util.lambda_packages import lambda_packages
+from maniplecli.util.timings import Timings
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Options that change what gets installed are part of the cache key
+PIP_INSTALL_OPTIONS = ['install']
+NPM_INSTALL_OPTIONS = ['install']
+
+# Packages can be downloaded from several threads, one prompt at a time
+_prompt_lock = threading.Lock()
+
 
 class PackageDownloader():
 
     @staticmethod
-    def download_packages(script, requirements, package):
-        runtime = ConfigLoader.get_runtime()
+    def download_packages(script, requirements, package, runtime=None):
+        if runtime is None:
+            runtime = ConfigLoader.get_runtime()
         if requirements is not None:
             if 'python' in runtime:
                 PackageDownloader._handle_python_packages(
-                    script, requirements, package
+                    script, requirements, package, runtime
                 )
             elif 'nodejs' in runtime:
                 PackageDownloader._handle_js_packages(
-                    script, requirements, package
+                    script, requirements, package, runtime
                 )
             else:
                 logger.debug('Unsupported runtime.')
@@ -37,71 +51,120 @@ class PackageDownloader():
             click.echo('No requirements specified. No packages will be downloaded.')    
 
     @staticmethod
-    def _handle_python_packages(script, requirements, package):
+    def _handle_python_packages(script, requirements, package, runtime):
         # Find packages that can be replaced for python
         requirements_to_replace = []
-        package_path = None
+        replaced_paths = []
         with open(requirements, 'r') as f:
-            for py_package in f:
-                try:
-                    package_name = py_package[:py_package.index('=')]
-                except ValueError as e:
-                    logger.debug('Python requirements.txt misconfigured: {}'.format(e))
-                    continue
-                package_path = PackageDownloader._check_for_packages_to_replace(
-                    package_name
-                )
-                if package_path is not None:
-                    package_path = Path(package_path)
-                    PackageDownloader._unzip_package(package_path, package)
-                else:
-                    requirements_to_replace.append(py_package)
-
-        # Only install packages that haven't been replaced
-        cmds = []
-        if package_path is not None:
-            for requirement in requirements_to_replace:
-                cmds.append([
-                    'pip',
-                    'install',
-                    '--target={}'.format(package),
-                    requirement.strip()
-                ])
-        else:
-            cmds.append([
-                'pip',
-                'install',
-                '--target={}'.format(package),
-                '-r',
-                requirements
-            ])
-        for cmd in cmds:
-            return_code, out, err = Shell.run(
-                cmd,
-                Path.cwd()
+            requirements_text = f.read()
+        for py_package in requirements_text.splitlines():
+            try:
+                package_name = py_package[:py_package.index('=')]
+            except ValueError:
+                logger.debug('Not a pinned requirement: {}'.format(py_package))
+                requirements_to_replace.append(py_package)
+                continue
+            package_path = PackageDownloader._check_for_packages_to_replace(
+                package_name
             )
-            if return_code != 0:
-                click.secho('{} failed.'.format(cmd), fg='red')
-                logger.debug(err)
-                sys.exit(1)        
+            if package_path is not None:
+                replaced_paths.append(package_path)
+            else:
+                requirements_to_replace.append(py_package)
+
+        cache_key = DependencyCache.key(
+            DependencyCache.normalize_requirements(
+                requirements_text, os.path.dirname(os.path.abspath(requirements))),
+            runtime,
+            {'pip': PIP_INSTALL_OPTIONS, 'lambda_packages': sorted(replaced_paths)})
+        if DependencyCache.restore(cache_key, package):
+            click.echo('Dependencies restored from cache.')
+            return
+
+        if replaced_paths:
+            start = time.time()
+            for package_path in replaced_paths:
+                with Timings.stage('extract'):
+                    PackageDownloader._unzip_package(Path(package_path), package)
+                    if Timings.enabled:
+                        Timings.add_bytes(os.path.getsize(package_path))
+            click.echo('Extracted {} packages from lambda_packages in {:.1f}s.'.format(
+                len(replaced_paths), time.time() - start))
+
+        # Only install packages that haven't been replaced. They are written
+        # to one file next to the original so pip resolves them together and
+        # relative paths in the file still work.
+        if replaced_paths:
+            fd, pip_requirements = tempfile.mkstemp(
+                suffix='.txt', prefix='.maniple-',
+                dir=os.path.dirname(os.path.abspath(requirements)))
+            with os.fdopen(fd, 'w') as f:
+                f.write('\n'.join(requirements_to_replace) + '\n')
+        else:
+            pip_requirements = requirements
+        try:
+            PackageDownloader._pip_install(pip_requirements, package)
+        finally:
+            if pip_requirements != requirements:
+                os.remove(pip_requirements)
+        DependencyCache.store(cache_key, package, '{} ({})'.format(
+            requirements, runtime))
 
     @staticmethod
-    def _handle_js_packages(script, requirements, package):
+    def _pip_install(requirements, package):
+        """
+        Installs every requirement of a requirements file with a single pip
+        process.
+        """
+        with open(requirements, 'r') as f:
+            count = len(DependencyCache.normalize_requirements(f.read()).splitlines())
+        if count == 0:
+            return
+        cmd = ['pip'] + PIP_INSTALL_OPTIONS + [
+            '--target={}'.format(package),
+            '-r',
+            requirements
+        ]
+        start = time.time()
+        with Timings.stage('pip'):
+            return_code, out, err = Shell.run(cmd, Path.cwd())
+        if return_code != 0:
+            click.secho('{} failed.'.format(cmd), fg='red')
+            logger.debug(err)
+            sys.exit(1)
+        click.echo('Resolved and installed {} requirements with pip in {:.1f}s.'.format(
+            count, time.time() - start))
+
+    @staticmethod
+    def _handle_js_packages(script, requirements, package, runtime):
         try:
             with open(requirements, 'r') as f:
                 dependencies = json.load(f)
         except FileNotFoundError:
             click.echo('Can\'t find package.json - use \'maniple config -r\' to set value')
             sys.exit(1)
+
+        cache_key = DependencyCache.key(
+            json.dumps(dependencies.get('dependencies', {}), sort_keys=True),
+            runtime,
+            {'npm': NPM_INSTALL_OPTIONS})
+        if DependencyCache.restore(cache_key, package):
+            click.echo('Dependencies restored from cache.')
+            return
+
         for key, value in dependencies['dependencies'].items():                
-            return_code, out, err = Shell.run(
-                ['npm', '--prefix', package, 'install', 'key'],
-                Path.getcwd()
-            )
+            with Timings.stage('npm'):
+                return_code, out, err = Shell.run(
+                    ['npm', '--prefix', package] + NPM_INSTALL_OPTIONS
+                    + ['{}@{}'.format(key, value)],
+                    Path.cwd()
+                )
             if return_code != 0:
                 click.secho('{} failed.'.format('npm package install'), fg='red')
                 logger.error(err)
                 sys.exit(1)
+        DependencyCache.store(cache_key, package, '{} ({})'.format(
+            requirements, runtime))
 
     @staticmethod
     def _check_for_packages_to_replace(package_name):
@@ -122,7 +185,8 @@ class PackageDownloader():
                 package_to_replace[i] = lambda_package[versions]['path']
                 i += 1
             user_input_str.append('{}: Install from pip\n'.format(i))
-            user_input = click.prompt('\n'.join(user_input_str))
+            with _prompt_lock:
+                user_input = click.prompt('\n'.join(user_input_str))
             try:
                 user_input = int(user_input)
                 if user_input in range(1, len(package_to_replace.keys()) + 1):
@@ -0,0 +1,158 @@
+import click
+import fnmatch
+import logging
+import os
+import shutil
+
+from concurrent.futures import ThreadPoolExecutor
+from maniplecli.util.package_analyzer import format_size
+from maniplecli.util.shell import Shell
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Patterns without a slash match a file or directory name anywhere in the
+# package, patterns with one match the end of its path.
+# Only what no library reads at runtime is removed by default. Test
+# packages and egg-info metadata, which entry points and version lookups
+# read, can be excluded with --exclude tests --exclude "*.egg-info".
+DEFAULT_EXCLUDES = [
+    '__pycache__',
+    '*.pyc',
+    '*.pyo',
+    '*.dist-info/RECORD',
+    '*.dist-info/INSTALLER'
+]
+ELF_MAGIC = b'\x7fELF'
+
+
+class PackageSlimmer():
+
+    @staticmethod
+    def slim(package, excludes=None, jobs=1):
+        """
+        Removes files the function doesn't need at runtime from an installed
+        package directory and strips debug symbols from its shared objects
+        when the strip tool is available.
+
+        Args:
+            package: directory with the installed dependencies
+            excludes: extra exclude patterns added to DEFAULT_EXCLUDES
+            jobs: number of shared objects stripped in parallel
+
+        Returns:
+            A dictionary of (bytes before, bytes after) by top level package.
+        """
+        patterns = DEFAULT_EXCLUDES + list(excludes or [])
+        before = PackageSlimmer.sizes(package)
+
+        removed = PackageSlimmer._remove_excluded(package, patterns)
+        logger.debug('Removed {} excluded paths from {}'.format(removed, package))
+
+        strip = shutil.which('strip')
+        if strip is None:
+            logger.debug('strip not found, shared objects are left as is.')
+        else:
+            PackageSlimmer._strip_shared_objects(strip, package, jobs)
+
+        after = PackageSlimmer.sizes(package)
+        return {name: (size, after.get(name, 0)) for name, size in before.items()}
+
+    @staticmethod
+    def sizes(package):
+        """
+        Returns:
+            A dictionary of the size in bytes of each top level file or
+            directory in package.
+        """
+        sizes = {}
+        for entry in os.scandir(package):
+            if entry.is_dir(follow_symlinks=False):
+                size = 0
+                for dirname, subdirs, files in os.walk(entry.path):
+                    for filename in files:
+                        size += os.lstat(os.path.join(dirname, filename)).st_size
+            else:
+                size = entry.stat(follow_symlinks=False).st_size
+            sizes[entry.name] = size
+        return sizes
+
+    @staticmethod
+    def print_report(report, limit=15):
+        """
+        Prints the before and after size of the largest top level packages.
+        """
+        rows = sorted(report.items(), key=lambda item: item[1][0], reverse=True)
+        total_before = sum(before for before, after in report.values())
+        total_after = sum(after for before, after in report.values())
+        click.echo('{:<40} {:>10} {:>10}'.format('Package', 'Before', 'After'))
+        for name, (before, after) in rows[:limit]:
+            click.echo('{:<40} {:>10} {:>10}'.format(
+                name[:40], format_size(before), format_size(after)))
+        if len(rows) > limit:
+            click.echo('... {} more'.format(len(rows) - limit))
+        click.secho('{:<40} {:>10} {:>10}'.format(
+            'Total', format_size(total_before), format_size(total_after)),
+            fg='green')
+
+    @staticmethod
+    def matches(rel_path, patterns):
+        """
+        Returns True if the path, relative to the package, matches one of the
+        exclude patterns.
+        """
+        rel_path = rel_path.replace(os.sep, '/')
+        name = rel_path.rsplit('/', 1)[-1]
+        for pattern in patterns:
+            if '/' in pattern:
+                if fnmatch.fnmatch(rel_path, pattern) \
+                        or fnmatch.fnmatch(rel_path, '*/' + pattern):
+                    return True
+            elif fnmatch.fnmatch(name, pattern):
+                return True
+        return False
+
+    @staticmethod
+    def _remove_excluded(package, patterns):
+        removed = 0
+        for dirname, subdirs, files in os.walk(package):
+            rel_dir = os.path.relpath(dirname, package)
+            rel_dir = '' if rel_dir == '.' else rel_dir + '/'
+            for subdir in list(subdirs):
+                if PackageSlimmer.matches(rel_dir + subdir, patterns):
+                    shutil.rmtree(os.path.join(dirname, subdir))
+                    subdirs.remove(subdir)
+                    removed += 1
+            for filename in files:
+                if PackageSlimmer.matches(rel_dir + filename, patterns):
+                    os.remove(os.path.join(dirname, filename))
+                    removed += 1
+        return removed
+
+    @staticmethod
+    def _strip_shared_objects(strip, package, jobs):
+        shared_objects = []
+        for dirname, subdirs, files in os.walk(package):
+            for filename in files:
+                path = os.path.join(dirname, filename)
+                if ('.so' in filename and not os.path.islink(path)
+                        and PackageSlimmer._is_elf(path)):
+                    shared_objects.append(path)
+
+        def strip_file(path):
+            return_code, out, err = Shell.run(
+                [strip, '--strip-unneeded', path], os.getcwd())
+            if return_code != 0:
+                logger.debug('Unable to strip {}: {}'.format(path, err))
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            list(executor.map(strip_file, shared_objects))
+        logger.debug('Stripped {} shared objects.'.format(len(shared_objects)))
+
+    @staticmethod
+    def _is_elf(path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read(4) == ELF_MAGIC
+        except IOError:
+            return False
@@ -0,0 +1,199 @@
+import json
+import logging
+import os
+import threading
+
+from maniplecli.util.tf_directory import TerraformDirectory
+from maniplecli.util.tf_evaluator import TerraformEvaluator
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+LAMBDA_RESOURCE = 'aws_lambda_function'
+
+_lock = threading.Lock()
+
+
+class ProjectIndex():
+    """
+    Every Lambda function of a terraform project, found in a single pass
+    over the root file and, recursively, the local module sources it uses.
+    Functions are looked up by name in constant time.
+
+    A module is indexed under its name when it holds one function, or one
+    whose function_name is the module's name. Otherwise each of its
+    functions is indexed under its resolved function_name. The attributes
+    of each function are evaluated with the variables, tfvars and locals of
+    its module.
+    """
+
+    # Indexes by root directory and root file content, with the mtime and
+    # size of every module file they were built from
+    _indexes = {}
+
+    def __init__(self, root_dir, evaluator=None):
+        self.root_dir = root_dir
+        self.evaluator = evaluator
+        # name -> entry in the order get_possible_resources lists them
+        self.entries = {}
+        # Module sources that don't exist, (module name, path)
+        self.missing = []
+        # (directory, signature) of the root and each module directory read
+        self.directories = []
+        # File each root block came from by address
+        self.origins = {}
+
+    @staticmethod
+    def for_terraform(tf, root_dir=None):
+        """
+        Returns the index of the project whose root file was parsed as tf,
+        built once and reused until a terraform file of the root or one of
+        its modules, or a tfvars file, changes.
+
+        Args:
+            tf: root terraform file loaded as a dictionary
+            root_dir: directory module sources are relative to, the current
+                directory by default
+        """
+        root_dir = os.path.abspath(root_dir or os.getcwd())
+        key = (root_dir, json.dumps(tf, sort_keys=True, default=str))
+        evaluator = TerraformEvaluator.for_terraform(tf, root_dir)
+        with _lock:
+            index = ProjectIndex._indexes.get(key)
+        if index is not None and index.evaluator is evaluator and index._is_current():
+            return index
+        index = ProjectIndex.build(tf, root_dir, evaluator)
+        with _lock:
+            ProjectIndex._indexes[key] = index
+        return index
+
+    @staticmethod
+    def build(tf, root_dir, evaluator=None):
+        root_dir = os.path.abspath(root_dir)
+        index = ProjectIndex(root_dir,
+                             evaluator or TerraformEvaluator.for_terraform(tf, root_dir))
+        try:
+            index.directories.append((root_dir, TerraformDirectory.signature(root_dir)))
+            index.origins = TerraformDirectory.load(root_dir)[1]
+        except FileNotFoundError:
+            logger.debug('No terraform files in {}'.format(root_dir))
+        index._add_modules(tf, root_dir, '', index.evaluator, (root_dir,))
+        for name, attributes in _lambda_resources(tf):
+            index._add(name, {
+                'name': name,
+                'kind': 'resource',
+                'address': '{}.{}'.format(LAMBDA_RESOURCE, name),
+                'attributes': index.evaluator.evaluate(attributes),
+                'source': index.root_dir,
+                'file': index.origins.get('resource.{}.{}'.format(LAMBDA_RESOURCE, name)),
+                'module': None
+            })
+        logger.debug('Indexed {} functions from {} directories'.format(
+            len(index.entries), len(index.directories)))
+        return index
+
+    def get(self, name):
+        """
+        Returns:
+            The entry of the function or module, None if there isn't one.
+        """
+        return self.entries.get(name)
+
+    def attributes(self, name):
+        """
+        Returns:
+            A copy of the resolved attributes of the function or module,
+            None if there isn't one.
+        """
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        return json.loads(json.dumps(entry['attributes']))
+
+    def possible_resources(self):
+        """
+        Returns:
+            A list of (number, name, 'module' or 'resource') tuples like
+            ConfigLoader.get_possible_resources.
+        """
+        return [(count, entry['name'],
+                 'resource' if entry['kind'] == 'resource' else 'module')
+                for count, entry in enumerate(self.entries.values(), 1)]
+
+    def _add(self, name, entry):
+        if name in self.entries:
+            logger.debug('{} is defined more than once, using {}'.format(
+                name, self.entries[name]['address']))
+            return
+        self.entries[name] = entry
+
+    def _add_modules(self, tf, directory, prefix, evaluator, stack):
+        modules = tf.get('module') if isinstance(tf, dict) else None
+        for module_name, arguments in (modules or {}).items():
+            source = arguments.get('source')
+            if not isinstance(source, str) or not _is_local(source):
+                continue
+            module_dir = os.path.normpath(os.path.join(directory, source.lstrip('/')))
+            if module_dir in stack:
+                logger.debug('Module {} includes itself'.format(module_dir))
+                continue
+            try:
+                signature = TerraformDirectory.signature(module_dir)
+                module_tf, origins = TerraformDirectory.load(module_dir)
+            except FileNotFoundError:
+                self.missing.append((module_name, module_dir))
+                continue
+            self.directories.append((module_dir, signature))
+
+            module_evaluator = evaluator.module(module_tf, module_dir, arguments)
+            address = '{}module.{}'.format(prefix, module_name)
+
+            functions = []
+            for name, attributes in _lambda_resources(module_tf):
+                functions.append({
+                    'name': name,
+                    'kind': 'module',
+                    'address': '{}.{}.{}'.format(address, LAMBDA_RESOURCE, name),
+                    'attributes': module_evaluator.evaluate(attributes),
+                    'source': module_dir,
+                    'file': origins.get('resource.{}.{}'.format(LAMBDA_RESOURCE, name)),
+                    'module': module_name
+                })
+            self._add_functions(module_name, address, functions)
+            self._add_modules(module_tf, module_dir, address + '.', module_evaluator,
+                              stack + (module_dir,))
+
+    def _add_functions(self, module_name, address, functions):
+        named = [function for function in functions
+                 if function['attributes'].get('function_name') == module_name]
+        if len(functions) == 1 or named:
+            function = (named or functions)[0]
+            self._add(module_name, dict(function, name=module_name,
+                                        address=address))
+            return
+        for function in functions:
+            function_name = function['attributes'].get('function_name')
+            if isinstance(function_name, str) and '${' not in function_name:
+                self._add(function_name, dict(function, name=function_name))
+            else:
+                logger.debug('Unable to resolve the name of {}'.format(
+                    function['address']))
+
+    def _is_current(self):
+        if self.evaluator is not None and not self.evaluator.is_current():
+            return False
+        return all(TerraformDirectory.signature(directory) == signature
+                   for directory, signature in self.directories)
+
+
+def _lambda_resources(tf):
+    try:
+        resources = tf['resource'][LAMBDA_RESOURCE]
+    except (KeyError, TypeError):
+        return []
+    return [(name, attributes) for name, attributes in (resources or {}).items()
+            if isinstance(attributes, dict)]
+
+
+def _is_local(source):
+    return source.startswith(('.', '/'))
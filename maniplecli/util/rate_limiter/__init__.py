@@ -0,0 +1,35 @@
+import threading
+import time
+
+
+class RateLimiter():
+    """
+    Spaces out calls shared between threads so no more than rate calls per
+    second are made.
+    """
+
+    def __init__(self, rate):
+        self.lock = threading.Lock()
+        self.next_call = 0.0
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+
+    def acquire(self):
+        """
+        Blocks until the next call is allowed.
+        """
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def botocore_hook(self, **kwargs):
+        """
+        Handler for botocore's before-call event, limits every API call of
+        the client it's registered on.
+        """
+        self.acquire()
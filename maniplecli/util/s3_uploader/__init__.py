@@ -0,0 +1,334 @@
+import click
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MB = 1024 * 1024
+DEFAULT_CHUNK_SIZE_MB = 8
+# S3 rejects multipart uploads with smaller parts, except the last one
+MIN_CHUNK_SIZE_MB = 5
+DEFAULT_CONCURRENCY = 10
+
+
+class S3Uploader():
+
+    @staticmethod
+    def transfer_config(chunk_size_mb=None, concurrency=None):
+        """
+        Creates the TransferConfig used for uploads. Files larger than one
+        chunk are uploaded in parts of chunk_size_mb.
+
+        Args:
+            chunk_size_mb: size of each part in MB (S3 minimum is 5)
+            concurrency: number of parts uploaded at the same time
+        """
+        chunk_size = int((chunk_size_mb or DEFAULT_CHUNK_SIZE_MB) * MB)
+        return TransferConfig(multipart_threshold=chunk_size,
+                              multipart_chunksize=chunk_size,
+                              max_concurrency=concurrency or DEFAULT_CONCURRENCY)
+
+    @staticmethod
+    def upload(s3, file_path, s3_bucket, s3_key, transfer_config=None,
+               metadata=None):
+        """
+        Uploads a file to s3 showing its progress. Multipart uploads keep
+        their state next to the file so an interrupted upload resumes from
+        the parts already sent the next time it runs.
+
+        Args:
+            s3: boto3 s3 client
+            file_path: file to upload
+            s3_bucket: bucket to upload to
+            s3_key: key to upload to
+            transfer_config: TransferConfig with the chunk size and concurrency
+            metadata: dictionary of user metadata for the object
+
+        Returns:
+            A dictionary with the bytes sent, seconds taken, throughput in
+            MB/s and the number of parts that were resumed.
+        """
+        if transfer_config is None:
+            transfer_config = S3Uploader.transfer_config()
+        size = os.path.getsize(file_path)
+        start = time.time()
+        with click.progressbar(length=size, label='Uploading',
+                               show_pos=False) as bar:
+            progress = S3Uploader._progress_callback(bar)
+            if size <= transfer_config.multipart_threshold:
+                extra_args = {'Metadata': metadata} if metadata else None
+                s3.upload_file(file_path, s3_bucket, s3_key,
+                               ExtraArgs=extra_args,
+                               Callback=progress,
+                               Config=transfer_config)
+                resumed = 0
+            else:
+                resumed = S3Uploader._multipart_upload(
+                    s3, file_path, s3_bucket, s3_key, transfer_config,
+                    metadata, progress)
+        seconds = max(time.time() - start, 1e-6)
+        return {
+            'bytes': size,
+            'seconds': seconds,
+            'mbps': size / MB / seconds,
+            'resumed_parts': resumed
+        }
+
+    @staticmethod
+    def stream(s3, write_fn, s3_bucket, s3_key, transfer_config=None,
+               metadata=None):
+        """
+        Uploads whatever write_fn writes as a multipart upload. Parts are
+        sent as soon as they fill, while write_fn keeps writing, and at most
+        max_concurrency parts are held in memory waiting to be sent.
+
+        Args:
+            s3: boto3 s3 client
+            write_fn: function called with the writable file object
+            s3_bucket: bucket to upload to
+            s3_key: key to upload to
+            transfer_config: TransferConfig with the part size and concurrency
+            metadata: dictionary of user metadata for the object
+
+        Returns:
+            A dictionary with the bytes sent, seconds taken, throughput in
+            MB/s and the number of parts.
+        """
+        if transfer_config is None:
+            transfer_config = S3Uploader.transfer_config()
+        start = time.time()
+        kwargs = {'Bucket': s3_bucket, 'Key': s3_key}
+        if metadata:
+            kwargs['Metadata'] = metadata
+        upload_id = s3.create_multipart_upload(**kwargs)['UploadId']
+        writer = MultipartWriter(s3, s3_bucket, s3_key, upload_id, transfer_config)
+        try:
+            write_fn(writer)
+            parts = writer.close()
+            s3.complete_multipart_upload(
+                Bucket=s3_bucket, Key=s3_key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts})
+        except BaseException:
+            writer.abort()
+            S3Uploader._abort(s3, {'bucket': s3_bucket, 'key': s3_key}, upload_id)
+            raise
+        seconds = max(time.time() - start, 1e-6)
+        return {
+            'bytes': writer.tell(),
+            'seconds': seconds,
+            'mbps': writer.tell() / MB / seconds,
+            'parts': len(parts)
+        }
+
+    @staticmethod
+    def state_path(file_path):
+        return file_path + '.upload.json'
+
+    @staticmethod
+    def _progress_callback(bar):
+        lock = threading.Lock()
+
+        def progress(bytes_sent):
+            with lock:
+                bar.update(bytes_sent)
+        return progress
+
+    @staticmethod
+    def _multipart_upload(s3, file_path, s3_bucket, s3_key, transfer_config,
+                          metadata, progress):
+        """
+        Uploads the parts missing from the multipart upload of file_path and
+        completes it.
+
+        Returns:
+            The number of parts that had already been uploaded.
+        """
+        stat = os.stat(file_path)
+        chunk_size = transfer_config.multipart_chunksize
+        state = {
+            'bucket': s3_bucket,
+            'key': s3_key,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'chunk_size': chunk_size,
+            'metadata': metadata or {}
+        }
+        upload_id, done = S3Uploader._resume(s3, file_path, state)
+        if upload_id is None:
+            kwargs = {'Bucket': s3_bucket, 'Key': s3_key}
+            if metadata:
+                kwargs['Metadata'] = metadata
+            upload_id = s3.create_multipart_upload(**kwargs)['UploadId']
+            state['upload_id'] = upload_id
+            with open(S3Uploader.state_path(file_path), 'w') as f:
+                json.dump(state, f)
+        else:
+            click.echo('Resuming upload, {} parts already sent.'.format(len(done)))
+
+        part_count = max(1, (stat.st_size + chunk_size - 1) // chunk_size)
+        for part_number in done:
+            progress(min(chunk_size, stat.st_size - (part_number - 1) * chunk_size))
+
+        def upload_part(part_number):
+            with open(file_path, 'rb') as f:
+                f.seek((part_number - 1) * chunk_size)
+                data = f.read(chunk_size)
+            response = s3.upload_part(Bucket=s3_bucket, Key=s3_key,
+                                      UploadId=upload_id,
+                                      PartNumber=part_number, Body=data)
+            progress(len(data))
+            return part_number, response['ETag']
+
+        etags = dict(done)
+        missing = [n for n in range(1, part_count + 1) if n not in done]
+        with ThreadPoolExecutor(max_workers=transfer_config.max_concurrency) as executor:
+            futures = [executor.submit(upload_part, n) for n in missing]
+            try:
+                for future in as_completed(futures):
+                    part_number, etag = future.result()
+                    etags[part_number] = etag
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        s3.complete_multipart_upload(
+            Bucket=s3_bucket, Key=s3_key, UploadId=upload_id,
+            MultipartUpload={'Parts': [
+                {'PartNumber': n, 'ETag': etags[n]} for n in sorted(etags)
+            ]})
+        os.remove(S3Uploader.state_path(file_path))
+        return len(done)
+
+    @staticmethod
+    def _resume(s3, file_path, state):
+        """
+        Loads the state of a previous upload of the same file.
+
+        Returns:
+            A tuple of the upload id and a dictionary of the uploaded parts'
+            ETags by part number. The upload id is None if there is nothing
+            to resume.
+        """
+        try:
+            with open(S3Uploader.state_path(file_path), 'r') as f:
+                previous = json.load(f)
+            upload_id = previous.pop('upload_id')
+        except (IOError, ValueError, KeyError):
+            return None, {}
+
+        if previous != state:
+            logger.debug('Package changed since the interrupted upload.')
+            S3Uploader._abort(s3, previous, upload_id)
+            return None, {}
+
+        done = {}
+        kwargs = {'Bucket': state['bucket'], 'Key': state['key'],
+                  'UploadId': upload_id}
+        try:
+            while True:
+                response = s3.list_parts(**kwargs)
+                for part in response.get('Parts', []):
+                    expected = min(state['chunk_size'], state['size']
+                                   - (part['PartNumber'] - 1) * state['chunk_size'])
+                    if part['Size'] == expected:
+                        done[part['PartNumber']] = part['ETag']
+                if not response.get('IsTruncated'):
+                    break
+                kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
+        except ClientError as e:
+            logger.debug('Unable to resume upload {}: {}'.format(upload_id, e))
+            return None, {}
+        return upload_id, done
+
+    @staticmethod
+    def _abort(s3, state, upload_id):
+        try:
+            s3.abort_multipart_upload(Bucket=state['bucket'], Key=state['key'],
+                                      UploadId=upload_id)
+        except ClientError as e:
+            logger.debug('Unable to abort upload {}: {}'.format(upload_id, e))
+
+
+class MultipartWriter():
+    """
+    Write only file object that sends what is written to it as the parts of
+    a multipart upload. Writes block while max_concurrency parts are being
+    sent, so memory stays under max_concurrency + 1 parts.
+    """
+
+    def __init__(self, s3, s3_bucket, s3_key, upload_id, transfer_config):
+        self.s3 = s3
+        self.s3_bucket = s3_bucket
+        self.s3_key = s3_key
+        self.upload_id = upload_id
+        self.part_size = transfer_config.multipart_chunksize
+        self.executor = ThreadPoolExecutor(
+            max_workers=transfer_config.max_concurrency)
+        self.slots = threading.BoundedSemaphore(transfer_config.max_concurrency)
+        self.buffer = bytearray()
+        self.position = 0
+        self.futures = []
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= self.part_size:
+            self._submit(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        raise io.UnsupportedOperation('seek')
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """
+        Sends the last part and waits for every part to be uploaded.
+
+        Returns:
+            The list of parts to complete the upload with.
+        """
+        if self.buffer or not self.futures:
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        try:
+            return [future.result() for future in self.futures]
+        finally:
+            self.executor.shutdown()
+
+    def abort(self):
+        for future in self.futures:
+            future.cancel()
+        self.executor.shutdown()
+
+    def _submit(self, data):
+        for future in self.futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        self.slots.acquire()
+        future = self.executor.submit(self._upload_part,
+                                      len(self.futures) + 1, data)
+        future.add_done_callback(lambda f: self.slots.release())
+        self.futures.append(future)
+
+    def _upload_part(self, part_number, data):
+        response = self.s3.upload_part(Bucket=self.s3_bucket, Key=self.s3_key,
+                                       UploadId=self.upload_id,
+                                       PartNumber=part_number, Body=data)
+        logger.debug('Sent part {} ({} bytes)'.format(part_number, len(data)))
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
@@ -1,6 +1,7 @@
 import logging
 import subprocess
 
+from maniplecli.util.timings import Timings
 from subprocess import PIPE
 
 logger = logging.getLogger(__name__)
@@ -14,6 +15,7 @@ class Shell():
         stderr = PIPE
         stdout = PIPE
 
+        Timings.count_subprocess()
         p = subprocess.Popen(cmd, stdout=stdout, stderr=stderr,
                              cwd=pwd)
 
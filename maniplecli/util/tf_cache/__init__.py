@@ -0,0 +1,132 @@
+import hcl
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from maniplecli.util.timings import Timings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CACHE_FILE = os.path.join('.maniple', 'tf_cache.json')
+
+_lock = threading.Lock()
+
+
+class TerraformCache():
+    """
+    Parsed terraform files keyed by their path, mtime and size. Parses are
+    kept in memory and in .maniple/tf_cache.json under the project so later
+    commands skip pyhcl for files that haven't changed. Every load returns a
+    new copy that callers are free to modify.
+    """
+
+    # Parsed files as JSON by absolute path, with the mtime and size
+    entries = None
+    path = None
+
+    @staticmethod
+    def cache_path():
+        return os.path.join(os.getcwd(), CACHE_FILE)
+
+    @staticmethod
+    def load(tf_file):
+        """
+        Returns:
+            The terraform file parsed as a dictionary.
+
+        Raises:
+            FileNotFoundError: if tf_file doesn't exist
+        """
+        abs_path = os.path.abspath(tf_file)
+        stat = os.stat(abs_path)
+        parsed = TerraformCache.get(abs_path, stat)
+        if parsed is not None:
+            return parsed
+
+        with Timings.stage('hcl parse'):
+            parsed = parse(abs_path)
+        TerraformCache.put(abs_path, stat, parsed)
+        return json.loads(json.dumps(parsed))
+
+    @staticmethod
+    def get(abs_path, stat):
+        """
+        Returns:
+            A copy of the cached parse of the file, None if the file changed
+            since it was parsed or never was.
+        """
+        with _lock:
+            entry = TerraformCache._entries().get(abs_path)
+            if entry is not None and entry['mtime'] == stat.st_mtime_ns \
+                    and entry['size'] == stat.st_size:
+                return json.loads(entry['data'])
+        return None
+
+    @staticmethod
+    def put(abs_path, stat, parsed):
+        TerraformCache.put_all([(abs_path, stat, parsed)])
+
+    @staticmethod
+    def put_all(parses):
+        """
+        Caches (absolute path, stat, parsed) tuples, saving the cache once.
+        """
+        with _lock:
+            entries = TerraformCache._entries()
+            for abs_path, stat, parsed in parses:
+                entries[abs_path] = {
+                    'mtime': stat.st_mtime_ns,
+                    'size': stat.st_size,
+                    'data': json.dumps(parsed)
+                }
+            TerraformCache._save()
+
+    @staticmethod
+    def clear():
+        with _lock:
+            TerraformCache.entries = None
+            TerraformCache.path = None
+            try:
+                os.remove(TerraformCache.cache_path())
+            except OSError:
+                pass
+
+    @staticmethod
+    def _entries():
+        # The cache belongs to the project, reload it if the directory changed
+        path = TerraformCache.cache_path()
+        if TerraformCache.entries is None or TerraformCache.path != path:
+            TerraformCache.path = path
+            try:
+                with open(path, 'r') as f:
+                    TerraformCache.entries = json.load(f)
+            except (IOError, ValueError):
+                TerraformCache.entries = {}
+        return TerraformCache.entries
+
+    @staticmethod
+    def _save():
+        directory = os.path.dirname(TerraformCache.path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix='tf_cache.', dir=directory)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(TerraformCache.entries, f)
+            os.replace(tmp_path, TerraformCache.path)
+        except OSError as e:
+            # The in memory cache still works
+            logger.debug('Unable to save {}: {}'.format(TerraformCache.path, e))
+
+
+def parse(abs_path):
+    """
+    Parses a .tf or .tf.json file, a module level function so it can run in
+    a process pool.
+    """
+    with open(abs_path, 'r') as f:
+        parsed = hcl.load(f)
+    logger.debug('Parsed {}'.format(abs_path))
+    return parsed
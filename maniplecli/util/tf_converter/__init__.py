@@ -1,10 +1,11 @@
 import click
-import hcl
 import logging
 import os
 import re
 import sys
 
+from maniplecli.util.project_index import ProjectIndex
+from maniplecli.util.tf_directory import TerraformDirectory
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -13,9 +14,14 @@ logger.setLevel(logging.INFO)
 class TerraformConverter():
     @staticmethod
     def load_terraform(tf_file):
+        """
+        Loads every terraform file of the directory of tf_file, or of tf_file
+        if it is a directory, as one dictionary.
+        """
         try:
-            with open(tf_file, 'r') as f:
-                return hcl.load(f)
+            if not os.path.exists(tf_file):
+                raise FileNotFoundError(tf_file)
+            return TerraformDirectory.load(TerraformDirectory.directory_of(tf_file))[0]
         except FileNotFoundError:
             click.secho('Main terraform file not found.', fg='red')
             sys.exit(1)
@@ -70,52 +76,14 @@ class TerraformConverter():
             name: name of Lambda fn
 
         Returns:
-            cf_template: dictionary with the cloudformation style
+            The attributes of the Lambda resource, or of the module's
+            function with the module's variables replaced. None if there
+            isn't one.
         """
-
-        # Find if resource
-        try:
-            resources = tf['resource']['aws_lambda_function']
-            for lambda_name, values in resources.items():
-                if lambda_name == name:
-                    return values
-        except KeyError as e:
-            logger.debug(e)
-            pass
-        except TypeError as e:
-            logger.debug(e)
-            pass
-
-        # Find if module
-        try:
-            modules = tf['module']
-        except KeyError as e:
-            logger.debug(e)
-            return None
-
-        for module_name, values in modules.items():
-            print(module_name)
-            print(values)
-            if module_name == name:
-                source = values['source']
-                with open(os.path.join(os.getcwd(), source, 'main.tf'), 'r') as f:
-                    tf_module = hcl.load(f)
-                lambda_resource = tf_module['resource']['aws_lambda_function']
-                lambda_vars = lambda_resource[list(lambda_resource.keys())[0]]
-                # Zip module into a basic resource format
-                cf_template = {}
-                for key, val in lambda_vars.items():
-                    if '${var.' in val:
-                        # Updates resource value from the module
-                        match = re.match('\${var\.(.*)}', val)
-                        cf_template[key] = values[match.group(1)]
-                    else:
-                        cf_template[key] = val
-                print(cf_template)
-                return cf_template
-
-        logger.debug('Unable to get resource attrs')
-        return None
+        attributes = ProjectIndex.for_terraform(tf).attributes(name)
+        if attributes is None:
+            logger.debug('Unable to get resource attrs')
+        return attributes
 
     def to_camel_case(self, str_):
         """Converts snake case to camel case."""
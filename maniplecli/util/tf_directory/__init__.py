@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import re
+
+from concurrent.futures import ProcessPoolExecutor
+from maniplecli.util.tf_cache import TerraformCache, parse
+from maniplecli.util.timings import Timings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+TF_FILE = re.compile(r'.*\.tf(\.json)?$')
+OVERRIDE_FILE = re.compile(r'^(.*_)?override\.tf(\.json)?$')
+# Starting worker processes costs more than parsing a few files
+MIN_PARALLEL_PARSES = 4
+# Nesting of the blocks of each type, resource "type" "name" is two deep
+BLOCK_DEPTH = {'resource': 2, 'data': 2}
+
+
+class TerraformDirectory():
+    """
+    A terraform module made of all the .tf and .tf.json files of a
+    directory, merged into one dictionary the way terraform reads them.
+    Override files are merged last, into the blocks they override.
+
+    Files that changed since they were last parsed are parsed at the same
+    time in a process pool, the others come from TerraformCache.
+    """
+
+    @staticmethod
+    def files(directory):
+        """
+        Returns:
+            The paths of the terraform files of the directory, sorted by
+            name with the override files last.
+        """
+        try:
+            names = [entry.name for entry in os.scandir(directory)
+                     if entry.is_file() and TF_FILE.match(entry.name)]
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+        names.sort(key=lambda name: (bool(OVERRIDE_FILE.match(name)), name))
+        return [os.path.join(os.path.abspath(directory), name) for name in names]
+
+    @staticmethod
+    def directory_of(tf_file):
+        """
+        Returns:
+            The directory of the module tf_file belongs to, tf_file itself if
+            it is a directory.
+        """
+        if os.path.isdir(tf_file):
+            return os.path.abspath(tf_file)
+        return os.path.dirname(os.path.abspath(tf_file))
+
+    @staticmethod
+    def signature(directory):
+        """
+        Returns:
+            The name, mtime and size of each terraform file of the directory,
+            it changes whenever one of them is added, removed or modified.
+        """
+        signature = []
+        for path in TerraformDirectory.files(directory):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    @staticmethod
+    def load(directory, workers=None):
+        """
+        Args:
+            directory: directory of a terraform module
+            workers: number of processes parsing files, one per CPU by
+                default
+
+        Returns:
+            The merged module as a dictionary and the file each block came
+            from, by address such as resource.aws_lambda_function.name,
+            module.name, variable.name or local.name.
+
+        Raises:
+            FileNotFoundError: if the directory has no terraform files
+        """
+        paths = TerraformDirectory.files(directory)
+        if not paths:
+            raise FileNotFoundError('No terraform files in {}'.format(directory))
+        parsed = TerraformDirectory._parse_all(paths, workers)
+
+        tf = {}
+        origins = {}
+        for path in paths:
+            override = OVERRIDE_FILE.match(os.path.basename(path)) is not None
+            _merge(tf, parsed[path], path, origins, override)
+        return tf, origins
+
+    @staticmethod
+    def _parse_all(paths, workers):
+        parsed = {}
+        misses = []
+        for path in paths:
+            stat = os.stat(path)
+            cached = TerraformCache.get(path, stat)
+            if cached is None:
+                misses.append((path, stat))
+            else:
+                parsed[path] = cached
+        if not misses:
+            return parsed
+
+        workers = min(len(misses), workers or os.cpu_count() or 1)
+        with Timings.stage('hcl parse'):
+            if workers > 1 and len(misses) >= MIN_PARALLEL_PARSES:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(parse, [path for path, stat in misses]))
+            else:
+                results = [parse(path) for path, stat in misses]
+        logger.debug('Parsed {} of {} files with {} workers'.format(
+            len(misses), len(paths), workers))
+        TerraformCache.put_all([(path, stat, result) for (path, stat), result
+                                in zip(misses, results)])
+        for (path, stat), result in zip(misses, results):
+            # A copy like the cached parses
+            parsed[path] = json.loads(json.dumps(result))
+        return parsed
+
+
+def _merge(tf, parsed, path, origins, override):
+    for block_type, blocks in parsed.items():
+        # pyhcl returns a list when a file has several blocks of a type
+        # without labels, like locals
+        if isinstance(blocks, list):
+            for block in blocks:
+                _merge(tf, {block_type: block}, path, origins, override)
+            continue
+        if not isinstance(blocks, dict):
+            tf[block_type] = blocks
+            continue
+        depth = BLOCK_DEPTH.get(block_type, 1)
+        prefix = 'local' if block_type == 'locals' else block_type
+        _merge_blocks(tf.setdefault(block_type, {}), blocks, depth, prefix, path,
+                      origins, override)
+
+
+def _merge_blocks(target, blocks, depth, prefix, path, origins, override):
+    for name, block in blocks.items():
+        address = '{}.{}'.format(prefix, name)
+        if depth > 1 and isinstance(block, dict):
+            _merge_blocks(target.setdefault(name, {}), block, depth - 1, address,
+                          path, origins, override)
+        elif name not in target:
+            target[name] = block
+            origins[address] = path
+        elif override and isinstance(target[name], dict) and isinstance(block, dict):
+            target[name].update(block)
+        elif override:
+            target[name] = block
+        else:
+            logger.debug('{} in {} is already defined in {}'.format(
+                address, path, origins.get(address)))
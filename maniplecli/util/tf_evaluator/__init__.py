@@ -0,0 +1,424 @@
+import json
+import logging
+import os
+import re
+import threading
+
+from maniplecli.util.tf_cache import TerraformCache
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+TFVARS_FILES = ['terraform.tfvars', 'terraform.tfvars.json']
+AUTO_TFVARS = re.compile(r'.*\.auto\.tfvars(\.json)?$')
+ENV_PREFIX = 'TF_VAR_'
+
+TOKEN_PATTERN = re.compile(r'''
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*")
+      | (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<name>[A-Za-z_][A-Za-z0-9_-]*)
+      | (?P<punct>[.\[\](),])
+    )''', re.VERBOSE)
+
+_lock = threading.Lock()
+
+
+class Unresolved(Exception):
+    """
+    An expression refers to something only terraform knows, a resource,
+    data source or module output, or isn't supported.
+    """
+    pass
+
+
+class TerraformEvaluator():
+    """
+    Evaluates the ${...} interpolations of a terraform module. Variables take
+    their default, then TF_VAR_ environment variables, terraform.tfvars,
+    *.auto.tfvars and the var files in the order given, like terraform.
+    Locals, path.module and a few functions are supported, expressions
+    that refer to resources or data sources are left as they are.
+
+    Locals are evaluated once and kept with the evaluator, the evaluator of
+    the root module is reused until one of its tfvars files changes.
+    """
+
+    # Var files given with --var-file or MANIPLE_VAR_FILES, applied last
+    var_files = [path for path in os.environ.get('MANIPLE_VAR_FILES', '').split(os.pathsep)
+                 if path]
+    _evaluators = {}
+
+    def __init__(self, tf, directory, variables=None):
+        """
+        Args:
+            tf: terraform module loaded as a dictionary
+            directory: directory of the module
+            variables: values of the module's variables, the defaults in tf
+                are used for the others
+        """
+        self.directory = directory
+        self.variables = _variable_defaults(tf)
+        self.variables.update(variables or {})
+        self.raw_locals = _locals(tf)
+        self.locals = {}
+        self._resolving = set()
+        self._lock = threading.RLock()
+        # (path, mtime, size) of each tfvars file read
+        self.files = []
+
+    @staticmethod
+    def for_terraform(tf, root_dir=None):
+        """
+        Returns the evaluator of the root module with the variables set in
+        its tfvars and var files.
+
+        Args:
+            tf: root terraform file loaded as a dictionary
+            root_dir: directory of the root module, the current directory by
+                default
+        """
+        root_dir = os.path.abspath(root_dir or os.getcwd())
+        var_files = _var_files(root_dir)
+        key = (root_dir, json.dumps(tf, sort_keys=True, default=str),
+               tuple(var_files), json.dumps(_env_variables(), sort_keys=True))
+        with _lock:
+            evaluator = TerraformEvaluator._evaluators.get(key)
+        if evaluator is not None and evaluator.is_current():
+            return evaluator
+
+        evaluator = TerraformEvaluator(tf, root_dir, _env_variables())
+        for path in var_files:
+            evaluator.variables.update(evaluator._load_var_file(path))
+        with _lock:
+            TerraformEvaluator._evaluators[key] = evaluator
+        return evaluator
+
+    @staticmethod
+    def configure(var_files):
+        """
+        Sets the var files applied after the tfvars files of the project.
+        """
+        with _lock:
+            TerraformEvaluator.var_files = list(var_files)
+            TerraformEvaluator._evaluators = {}
+
+    def module(self, tf, directory, arguments):
+        """
+        Returns the evaluator of a module called with arguments, which are
+        evaluated here, in the module calling it.
+        """
+        arguments = {key: value for key, value in arguments.items()
+                     if key != 'source'}
+        return TerraformEvaluator(tf, directory, self.evaluate(arguments))
+
+    def evaluate(self, value):
+        """
+        Returns:
+            The value with its interpolations replaced. A string that is a
+            single interpolation takes the value as is, a list or map
+            stays one. Interpolations that can't be resolved are kept.
+        """
+        if isinstance(value, dict):
+            return {key: self.evaluate(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.evaluate(item) for item in value]
+        if not isinstance(value, str) or '${' not in value:
+            return value
+        parts = []
+        for literal, expression in _template_parts(value):
+            if expression is None:
+                parts.append(literal)
+                continue
+            try:
+                parts.append(_Parser(self, expression).parse())
+            except Unresolved as e:
+                logger.debug('Unable to evaluate ${{{}}}: {}'.format(expression, e))
+                parts.append(literal)
+        if len(parts) == 1:
+            return parts[0]
+        try:
+            return ''.join(_to_string(part) for part in parts)
+        except Unresolved as e:
+            logger.debug('Unable to evaluate {}: {}'.format(value, e))
+            return value
+
+    def is_current(self):
+        for path, mtime, size in self.files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return False
+            if stat.st_mtime_ns != mtime or stat.st_size != size:
+                return False
+        return True
+
+    def variable(self, name):
+        # Values are literals or, for a module, evaluated by its caller
+        if name not in self.variables:
+            raise Unresolved('var.{} has no value'.format(name))
+        return self.variables[name]
+
+    def local(self, name):
+        with self._lock:
+            if name in self.locals:
+                return self.locals[name]
+            if name not in self.raw_locals or name in self._resolving:
+                raise Unresolved('local.{} has no value'.format(name))
+            self._resolving.add(name)
+            try:
+                value = self.evaluate(self.raw_locals[name])
+            finally:
+                self._resolving.discard(name)
+            self.locals[name] = value
+            return value
+
+    def _load_var_file(self, path):
+        try:
+            stat = os.stat(path)
+            values = TerraformCache.load(path)
+        except (OSError, ValueError) as e:
+            logger.debug('Unable to load {}: {}'.format(path, e))
+            return {}
+        self.files.append((path, stat.st_mtime_ns, stat.st_size))
+        return values if isinstance(values, dict) else {}
+
+
+class _Parser():
+    """
+    Recursive descent parser of a single interpolation, evaluated while it is
+    parsed.
+    """
+
+    def __init__(self, evaluator, expression):
+        self.evaluator = evaluator
+        self.tokens = _tokenize(expression)
+        self.position = 0
+
+    def parse(self):
+        value = self._expression()
+        if self.position != len(self.tokens):
+            raise Unresolved('unsupported expression')
+        return value
+
+    def _peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def _next(self, kind=None, text=None):
+        token = self._peek()
+        if token[0] is None or (kind is not None and token[0] != kind) \
+                or (text is not None and token[1] != text):
+            raise Unresolved('unexpected {}'.format(token[1]))
+        self.position += 1
+        return token
+
+    def _expression(self):
+        kind, text = self._next()
+        if kind == 'string':
+            value = self.evaluator.evaluate(json.loads(text))
+        elif kind == 'number':
+            value = float(text) if '.' in text else int(text)
+        elif kind == 'name' and self._peek() == ('punct', '('):
+            value = self._call(text)
+        elif kind == 'name':
+            value = self._reference(text)
+        else:
+            raise Unresolved('unexpected {}'.format(text))
+        return self._accessors(value)
+
+    def _reference(self, name):
+        if name in ('true', 'false'):
+            return name == 'true'
+        self._next('punct', '.')
+        attribute = self._next()[1]
+        if name == 'var':
+            return self.evaluator.variable(attribute)
+        if name == 'local':
+            return self.evaluator.local(attribute)
+        if name == 'path' and attribute == 'module':
+            return self.evaluator.directory
+        if name == 'path' and attribute in ('root', 'cwd'):
+            return os.getcwd()
+        raise Unresolved('{}.{} is only known to terraform'.format(name, attribute))
+
+    def _accessors(self, value):
+        while self._peek() in (('punct', '.'), ('punct', '[')):
+            if self._next()[1] == '.':
+                value = _index(value, self._next()[1])
+            else:
+                value = _index(value, self._expression())
+                self._next('punct', ']')
+        return value
+
+    def _call(self, name):
+        function = FUNCTIONS.get(name)
+        if function is None:
+            raise Unresolved('function {} is not supported'.format(name))
+        self._next('punct', '(')
+        args = []
+        while self._peek() != ('punct', ')'):
+            args.append(self._expression())
+            if self._peek() == ('punct', ','):
+                self._next()
+        self._next('punct', ')')
+        for arg in args:
+            if isinstance(arg, str) and '${' in arg:
+                raise Unresolved('argument of {} is unresolved'.format(name))
+        try:
+            return function(*args)
+        except (TypeError, ValueError, KeyError, IndexError) as e:
+            raise Unresolved('{}: {}'.format(name, e))
+
+
+def _lookup(mapping, key, *default):
+    if key in mapping:
+        return mapping[key]
+    if default:
+        return default[0]
+    raise KeyError(key)
+
+
+def _replace(string, search, replacement):
+    if len(search) > 1 and search.startswith('/') and search.endswith('/'):
+        return re.sub(search[1:-1], replacement.replace('$', '\\'), string)
+    return string.replace(search, replacement)
+
+
+def _format(spec, *args):
+    return re.sub(r'%v', '%s', spec) % args
+
+
+def _coalesce(*args):
+    for arg in args:
+        if arg not in (None, ''):
+            return arg
+    raise ValueError('no non-empty argument')
+
+
+FUNCTIONS = {
+    'basename': os.path.basename,
+    'coalesce': _coalesce,
+    'concat': lambda *lists: [item for list_ in lists for item in list_],
+    'dirname': os.path.dirname,
+    'element': lambda list_, index: list_[int(index) % len(list_)],
+    'format': _format,
+    'join': lambda separator, list_: separator.join(_to_string(item) for item in list_),
+    'length': len,
+    'lookup': _lookup,
+    'lower': lambda string: string.lower(),
+    'replace': _replace,
+    'split': lambda separator, string: string.split(separator),
+    'trimspace': lambda string: string.strip(),
+    'upper': lambda string: string.upper()
+}
+
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if match is None:
+            raise Unresolved('unsupported expression')
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+def _template_parts(value):
+    """
+    Splits a string into (literal, expression) parts, expression is None for
+    the text between interpolations.
+    """
+    parts = []
+    start = 0
+    position = value.find('${')
+    while position != -1:
+        if position > start:
+            parts.append((value[start:position], None))
+        end = _closing_brace(value, position + 2)
+        if end == -1:
+            break
+        parts.append((value[position:end + 1], value[position + 2:end]))
+        start = end + 1
+        position = value.find('${', start)
+    if start < len(value):
+        parts.append((value[start:], None))
+    return parts
+
+
+def _closing_brace(value, position):
+    depth = 0
+    in_string = False
+    while position < len(value):
+        char = value[position]
+        if in_string:
+            if char == '\\':
+                position += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            if depth == 0:
+                return position
+            depth -= 1
+        position += 1
+    return -1
+
+
+def _index(value, key):
+    try:
+        if isinstance(value, list):
+            return value[int(key)]
+        return value[key]
+    except (KeyError, IndexError, TypeError, ValueError):
+        raise Unresolved('{} not found'.format(key))
+
+
+def _to_string(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (dict, list)):
+        raise Unresolved('a list or map can\'t be part of a string')
+    return str(value)
+
+
+def _variable_defaults(tf):
+    defaults = {}
+    blocks = tf.get('variable') if isinstance(tf, dict) else None
+    for name, block in (blocks or {}).items():
+        if isinstance(block, dict) and 'default' in block:
+            defaults[name] = block['default']
+    return defaults
+
+
+def _locals(tf):
+    blocks = tf.get('locals') if isinstance(tf, dict) else None
+    # pyhcl returns a list when there are several locals blocks
+    if isinstance(blocks, dict):
+        blocks = [blocks]
+    values = {}
+    for block in blocks or []:
+        values.update(block)
+    return values
+
+
+def _env_variables():
+    return {key[len(ENV_PREFIX):]: value for key, value in os.environ.items()
+            if key.startswith(ENV_PREFIX)}
+
+
+def _var_files(root_dir):
+    paths = [os.path.join(root_dir, name) for name in TFVARS_FILES
+             if os.path.isfile(os.path.join(root_dir, name))]
+    paths.extend(sorted(entry.path for entry in os.scandir(root_dir)
+                        if entry.is_file() and AUTO_TFVARS.match(entry.name)))
+    paths.extend(os.path.abspath(path) for path in TerraformEvaluator.var_files)
+    return paths
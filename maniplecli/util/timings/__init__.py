@@ -0,0 +1,167 @@
+import click
+import functools
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class Timings():
+    """
+    Wall time, bytes processed and subprocesses started in each stage of a
+    pack or deploy, by function. Nothing is recorded until enable is called.
+
+    Stages can be nested, the time of a stage doesn't include the stages run
+    inside it so the stages of a function add up to the time it took.
+    """
+
+    enabled = False
+    started = None
+    rows = {}
+
+    @staticmethod
+    def enable():
+        with _lock:
+            Timings.enabled = True
+            Timings.started = time.perf_counter()
+            Timings.rows = {}
+
+    @staticmethod
+    def disable():
+        Timings.enabled = False
+
+    @staticmethod
+    @contextmanager
+    def function(name):
+        """
+        Records the stages run by the current thread under the function.
+        """
+        previous = getattr(_local, 'function', None)
+        _local.function = name
+        try:
+            yield
+        finally:
+            _local.function = previous
+
+    @staticmethod
+    @contextmanager
+    def stage(name):
+        if not Timings.enabled:
+            yield
+            return
+        stack = _stack()
+        # [name, seconds of the stages nested in it]
+        frame = [name, 0.0]
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            with _lock:
+                row = Timings._row(name)
+                row['calls'] += 1
+                row['seconds'] += elapsed - frame[1]
+
+    @staticmethod
+    def timed(name):
+        """
+        Decorator that runs the whole function as the stage.
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with Timings.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def add_bytes(count):
+        """
+        Adds to the bytes processed by the stage the current thread is in.
+        """
+        if Timings.enabled:
+            with _lock:
+                Timings._row(_current_stage())['bytes'] += count
+
+    @staticmethod
+    def count_subprocess():
+        if Timings.enabled:
+            with _lock:
+                Timings._row(_current_stage())['subprocesses'] += 1
+
+    @staticmethod
+    def report():
+        """
+        Returns:
+            A dictionary with the total seconds since enable was called and
+            the calls, seconds, bytes and subprocesses of every stage by
+            function.
+        """
+        with _lock:
+            rows = sorted((dict(row) for row in Timings.rows.values()),
+                          key=lambda row: (row['function'] or '', row['stage']))
+        return {
+            'seconds': time.perf_counter() - Timings.started if Timings.started else 0.0,
+            'stages': rows
+        }
+
+    @staticmethod
+    def print_report(report=None):
+        report = report or Timings.report()
+        click.echo('')
+        click.echo('{:<30} {:<16} {:>6} {:>9} {:>10} {:>6}'.format(
+            'Function', 'Stage', 'Calls', 'Seconds', 'MB', 'Procs'))
+        for row in report['stages']:
+            click.echo('{:<30} {:<16} {:>6} {:>9.2f} {:>10.2f} {:>6}'.format(
+                (row['function'] or '-')[:30], row['stage'], row['calls'],
+                row['seconds'], row['bytes'] / 1024 / 1024, row['subprocesses']))
+        click.secho('Total {:.2f}s'.format(report['seconds']), fg='green')
+
+    @staticmethod
+    def save_report(path, report=None):
+        with open(path, 'w') as f:
+            json.dump(report or Timings.report(), f, indent=2)
+
+    @staticmethod
+    def finish(show=True, json_path=None):
+        """
+        Stops recording, prints the report if show is set and writes it as
+        JSON to json_path if given.
+        """
+        Timings.disable()
+        report = Timings.report()
+        if show:
+            Timings.print_report(report)
+        if json_path is not None:
+            Timings.save_report(json_path, report)
+            click.echo('Timings written to {}'.format(json_path))
+
+    @staticmethod
+    def _row(stage):
+        function = getattr(_local, 'function', None)
+        key = (function, stage)
+        if key not in Timings.rows:
+            Timings.rows[key] = {'function': function, 'stage': stage,
+                                 'calls': 0, 'seconds': 0.0, 'bytes': 0,
+                                 'subprocesses': 0}
+        return Timings.rows[key]
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _current_stage():
+    stack = _stack()
+    return stack[-1][0] if stack else 'other'
@@ -0,0 +1,143 @@
+import asyncio
+import click
+import functools
+import logging
+import threading
+import time
+
+from botocore.exceptions import BotoCoreError, ClientError
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+TIMEOUT = 300
+INITIAL_DELAY = 0.5
+MAX_DELAY = 8.0
+MAX_THREADS = 10
+
+_lock = threading.Lock()
+
+
+class UpdateWaiter():
+    """
+    Polls the LastUpdateStatus of functions whose code or configuration was
+    updated until every update has settled. Each function is polled with
+    its own exponential backoff, all of them at the same time.
+
+    The time each update was sent is recorded with record_update, the time
+    an update took to settle is counted from it.
+    """
+
+    # Function name -> time.monotonic() of its last update call
+    updates = {}
+
+    @staticmethod
+    def record_update(function_name):
+        """
+        Records that an update of the function's code or configuration is
+        being sent, called right before the update call.
+        """
+        with _lock:
+            UpdateWaiter.updates[function_name] = time.monotonic()
+
+    @staticmethod
+    def update_times(function_names):
+        """
+        Returns:
+            A dictionary of the recorded update time of the functions that
+            have one.
+        """
+        with _lock:
+            return {name: UpdateWaiter.updates[name] for name in function_names
+                    if name in UpdateWaiter.updates}
+
+    @staticmethod
+    def wait(client, function_names, timeout=TIMEOUT, delay=INITIAL_DELAY,
+             max_delay=MAX_DELAY, updated_at=None):
+        """
+        Args:
+            client: boto3 Lambda client
+            function_names: names of the updated functions
+            timeout: seconds to wait for each function once polling starts
+            delay: seconds before the second poll of a function, doubled
+                after each poll up to max_delay
+            updated_at: dictionary by function name of the time.monotonic()
+                its update was sent, the settle time of functions without
+                one is counted from the first poll
+
+        Returns:
+            A dictionary by function name of the update status, Successful,
+            Failed, TimedOut or Error, the seconds it took to settle and the
+            reason if it didn't succeed.
+        """
+        names = list(dict.fromkeys(function_names))
+        if not names:
+            return {}
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(max_workers=min(len(names), MAX_THREADS))
+        try:
+            results = loop.run_until_complete(UpdateWaiter._wait_all(
+                loop, executor, client, names, timeout, delay, max_delay,
+                updated_at or {}))
+        finally:
+            executor.shutdown(wait=True)
+            loop.close()
+        return dict(zip(names, results))
+
+    @staticmethod
+    def failed(results):
+        """
+        Returns:
+            The names of the functions whose update didn't succeed.
+        """
+        return [name for name, result in results.items()
+                if result['status'] != 'Successful']
+
+    @staticmethod
+    def print_report(results):
+        click.echo('{:<40} {:<15} {:>10}'.format('Function', 'Update', 'Seconds'))
+        for name, result in results.items():
+            line = '{:<40} {:<15} {:>10.1f}'.format(
+                name, result['status'], result['seconds'])
+            if result['status'] == 'Successful':
+                click.echo(line)
+            else:
+                click.secho('{}  {}'.format(line, result['reason']), fg='red')
+
+    @staticmethod
+    async def _wait_all(loop, executor, client, names, timeout, delay, max_delay,
+                        updated_at):
+        return await asyncio.gather(*[
+            UpdateWaiter._wait_one(loop, executor, client, name, timeout,
+                                   delay, max_delay, updated_at.get(name))
+            for name in names])
+
+    @staticmethod
+    async def _wait_one(loop, executor, client, name, timeout, delay, max_delay,
+                        updated_at=None):
+        polled_at = time.monotonic()
+        start = updated_at if updated_at is not None else polled_at
+        while True:
+            try:
+                response = await loop.run_in_executor(executor, functools.partial(
+                    client.get_function_configuration, FunctionName=name))
+            except (BotoCoreError, ClientError) as e:
+                return _result('Error', start, str(e))
+            status = response.get('LastUpdateStatus', 'Successful')
+            # A function that was just created is Pending until it is active
+            if status != 'InProgress' and response.get('State') != 'Pending':
+                logger.debug('{} {} after {:.1f}s'.format(
+                    name, status, time.monotonic() - start))
+                return _result(status, start,
+                               response.get('LastUpdateStatusReason'))
+            if time.monotonic() - polled_at + delay > timeout:
+                return _result('TimedOut', start,
+                               'still updating after {}s'.format(timeout))
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+
+def _result(status, start, reason=None):
+    return {'status': status, 'seconds': time.monotonic() - start,
+            'reason': reason}
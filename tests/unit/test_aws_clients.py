@@ -0,0 +1,47 @@
+import os
+import threading
+
+from unittest import TestCase, mock
+from maniplecli.util.aws_clients import AwsClients
+
+
+class TestAwsClients(TestCase):
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, {
+            'AWS_DEFAULT_REGION': 'us-east-1',
+            'AWS_ACCESS_KEY_ID': 'testing',
+            'AWS_SECRET_ACCESS_KEY': 'testing'})
+        self.env.start()
+        self.addCleanup(self.env.stop)
+        AwsClients.reset()
+        self.addCleanup(AwsClients.reset)
+        self.addCleanup(AwsClients.configure, 0)
+
+    def test_one_client_per_service(self):
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(AwsClients.client('s3')))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(map(id, clients))), 1)
+        self.assertIsNot(AwsClients.client('lambda'), clients[0])
+
+    def test_config(self):
+        AwsClients.configure(40)
+        config = AwsClients.client('lambda').meta.config
+        self.assertEqual(config.max_pool_connections, 40)
+        self.assertEqual(config.retries['mode'], 'adaptive')
+        # A smaller concurrency keeps the default pool size
+        AwsClients.configure(2)
+        self.assertEqual(AwsClients.client('lambda').meta.config.max_pool_connections, 10)
+
+    def test_handlers_are_registered_on_new_clients(self):
+        calls = []
+        handler = lambda **kwargs: calls.append(kwargs)
+        AwsClients.register('sts', 'maniple-test.sts', handler, 'test-handler')
+        self.addCleanup(AwsClients.handlers.pop, 'sts')
+        client = AwsClients.client('sts')
+        client.meta.events.emit('maniple-test.sts')
+        self.assertEqual(len(calls), 1)
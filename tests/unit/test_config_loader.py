@@ -1,10 +1,12 @@
 import os
+import shutil
+import tempfile
 
 from click.testing import CliRunner
 from pathlib import Path
-from unittest import TestCase
+from unittest import TestCase, mock
 from maniplecli.commands.config import cli
-from maniplecli.util.config_loader import ConfigLoader
+from maniplecli.util.config_loader import ConfigError, ConfigLoader
 
 
 class TestConfigLoader(TestCase):
@@ -207,3 +209,43 @@ class TestConfigLoader(TestCase):
             'maniple/test/1.0.0/module_mult_folder_dir.zip',
             Path('module_mult_folder_dir').resolve().__str__()
         )
+
+    def test_resolve_all(self):
+        os.chdir(self.file_dir.joinpath('tf_test', 'basic_multiple'))
+        with mock.patch.object(ConfigLoader, 'save_config') as save, \
+                mock.patch('click.prompt', side_effect=AssertionError):
+            results = ConfigLoader.resolve_all()
+        save.assert_not_called()
+        self.assertEqual([(result['name'], result['runtime'], result['error'])
+                          for result in results],
+                         [('fn_one', 'python3.6', None), ('fn_two', 'python3.6', None)])
+        config = results[1]['config']
+        self.assertEqual(config['script'], Path('fn_two.py').resolve().__str__())
+        self.assertEqual(config['requirements'], Path('fn_two.txt').resolve().__str__())
+        self.assertEqual(config['s3_key'], 'maniple/test/1.0.0/fn_two.zip')
+
+    def test_resolve_all_reports_errors(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        Path(tmp_dir, 'main.tf').write_text(
+            'resource "aws_lambda_function" "no_runtime" {\n'
+            '  handler = "fn.handler"\n}\n'
+            'resource "aws_lambda_function" "no_script" {\n'
+            '  handler = "missing.handler"\n  runtime = "python3.6"\n'
+            '  s3_bucket = "bucket"\n  s3_key = "key"\n}\n')
+        Path(tmp_dir, 'requirements.txt').write_text('')
+        os.chdir(tmp_dir)
+        results = {result['name']: result for result in ConfigLoader.resolve_all()}
+        self.assertIn('runtime', results['no_runtime']['error'])
+        self.assertEqual(results['no_script']['error'],
+                         'Warning: config variable script not set!')
+        with self.assertRaises(ConfigError):
+            ConfigLoader.resolve_all('missing.tf')
+
+    def test_resolve_all_from_directory(self):
+        os.chdir(self.file_dir.joinpath('tf_test', 'basic_multiple'))
+        with mock.patch.object(ConfigLoader, 'save_config'):
+            results = ConfigLoader.resolve_all('.')
+        self.assertEqual([(result['name'], result['error']) for result in results],
+                         [('fn_one', None), ('fn_two', None)])
+        self.assertEqual(results[1]['config']['s3_bucket'], 'aws-lambda-project-code')
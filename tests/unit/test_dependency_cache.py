@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import time
+
+from click.testing import CliRunner
+from pathlib import Path
+from unittest import TestCase, mock
+from maniplecli.commands.cache import cli as cache
+from maniplecli.util.dependency_cache import DependencyCache
+
+
+class TestDependencyCache(TestCase):
+    def setUp(self):
+        self.runner = CliRunner()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.env = mock.patch.dict(os.environ, {
+            'MANIPLE_CACHE_DIR': os.path.join(self.tmp_dir, 'cache')})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def make_package(self, name, size):
+        package = Path(self.tmp_dir, name)
+        package.joinpath('lib').mkdir(parents=True)
+        package.joinpath('lib', 'data.bin').write_bytes(b'0' * size)
+        return str(package)
+
+    def test_key_ignores_formatting(self):
+        first = DependencyCache.normalize_requirements(
+            'requests==2.21.0\n# comment\n\nBoto3==1.9.73\n')
+        second = DependencyCache.normalize_requirements(
+            'boto3 == 1.9.73  # pinned\nrequests==2.21.0')
+        self.assertEqual(first, second)
+        self.assertEqual(DependencyCache.key(first, 'python3.6', ['install']),
+                         DependencyCache.key(second, 'python3.6', ['install']))
+        self.assertNotEqual(DependencyCache.key(first, 'python3.6', ['install']),
+                            DependencyCache.key(first, 'python3.7', ['install']))
+
+    def test_urls_and_paths_are_kept(self):
+        normalized = DependencyCache.normalize_requirements(
+            'git+https://github.com/Org/Repo.git#egg=Repo&subdirectory=Lib\n'
+            './Local/Pkg  # comment\n')
+        self.assertEqual(normalized.splitlines(), [
+            './Local/Pkg',
+            'git+https://github.com/Org/Repo.git#egg=Repo&subdirectory=Lib'])
+
+    def test_key_follows_included_files(self):
+        Path(self.tmp_dir, 'base.txt').write_text('requests==2.21.0\n')
+        text = '-r base.txt\n--constraint=base.txt\nboto3==1.9.73\n'
+        first = DependencyCache.normalize_requirements(text, self.tmp_dir)
+        Path(self.tmp_dir, 'base.txt').write_text('requests==2.22.0\n')
+        second = DependencyCache.normalize_requirements(text, self.tmp_dir)
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(second.splitlines()), 3)
+
+    def test_store_and_restore(self):
+        package = self.make_package('fn', 10)
+        self.assertFalse(DependencyCache.restore('abc', package))
+        DependencyCache.store('abc', package, 'requirements.txt (python3.6)')
+
+        target = os.path.join(self.tmp_dir, 'other_fn')
+        os.makedirs(target)
+        self.assertTrue(DependencyCache.restore('abc', target))
+        self.assertEqual(Path(target, 'lib', 'data.bin').read_bytes(), b'0' * 10)
+        self.assertEqual(DependencyCache.entries()[0]['hits'], 1)
+
+    def test_evicts_least_recently_used(self):
+        for key in ['old', 'used', 'new']:
+            DependencyCache.store(key, self.make_package(key, 1024), key)
+            time.sleep(0.01)
+        DependencyCache.restore('used', os.path.join(self.tmp_dir, 'restored'))
+        removed = DependencyCache.evict(2 * 1024)
+        self.assertEqual([meta['key'] for meta in removed], ['old'])
+        self.assertEqual([meta['key'] for meta in DependencyCache.entries()],
+                         ['new', 'used'])
+
+    def test_entry_being_restored_is_not_evicted(self):
+        DependencyCache.store('abc', self.make_package('fn', 1024), 'fn')
+        copytree = shutil.copytree
+
+        def evict_while_copying(*args, **kwargs):
+            self.assertEqual(DependencyCache.evict(0), [])
+            return copytree(*args, **kwargs)
+
+        target = os.path.join(self.tmp_dir, 'restored')
+        with mock.patch('maniplecli.util.dependency_cache.shutil.copytree',
+                        side_effect=evict_while_copying):
+            self.assertTrue(DependencyCache.restore('abc', target))
+        self.assertEqual(Path(target, 'lib', 'data.bin').read_bytes(), b'0' * 1024)
+        self.assertEqual([meta['key'] for meta in DependencyCache.evict(0)], ['abc'])
+        self.assertEqual(os.listdir(DependencyCache.cache_dir()), [])
+
+    def test_cache_command(self):
+        DependencyCache.store('abc', self.make_package('fn', 1024), 'fn')
+        result = self.runner.invoke(cache, ['-l'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('1 entries', result.output)
+        result = self.runner.invoke(cache, ['-p', '-m', '0'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(DependencyCache.entries(), [])
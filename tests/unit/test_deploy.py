@@ -1,10 +1,14 @@
 import os
+import shutil
+import tempfile
+import threading
 import time
 
 from click.testing import CliRunner
 from pathlib import Path
-from unittest import TestCase
-from maniplecli.commands.deploy import cli as deploy
+from unittest import TestCase, mock
+from maniplecli.commands.deploy import (cli as deploy, _deploy_all,
+                                        _install_shared_dependencies, _plan)
 from maniplecli.commands.config import cli as con
 from maniplecli.util.shell import Shell
 
@@ -42,3 +46,178 @@ class TestDeployCommand(TestCase):
         self.runner.invoke(con, ['-c'], input='y')        
         result = self.runner.invoke(deploy, ['-n', '--target module.mod_basic'])
         self.assertEquals(result.exit_code, 0)
+
+
+class TestDeployAll(TestCase):
+    def setUp(self):
+        self.functions = [({'name': name, 'script': name + '.py',
+                            'requirements': None, 'package': name,
+                            's3_bucket': 'bucket', 's3_key': name + '.zip'},
+                           'python3.6')
+                          for name in ['a', 'b', 'c', 'd']]
+        self.fingerprints = {name: {'script': name} for name in ['a', 'b', 'c', 'd']}
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.state_path = os.path.join(self.tmp_dir, '.maniple', 'deploy_state.json')
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.update_failing = None
+        self.errors = []
+
+    def fake_create_package(self, script, requirements, package, *args, **options):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.1)
+        with self.lock:
+            self.running -= 1
+        if package == self.failing:
+            raise SystemExit(1)
+
+    def fake_wait(self, names):
+        self.waited = names
+        return {name: {'status': 'Failed' if name == self.update_failing else 'Successful',
+                       'seconds': 0.0, 'reason': None}
+                for name in names}
+
+    def deploy_all(self, jobs, force=False, fail='b', exit_code=1, apply_flag=False):
+        self.failing = fail
+        addresses = {'a': 'aws_lambda_function.a', 'b': 'module.b',
+                     'c': 'aws_lambda_function.c', 'd': 'aws_lambda_function.d'}
+        with mock.patch('maniplecli.commands.deploy._load_functions',
+                        return_value=(self.functions, self.errors)), \
+                mock.patch('maniplecli.commands.deploy._fingerprints',
+                           side_effect=lambda *args: dict(self.fingerprints)), \
+                mock.patch('maniplecli.commands.deploy.package_digest',
+                           return_value='digest'), \
+                mock.patch('maniplecli.util.deploy_state.DeployState.path',
+                           return_value=self.state_path), \
+                mock.patch('maniplecli.commands.deploy.create_package_fn',
+                           side_effect=self.fake_create_package), \
+                mock.patch('maniplecli.commands.deploy._upload_and_update',
+                           side_effect=lambda config, *args: config['name'] != 'c') as update, \
+                mock.patch('maniplecli.commands.deploy.wait_for_updates_fn',
+                           side_effect=self.fake_wait), \
+                mock.patch('maniplecli.commands.deploy._upload', return_value=True), \
+                mock.patch('maniplecli.commands.deploy._terraform_addresses',
+                           return_value=addresses), \
+                mock.patch('maniplecli.commands.deploy.Shell.run',
+                           return_value=(0, b'', b'')) as self.shell, \
+                mock.patch('maniplecli.commands.deploy._print_summary') as summary:
+            options = {'jobs': jobs, 'parallelism': 20}
+            if exit_code is None:
+                _deploy_all(apply_flag, 'main.tf', None, options, force)
+            else:
+                with self.assertRaises(SystemExit) as e:
+                    _deploy_all(apply_flag, 'main.tf', None, options, force)
+                self.assertEqual(e.exception.code, exit_code)
+        return update, summary.call_args[0][0]
+
+    def test_failure_does_not_stop_other_functions(self):
+        update, results = self.deploy_all(jobs=4)
+        self.assertEqual([(name, status) for name, status, seconds, error in results],
+                         [('a', 'updated'), ('b', 'failed'),
+                          ('c', 'unchanged'), ('d', 'updated')])
+        self.assertEqual(sorted(call[0][0]['name'] for call in update.call_args_list),
+                         ['a', 'c', 'd'])
+        self.assertEqual(self.max_running, 4)
+
+    def test_failed_update_is_reported(self):
+        self.update_failing = 'd'
+        update, results = self.deploy_all(jobs=2, fail=None)
+        self.assertEqual(self.waited, ['a', 'b', 'd'])
+        self.assertEqual([(name, status) for name, status, seconds, error in results],
+                         [('a', 'updated'), ('b', 'updated'),
+                          ('c', 'unchanged'), ('d', 'failed')])
+        # The failed function is deployed again next time
+        update, results = self.deploy_all(jobs=2, fail=None)
+        self.assertEqual([status for name, status, seconds, error in results],
+                         ['skipped', 'skipped', 'skipped', 'failed'])
+
+    def test_config_errors_are_reported(self):
+        self.errors = [('e', 'Warning: config variable script not set!')]
+        update, results = self.deploy_all(jobs=2, fail=None)
+        self.assertEqual([(name, status) for name, status, seconds, error in results],
+                         [('a', 'updated'), ('b', 'updated'), ('c', 'unchanged'),
+                          ('d', 'updated'), ('e', 'failed')])
+        self.assertEqual(results[-1][3], 'Warning: config variable script not set!')
+
+    def test_jobs_bounds_parallelism(self):
+        self.deploy_all(jobs=2)
+        self.assertEqual(self.max_running, 2)
+
+    def test_unchanged_functions_are_skipped(self):
+        self.deploy_all(jobs=2)
+        update, results = self.deploy_all(jobs=2, fail=None, exit_code=None)
+        self.assertEqual([(name, status) for name, status, seconds, error in results],
+                         [('a', 'skipped'), ('b', 'updated'),
+                          ('c', 'skipped'), ('d', 'skipped')])
+
+        self.fingerprints['c'] = {'script': 'changed'}
+        update, results = self.deploy_all(jobs=2, fail=None, exit_code=None)
+        self.assertEqual([status for name, status, seconds, error in results],
+                         ['skipped', 'skipped', 'unchanged', 'skipped'])
+
+        update, results = self.deploy_all(jobs=2, force=True, fail=None, exit_code=None)
+        self.assertEqual([status for name, status, seconds, error in results],
+                         ['updated', 'updated', 'unchanged', 'updated'])
+
+    def test_apply_targets_changed_functions(self):
+        self.deploy_all(jobs=2, fail=None, exit_code=None)
+        self.fingerprints['b'] = {'script': 'changed'}
+        self.fingerprints['d'] = {'script': 'changed'}
+        update, results = self.deploy_all(jobs=2, fail=None, exit_code=None,
+                                          apply_flag=True)
+        self.assertEqual([status for name, status, seconds, error in results],
+                         ['skipped', 'uploaded', 'skipped', 'uploaded'])
+        self.assertEqual(self.shell.call_args_list[-1][0][0],
+                         ['terraform', 'apply', '-auto-approve',
+                          '-target=module.b', '-target=aws_lambda_function.d',
+                          '-parallelism=20'])
+
+    def test_plan_makes_no_calls(self):
+        self.deploy_all(jobs=2, fail=None, exit_code=None)
+        self.fingerprints['b'] = {'script': 'changed'}
+        addresses = {'a': 'aws_lambda_function.a', 'b': 'module.b',
+                     'c': 'aws_lambda_function.c', 'd': 'aws_lambda_function.d'}
+        with mock.patch('maniplecli.commands.deploy._load_functions',
+                        return_value=(self.functions, self.errors)), \
+                mock.patch('maniplecli.commands.deploy._fingerprints',
+                           side_effect=lambda *args: dict(self.fingerprints)), \
+                mock.patch('maniplecli.util.deploy_state.DeployState.path',
+                           return_value=self.state_path), \
+                mock.patch('maniplecli.commands.deploy._terraform_addresses',
+                           return_value=addresses), \
+                mock.patch('maniplecli.util.aws_clients.AwsClients.client', side_effect=AssertionError), \
+                mock.patch('maniplecli.commands.deploy.Shell.run',
+                           side_effect=AssertionError):
+            plan = _plan(True, 'main.tf', {'jobs': 2}, json_output=True)
+        self.assertEqual([(row['function'], row['action']) for row in plan['functions']],
+                         [('a', 'skip'), ('b', 'deploy'), ('c', 'skip'), ('d', 'skip')])
+        row = plan['functions'][1]
+        self.assertEqual(row['changes'], ['script'])
+        self.assertEqual((row['upload'], row['update'], row['apply']),
+                         ('s3', False, 'module.b'))
+        self.assertEqual(plan['summary']['deploy'], 1)
+        self.assertEqual(plan['summary']['unknown_seconds'], 0)
+
+    def test_shared_dependencies_installed_once(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        for name, text in [('shared.txt', 'requests==2.21.0\n'),
+                           ('other.txt', 'boto3==1.9.73\n')]:
+            Path(tmp_dir, name).write_text(text)
+        functions = []
+        for name, requirements in [('a', 'shared.txt'), ('b', 'shared.txt'),
+                                   ('c', 'other.txt')]:
+            functions.append(({'name': name, 'script': name + '.py',
+                               'requirements': os.path.join(tmp_dir, requirements),
+                               'package': os.path.join(tmp_dir, name)},
+                              'python3.6'))
+        with mock.patch('maniplecli.commands.deploy.install_dependencies_fn') as install:
+            shared = _install_shared_dependencies(functions, {}, 2)
+        install.assert_called_once()
+        self.assertEqual(sorted(shared), ['a', 'b'])
+        self.assertEqual(shared['a'], shared['b'])
+        self.assertEqual(install.call_args[0][2], shared['a'])
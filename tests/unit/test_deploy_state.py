@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+from maniplecli.commands.pack.command import script_files
+from maniplecli.util.deploy_state import DeployState
+
+
+class TestDeployState(TestCase):
+    def setUp(self):
+        self.tmp_dir = os.path.realpath(tempfile.mkdtemp())
+        self.script = Path(self.tmp_dir, 'src')
+        self.script.joinpath('lib').mkdir(parents=True)
+        self.script.joinpath('handler.py').write_text('def handler(e, c):\n    pass\n')
+        self.script.joinpath('lib', 'util.py').write_text('x = 1\n')
+        self.requirements = Path(self.tmp_dir, 'requirements.txt')
+        self.requirements.write_text('requests==2.21.0\n')
+        self.config = {'script': str(self.script),
+                       'package': os.path.join(self.tmp_dir, 'build', 'fn'),
+                       'requirements': str(self.requirements),
+                       's3_bucket': 'bucket', 's3_key': 'fn/1.0.0/fn.zip'}
+        self.resource = {'runtime': 'python3.6', 'handler': 'handler.handler'}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def fingerprint(self, runtime='python3.6'):
+        return DeployState.fingerprint(
+            self.config, runtime, self.resource, {'layer': False},
+            script_files(self.config['package'], self.config['script']))
+
+    def test_changes(self):
+        entry = DeployState.record(self.fingerprint(), 'digest')
+        self.assertEqual(DeployState.changes(None, self.fingerprint()), ['new function'])
+        self.assertEqual(DeployState.changes(entry, self.fingerprint()), [])
+
+        self.script.joinpath('lib', 'util.py').write_text('x = 2\n')
+        self.config['s3_key'] = 'fn/1.0.1/fn.zip'
+        self.assertEqual(DeployState.changes(entry, self.fingerprint()),
+                         ['script', 'terraform'])
+
+    def test_project_root_ignores_files_that_are_not_packaged(self):
+        # A handler at the root of the project makes it the script directory
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmp_dir)
+        self.config['script'] = self.tmp_dir
+        entry = DeployState.record(self.fingerprint(), 'digest')
+
+        DeployState.save({'fn': entry})
+        Path(self.tmp_dir, 'terraform.tfstate').write_text('{}')
+        Path(self.tmp_dir, 'node_modules', 'lib').mkdir(parents=True)
+        Path(self.tmp_dir, 'node_modules', 'lib', 'index.js').write_text('')
+        Path(self.tmp_dir, 'build', 'fn').mkdir(parents=True)
+        Path(self.tmp_dir, 'build', 'fn.zip').write_bytes(b'0')
+        self.assertEqual(DeployState.changes(entry, self.fingerprint()), [])
+
+    def test_runtime_changes_requirements(self):
+        first = self.fingerprint()
+        second = self.fingerprint('python3.7')
+        self.assertNotEqual(first['requirements'], second['requirements'])
+        self.assertEqual(first['script'], second['script'])
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+from maniplecli.util.file_index import FileIndex
+
+FILES = [
+    'main.tf',
+    'basic.py',
+    'requirements.txt',
+    'fn_two.txt',
+    'src/app.py',
+    'src/app_test.py',
+    'functions/users/handler.py',
+    'functions/users/requirements.txt',
+    'web/index.js',
+    'web/package.json',
+    'node_modules/lib/index.js',
+    '.terraform/modules/app.py',
+    'vendored/pkg/app.js'
+]
+
+
+class TestFileIndex(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        for name in FILES:
+            Path(self.root, name).parent.mkdir(parents=True, exist_ok=True)
+            Path(self.root, name).write_text('')
+        self.index = FileIndex(self.root)
+        self.index._walk()
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def test_pruned_directories(self):
+        self.assertNotIn(os.path.join('node_modules', 'lib', 'index.js'), self.index.paths)
+        self.assertNotIn(os.path.join('.terraform', 'modules', 'app.py'), self.index.paths)
+        self.assertIn(os.path.join('vendored', 'pkg', 'app.js'), self.index.paths)
+
+    def test_handler_at_root(self):
+        self.assertEqual(self.index.find_handler('basic.handler', 'python3.6'),
+                         (self.path('basic.py'), self.root))
+
+    def test_handler_in_directory(self):
+        self.assertEqual(self.index.find_handler('app.handler', 'python3.6'),
+                         (self.path('src'), self.path('src')))
+        self.assertEqual(self.index.find_handler('index.handler', 'nodejs8.10'),
+                         (self.path('web'), self.path('web')))
+
+    def test_nested_handler_path(self):
+        self.assertEqual(self.index.find_handler('src/app.lambda_handler', 'python3.6'),
+                         (self.path('.', 'src'), self.root))
+        self.assertEqual(self.index.find_handler('users.handler.main', 'python3.6'),
+                         (self.path('functions', '.', 'users'), self.path('functions')))
+        self.assertEqual(self.index.find_handler('pkg/app.handler', 'nodejs8.10'),
+                         (self.path('vendored', '.', 'pkg'), self.path('vendored')))
+        self.assertIsNone(self.index.find_handler('lib/app.handler', 'python3.6'))
+
+    def test_script_root(self):
+        self.assertEqual(FileIndex.script_root(self.path('.', 'src')),
+                         (self.root, self.path('src')))
+        self.assertEqual(FileIndex.script_root(self.path('src')),
+                         (self.path('src'), self.path('src')))
+
+    def test_requirements(self):
+        self.assertEqual(self.index.find_requirements('fn_two', 'python3.6'),
+                         self.path('fn_two.txt'))
+        self.assertEqual(self.index.find_requirements(
+            'users', 'python3.6', self.path('functions', 'users')),
+            self.path('functions', 'users', 'requirements.txt'))
+        self.assertEqual(self.index.find_requirements('app', 'python3.6', self.path('src')),
+                         self.path('requirements.txt'))
+        self.assertEqual(self.index.find_requirements('web', 'nodejs8.10', self.path('web')),
+                         self.path('web', 'package.json'))
+        self.assertIsNone(self.index.find_requirements('go', 'go1.x'))
+
+    def test_walked_once_per_directory(self):
+        FileIndex.clear()
+        self.addCleanup(FileIndex.clear)
+        index = FileIndex.for_directory(self.root)
+        self.assertIs(FileIndex.for_directory(self.root), index)
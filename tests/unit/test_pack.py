@@ -1,10 +1,21 @@
+import base64
+import boto3
+import hashlib
 import os
+import shutil
+import tempfile
 
+from botocore.stub import Stubber
 from click.testing import CliRunner
 from pathlib import Path
-from unittest import TestCase
+from unittest import TestCase, mock
+from zipfile import ZipFile
 from maniplecli.commands.pack import cli as pack
+from maniplecli.commands.pack.command import (_zip_files, create_package_fn,
+                                              deploy_code_fn, publish_layer_fn,
+                                              run_cli, upload_package_fn)
 from maniplecli.commands.config import cli as con
+from maniplecli.util.package_builder import PackageBuilder
 
 # TODO: compare folders with filecmp
 
@@ -70,4 +81,278 @@ class TestPackCommand(TestCase):
         os.chdir(self.file_dir.joinpath('tf_test', 'basic_dir'))        
         self.runner.invoke(con, ['--name', 'basic_dir'])
         result = self.runner.invoke(pack, ['-us'])
-        self.assertEquals(result.exit_code, 0)       
+        self.assertEquals(result.exit_code, 0)
+
+    def test_chunk_size_below_s3_minimum(self):
+        result = self.runner.invoke(pack, ['-up', '--chunk-size', '1'])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('--chunk-size', result.output)
+
+
+class TestScriptDirectory(TestCase):
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        for name in ['src/app.py', 'src/lib/util.py', 'tests/test_app.py', 'README.md',
+                     '.git/HEAD', '.terraform/providers/aws', 'node_modules/lib/index.js',
+                     '.maniple/tf_cache.json', 'main.tf', 'terraform.tfstate',
+                     'requirements.txt', '.env', 'build/fn/requests/__init__.py',
+                     'fn/app.py', 'fn/.config', 'fn/requirements.txt']:
+            Path(self.root, name).parent.mkdir(parents=True, exist_ok=True)
+            Path(self.root, name).write_text('')
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.root)
+        # The package directory of a function may be inside the project
+        self.package = os.path.join(self.root, 'build', 'fn')
+
+    def namelist(self, script):
+        _zip_files(self.package, script)
+        with ZipFile(self.package + '.zip') as zip_:
+            return sorted(zip_.namelist())
+
+    def test_handler_path_only_packages_its_directory(self):
+        self.assertEqual(self.namelist(os.path.join(self.root, '.', 'src')),
+                         ['requests/__init__.py', 'src/app.py', 'src/lib/util.py'])
+
+    def test_project_root_only_packages_the_code(self):
+        self.assertEqual(self.namelist(self.root),
+                         ['README.md', 'fn/app.py', 'requests/__init__.py',
+                          'src/app.py', 'src/lib/util.py', 'tests/test_app.py'])
+
+    def test_script_directory_is_packaged_whole(self):
+        self.assertEqual(self.namelist(os.path.join(self.root, 'fn')),
+                         ['.config', 'app.py', 'requests/__init__.py', 'requirements.txt'])
+
+
+class PackageTestCase(TestCase):
+    """
+    Writes a function script to a temporary directory, builds its package
+    unless build is False and stubs the boto3 client of service.
+    """
+    service = 'lambda'
+    build = True
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.package = os.path.join(self.tmp_dir, 'fn')
+        self.script = os.path.join(self.tmp_dir, 'fn.py')
+        with open(self.script, 'w') as f:
+            f.write('def handler(event, context):\n    return 0\n')
+        if self.build:
+            os.makedirs(self.package)
+            _zip_files(self.package, self.script)
+        self.client = boto3.client(self.service, region_name='us-east-1',
+                                   aws_access_key_id='testing',
+                                   aws_secret_access_key='testing')
+        self.stubber = Stubber(self.client)
+
+    def patch_client(self):
+        return mock.patch('maniplecli.util.aws_clients.AwsClients.client',
+                          return_value=self.client)
+
+
+class TestUploadPackage(PackageTestCase):
+    service = 's3'
+
+    def test_unchanged_package_is_not_uploaded(self):
+        digest = PackageBuilder.load_digest(self.package + '.zip')
+        self.stubber.add_response(
+            'head_object', {'Metadata': {'maniple-digest': digest}},
+            {'Bucket': 'bucket', 'Key': 'fn.zip'})
+        with self.stubber, self.patch_client():
+            self.assertFalse(upload_package_fn('bucket', 'fn.zip', self.package))
+        self.stubber.assert_no_pending_responses()
+
+    def test_changed_package_is_uploaded(self):
+        self.stubber.add_response(
+            'head_object', {'Metadata': {'maniple-digest': 'old'}},
+            {'Bucket': 'bucket', 'Key': 'fn.zip'})
+        with self.stubber, self.patch_client(), \
+                mock.patch.object(self.client, 'upload_file') as upload_file:
+            self.assertTrue(upload_package_fn('bucket', 'fn.zip', self.package))
+        upload_file.assert_called_once()
+        metadata = upload_file.call_args[1]['ExtraArgs']['Metadata']
+        self.assertNotEqual(metadata['maniple-digest'], 'old')
+
+    def test_relative_package_uploads_the_built_zip(self):
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmp_dir)
+        self.stubber.add_response(
+            'head_object', {'Metadata': {}}, {'Bucket': 'bucket', 'Key': 'fn.zip'})
+        with self.stubber, self.patch_client(), \
+                mock.patch.object(self.client, 'upload_file') as upload_file:
+            self.assertTrue(upload_package_fn('bucket', 'fn.zip', 'fn'))
+        self.assertEqual(upload_file.call_args[0][0], 'fn.zip')
+
+
+class TestDeployCode(PackageTestCase):
+    def setUp(self):
+        super().setUp()
+        with open(self.package + '.zip', 'rb') as f:
+            self.data = f.read()
+
+    def deploy_code(self, upload_mode='direct', uploaded=True):
+        with self.stubber, self.patch_client(), \
+                mock.patch('maniplecli.commands.pack.command.upload_package_fn',
+                           return_value=uploaded) as upload, \
+                mock.patch('maniplecli.commands.pack.command.update_function_fn',
+                           return_value=True) as update:
+            updated = deploy_code_fn('fn', 'bucket', 'fn.zip', self.package,
+                                     upload_mode=upload_mode)
+        self.stubber.assert_no_pending_responses()
+        return updated, upload, update
+
+    def test_small_package_is_sent_directly(self):
+        self.stubber.add_response('get_function_configuration',
+                                  {'CodeSha256': 'old'}, {'FunctionName': 'fn'})
+        self.stubber.add_response('update_function_code', {},
+                                  {'FunctionName': 'fn', 'ZipFile': self.data})
+        updated, upload, update = self.deploy_code()
+        self.assertTrue(updated)
+        upload.assert_not_called()
+        update.assert_not_called()
+
+    def test_unchanged_code_is_not_sent(self):
+        sha = base64.b64encode(hashlib.sha256(self.data).digest()).decode('utf-8')
+        self.stubber.add_response('get_function_configuration',
+                                  {'CodeSha256': sha}, {'FunctionName': 'fn'})
+        updated, upload, update = self.deploy_code()
+        self.assertFalse(updated)
+
+    def function_runs(self, code_sha256):
+        self.stubber.add_response('get_function_configuration',
+                                  {'CodeSha256': code_sha256}, {'FunctionName': 'fn'})
+
+    def test_large_package_goes_through_s3(self):
+        self.function_runs('old')
+        with mock.patch('maniplecli.commands.pack.command.DIRECT_UPLOAD_LIMIT', 0):
+            updated, upload, update = self.deploy_code()
+        self.assertTrue(updated)
+        upload.assert_called_once_with('bucket', 'fn.zip', self.package, None)
+        update.assert_called_once_with('fn', 'bucket', 'fn.zip')
+
+    def test_s3_mode(self):
+        self.function_runs('old')
+        updated, upload, update = self.deploy_code('s3')
+        upload.assert_called_once()
+        update.assert_called_once()
+
+    def test_function_is_updated_when_s3_is_unchanged(self):
+        # e.g. the update after the last upload failed
+        self.function_runs('old')
+        updated, upload, update = self.deploy_code('s3', uploaded=False)
+        self.assertTrue(updated)
+        update.assert_called_once_with('fn', 'bucket', 'fn.zip')
+
+    def test_function_running_the_package_is_not_updated(self):
+        self.function_runs(base64.b64encode(hashlib.sha256(self.data).digest()).decode('utf-8'))
+        updated, upload, update = self.deploy_code('s3')
+        self.assertFalse(updated)
+        upload.assert_called_once()
+        update.assert_not_called()
+
+    def test_upload_package_always_goes_to_s3(self):
+        config = {'name': 'fn', 's3_bucket': 'bucket', 's3_key': 'fn.zip',
+                  'package': self.package, 'script': self.script}
+        self.function_runs('old')
+        with self.stubber, self.patch_client(), \
+                mock.patch('maniplecli.util.config_loader.ConfigLoader.add_defaults',
+                           return_value=config), \
+                mock.patch('maniplecli.util.config_loader.ConfigLoader.load_config'), \
+                mock.patch('maniplecli.commands.pack.command.upload_package_fn',
+                           return_value=True) as upload, \
+                mock.patch('maniplecli.commands.pack.command.update_function_fn',
+                           return_value=True) as update, \
+                mock.patch('maniplecli.commands.pack.command._update_function_direct') as direct:
+            with self.assertRaises(SystemExit):
+                run_cli(False, False, False, True, False, True)
+        upload.assert_called_once()
+        update.assert_called_once_with('fn', 'bucket', 'fn.zip')
+        direct.assert_not_called()
+
+
+class TestLayer(PackageTestCase):
+    build = False
+
+    def setUp(self):
+        super().setUp()
+        self.layer_arn = 'arn:aws:lambda:us-east-1:123456789012:layer:fn-dependencies'
+
+    def fake_download(self, script, requirements, package, runtime=None):
+        Path(package, 'requests').mkdir()
+        Path(package, 'requests', '__init__.py').write_text('# requests\n')
+
+    def create_package(self, runtime='python3.6'):
+        with mock.patch('maniplecli.util.package_downloader.PackageDownloader.download_packages',
+                        side_effect=self.fake_download), \
+                mock.patch('maniplecli.util.config_loader.ConfigLoader.get_runtime',
+                           return_value=runtime):
+            create_package_fn(self.script, 'requirements.txt', self.package, layer=True)
+
+    def test_dependencies_go_to_layer(self):
+        self.create_package()
+        with ZipFile(self.package + '.zip') as zip_:
+            self.assertEqual(zip_.namelist(), ['fn.py'])
+        with ZipFile(self.package + '-layer.zip') as zip_:
+            self.assertEqual(zip_.namelist(), ['python/requests/__init__.py'])
+
+    def test_shared_dependencies_are_linked(self):
+        dependencies = os.path.join(self.tmp_dir, 'shared')
+        os.makedirs(dependencies)
+        self.fake_download(None, None, dependencies)
+        create_package_fn(self.script, 'requirements.txt', self.package,
+                          runtime='python3.6', dependencies=dependencies)
+        with ZipFile(self.package + '.zip') as zip_:
+            self.assertEqual(zip_.namelist(), ['fn.py', 'requests/__init__.py'])
+        self.assertTrue(os.path.samefile(
+            os.path.join(dependencies, 'requests', '__init__.py'),
+            os.path.join(self.package, 'requests', '__init__.py')))
+
+    def test_node_layer_layout(self):
+        self.create_package('nodejs8.10')
+        with ZipFile(self.package + '-layer.zip') as zip_:
+            self.assertEqual(zip_.namelist(), ['nodejs/requests/__init__.py'])
+
+    def publish_layer(self, terraform_layers):
+        self.create_package()
+        digest = PackageBuilder.load_digest(self.package + '-layer.zip')
+        self.stubber.add_response(
+            'list_layer_versions',
+            {'LayerVersions': [{'LayerVersionArn': self.layer_arn + ':3',
+                                'Version': 3,
+                                'Description': 'maniple:' + digest}]},
+            {'LayerName': 'fn-dependencies', 'MaxItems': 1})
+        self.stubber.add_response(
+            'get_function_configuration',
+            {'Layers': [{'Arn': self.layer_arn + ':2'},
+                        {'Arn': 'arn:aws:lambda:us-east-1:123456789012:layer:other:1'}]},
+            {'FunctionName': 'fn'})
+        self.stubber.add_response(
+            'update_function_configuration', {},
+            {'FunctionName': 'fn',
+             'Layers': ['arn:aws:lambda:us-east-1:123456789012:layer:other:1',
+                        self.layer_arn + ':3']})
+        self.stubber.add_response(
+            'get_function_configuration', {'LastUpdateStatus': 'Successful'},
+            {'FunctionName': 'fn'})
+        with self.stubber, self.patch_client(), \
+                mock.patch('maniplecli.commands.pack.command.upload_package_fn') as upload, \
+                mock.patch('maniplecli.commands.pack.command._terraform_layers',
+                           return_value=terraform_layers), \
+                mock.patch('maniplecli.commands.pack.command.click.secho') as secho:
+            arn = publish_layer_fn('fn', 'bucket', 'fn.zip', self.package, tf_file='main.tf')
+        self.stubber.assert_no_pending_responses()
+        return arn, upload, [call[0][0] for call in secho.call_args_list]
+
+    def test_unchanged_layer_is_not_published(self):
+        arn, upload, messages = self.publish_layer(
+            ['${data.aws_lambda_layer_version.fn_dependencies.arn}'])
+        self.assertEqual(arn, self.layer_arn + ':3')
+        upload.assert_not_called()
+        self.assertFalse(any('terraform apply' in message for message in messages))
+
+    def test_layer_missing_from_terraform_is_reported(self):
+        arn, upload, messages = self.publish_layer(None)
+        self.assertIn('The terraform resource of fn has no layers, the next terraform '
+                      'apply detaches {}:3.'.format(self.layer_arn), messages[-1])
@@ -0,0 +1,54 @@
+import json
+import os
+import shutil
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase, mock
+from maniplecli.commands.pack.command import analyze_package_fn
+from maniplecli.util.package_analyzer import PackageAnalyzer, UNZIPPED_LIMIT
+from maniplecli.util.package_builder import PackageBuilder
+
+
+class TestPackageAnalyzer(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.package = os.path.join(self.tmp_dir, 'fn')
+        files = []
+        for name, data in [('requests/__init__.py', b'a = 1\n' * 1000),
+                           ('requests/api.py', b'b = 2\n' * 10),
+                           ('numpy/core.so', os.urandom(5000)),
+                           ('handler.py', b'pass\n')]:
+            path = Path(self.package, name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            files.append((str(path), name))
+        PackageBuilder.build(files, self.package + '.zip')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_analyze(self):
+        report = PackageAnalyzer.analyze(self.package + '.zip')
+        self.assertEqual(report['unzipped'], 6000 + 60 + 5000 + 5)
+        self.assertEqual(report['files'], 4)
+        packages = {row['name']: row for row in report['packages']}
+        self.assertEqual(packages['requests']['unzipped'], 6060)
+        self.assertEqual(packages['requests']['files'], 2)
+        self.assertTrue(packages['requests']['ratio'] < 0.1)
+        self.assertEqual([row['name'] for row in report['extensions']], ['.py', '.so'])
+        self.assertEqual(report['largest_files'][0]['name'], 'requests/__init__.py')
+        self.assertEqual(report['headroom']['unzipped'], UNZIPPED_LIMIT - 11065)
+
+    def test_budget(self):
+        report = PackageAnalyzer.analyze(self.package + '.zip')
+        self.assertEqual(PackageAnalyzer.over_limits(report), [])
+        self.assertEqual(len(PackageAnalyzer.over_limits(report, budget=1000)), 1)
+
+    def test_json_output_fails_over_budget(self):
+        with mock.patch('click.echo') as echo, self.assertRaises(SystemExit) as e:
+            analyze_package_fn(self.package, json_output=True, budget=0.001)
+        self.assertEqual(e.exception.code, 1)
+        report = json.loads(echo.call_args[0][0])
+        self.assertEqual(report['files'], 4)
+        self.assertEqual(len(report['errors']), 1)
@@ -0,0 +1,153 @@
+import io
+import os
+import shutil
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase, mock
+from zipfile import ZipFile
+from maniplecli.util.package_builder import PackageBuilder
+
+
+class UnseekableWriter():
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+    def tell(self):
+        return len(self.data)
+
+    def seek(self, offset, whence=0):
+        raise OSError('seek')
+
+    def flush(self):
+        pass
+
+
+class TestPackageBuilder(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src = Path(self.tmp_dir, 'src')
+        self.src.joinpath('lib').mkdir(parents=True)
+        self.src.joinpath('lib', 'big.py').write_text('x = 1\n' * 10000)
+        self.src.joinpath('lib', 'small.py').write_text('y = 2\n')
+        self.src.joinpath('handler.py').write_text('def handler(e, c):\n    pass\n')
+        self.zip_path = os.path.join(self.tmp_dir, 'package.zip')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def get_files(self):
+        return [(str(f), f.relative_to(self.src).as_posix())
+                for f in sorted(self.src.rglob('*')) if f.is_file()]
+
+    def read_zip(self):
+        with ZipFile(self.zip_path) as zip_:
+            self.assertIsNone(zip_.testzip())
+            return {name: zip_.read(name) for name in zip_.namelist()}
+
+    def test_first_build_compresses_everything(self):
+        stats = PackageBuilder.build(self.get_files(), self.zip_path)
+        self.assertEqual((stats['reused'], stats['compressed']), (0, 3))
+        contents = self.read_zip()
+        self.assertEqual(contents['lib/small.py'], b'y = 2\n')
+        self.assertTrue(Path(PackageBuilder.manifest_path(self.zip_path)).exists())
+
+    def test_rebuild_reuses_unchanged_files(self):
+        PackageBuilder.build(self.get_files(), self.zip_path)
+        self.src.joinpath('handler.py').write_text('def handler(e, c):\n    return 1\n')
+        stats = PackageBuilder.build(self.get_files(), self.zip_path)
+        self.assertEqual((stats['reused'], stats['compressed']), (2, 1))
+        contents = self.read_zip()
+        self.assertEqual(contents['handler.py'],
+                         b'def handler(e, c):\n    return 1\n')
+        self.assertEqual(contents['lib/big.py'], b'x = 1\n' * 10000)
+
+    def test_touched_file_with_same_content_is_reused(self):
+        PackageBuilder.build(self.get_files(), self.zip_path)
+        big = self.src.joinpath('lib', 'big.py')
+        os.utime(big, (0, 0))
+        stats = PackageBuilder.build(self.get_files(), self.zip_path)
+        self.assertEqual((stats['reused'], stats['compressed']), (3, 0))
+
+    def test_missing_zip_rebuilds(self):
+        PackageBuilder.build(self.get_files(), self.zip_path)
+        os.remove(self.zip_path)
+        stats = PackageBuilder.build(self.get_files(), self.zip_path)
+        self.assertEqual((stats['reused'], stats['compressed']), (0, 3))
+
+    def test_parallel_build_matches_serial_build(self):
+        PackageBuilder.build(self.get_files(), self.zip_path, jobs=1)
+        with open(self.zip_path, 'rb') as f:
+            serial = f.read()
+        os.remove(self.zip_path)
+        stats = PackageBuilder.build(self.get_files(), self.zip_path, jobs=4)
+        self.assertEqual((stats['reused'], stats['compressed']), (0, 3))
+        with open(self.zip_path, 'rb') as f:
+            self.assertEqual(f.read(), serial)
+
+    def test_build_is_reproducible(self):
+        first = PackageBuilder.build(self.get_files(), self.zip_path)
+        with open(self.zip_path, 'rb') as f:
+            first_zip = f.read()
+        os.remove(self.zip_path)
+        os.remove(PackageBuilder.manifest_path(self.zip_path))
+        for abs_name, arc_name in self.get_files():
+            os.utime(abs_name, (1000, 1000))
+        second = PackageBuilder.build(list(reversed(self.get_files())),
+                                      self.zip_path)
+        self.assertEqual(first['digest'], second['digest'])
+        self.assertEqual(PackageBuilder.load_digest(self.zip_path),
+                         second['digest'])
+        with open(self.zip_path, 'rb') as f:
+            self.assertEqual(f.read(), first_zip)
+        with ZipFile(self.zip_path) as zip_:
+            self.assertEqual(zip_.namelist(), sorted(zip_.namelist()))
+            for info in zip_.infolist():
+                self.assertEqual(info.date_time, (1980, 1, 1, 0, 0, 0))
+                self.assertEqual(info.external_attr >> 16, 0o100644)
+
+    def test_digest_changes_with_content(self):
+        first = PackageBuilder.build(self.get_files(), self.zip_path)
+        self.src.joinpath('lib', 'small.py').write_text('y = 3\n')
+        second = PackageBuilder.build(self.get_files(), self.zip_path)
+        self.assertNotEqual(first['digest'], second['digest'])
+
+    def test_stream_build_matches_disk_build(self):
+        PackageBuilder.build(self.get_files(), self.zip_path)
+        manifest = Path(PackageBuilder.manifest_path(self.zip_path)).read_text()
+        self.src.joinpath('handler.py').write_text('def handler(e, c):\n    return 1\n')
+        digest = PackageBuilder.scan(self.get_files(), self.zip_path)
+
+        writer = UnseekableWriter()
+        stats = PackageBuilder.build(self.get_files(), self.zip_path, 2, writer)
+        self.assertEqual((stats['reused'], stats['compressed']), (2, 1))
+        self.assertEqual(stats['digest'], digest)
+        self.assertEqual(Path(PackageBuilder.manifest_path(self.zip_path)).read_text(),
+                         manifest)
+
+        PackageBuilder.build(self.get_files(), self.zip_path)
+        self.assertEqual(bytes(writer.data), Path(self.zip_path).read_bytes())
+
+    def test_large_files_are_streamed_in_chunks(self):
+        disk = PackageBuilder.build(self.get_files(), self.zip_path)
+        expected = self.read_zip()
+        os.remove(self.zip_path)
+
+        writer = UnseekableWriter()
+        with mock.patch('maniplecli.util.package_builder.CHUNK_SIZE', 1024), \
+                mock.patch('maniplecli.util.package_builder.STREAM_IN_CHUNKS_SIZE', 4096), \
+                mock.patch.object(PackageBuilder, '_compress_file',
+                                  wraps=PackageBuilder._compress_file) as compress:
+            stats = PackageBuilder.build(self.get_files(), self.zip_path, 2, writer)
+        compressed = sorted(os.path.basename(call[0][0]) for call in compress.call_args_list)
+        self.assertEqual(compressed, ['handler.py', 'small.py'])
+        self.assertEqual(stats['digest'], disk['digest'])
+        with ZipFile(io.BytesIO(bytes(writer.data))) as zip_:
+            self.assertIsNone(zip_.testzip())
+            self.assertEqual({name: zip_.read(name) for name in zip_.namelist()},
+                             expected)
+
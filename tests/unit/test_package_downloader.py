@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase, mock
+from maniplecli.util.package_downloader import PackageDownloader
+
+
+class TestPackageDownloader(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.requirements = os.path.join(self.tmp_dir, 'requirements.txt')
+        with open(self.requirements, 'w') as f:
+            f.write('colorama==0.4.1\npsycopg2==2.7.6.1\nrequests\n')
+        self.package = os.path.join(self.tmp_dir, 'package')
+        os.makedirs(self.package)
+        self.env = mock.patch.dict(os.environ, {
+            'MANIPLE_CACHE_DIR': os.path.join(self.tmp_dir, 'cache')})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def fake_pip(self, cmd, pwd):
+        with open(cmd[-1]) as f:
+            self.pip_requirements.append(f.read().split())
+        return 0, b'', b''
+
+    def test_single_pip_process_for_remaining_requirements(self):
+        self.pip_requirements = []
+        replaced = lambda name: '/lambda_packages/psycopg2.tar.gz' \
+            if name == 'psycopg2' else None
+        with mock.patch('maniplecli.util.shell.Shell.run', side_effect=self.fake_pip) as run, \
+                mock.patch.object(PackageDownloader, '_check_for_packages_to_replace',
+                                  side_effect=replaced), \
+                mock.patch.object(PackageDownloader, '_unzip_package') as unzip:
+            PackageDownloader._handle_python_packages(
+                None, self.requirements, self.package, 'python3.6')
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(self.pip_requirements, [['colorama==0.4.1', 'requests']])
+        unzip.assert_called_once_with(Path('/lambda_packages/psycopg2.tar.gz'),
+                                      self.package)
+        self.assertEqual(os.listdir(self.tmp_dir).count('requirements.txt'), 1)
+        self.assertEqual([f for f in os.listdir(self.tmp_dir) if f.startswith('.maniple-')], [])
+
+    def test_cache_hit_skips_pip(self):
+        with mock.patch('maniplecli.util.shell.Shell.run', return_value=(0, b'', b'')) as run, \
+                mock.patch.object(PackageDownloader, '_check_for_packages_to_replace',
+                                  return_value=None):
+            PackageDownloader._handle_python_packages(
+                None, self.requirements, self.package, 'python3.6')
+            PackageDownloader._handle_python_packages(
+                None, self.requirements, self.package, 'python3.6')
+        self.assertEqual(run.call_count, 1)
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase, mock
+from maniplecli.util.package_slimmer import PackageSlimmer
+
+
+class TestPackageSlimmer(TestCase):
+    def setUp(self):
+        self.package = tempfile.mkdtemp()
+        for name, size in [('requests/__init__.py', 100),
+                           ('requests/__pycache__/api.cpython-36.pyc', 50),
+                           ('requests/tests/test_api.py', 70),
+                           ('requests.egg-info/entry_points.txt', 5),
+                           ('requests-2.21.0.dist-info/RECORD', 30),
+                           ('requests-2.21.0.dist-info/METADATA', 20),
+                           ('README.md', 10)]:
+            path = Path(self.package, name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b'0' * size)
+
+    def tearDown(self):
+        shutil.rmtree(self.package)
+
+    def remaining(self):
+        files = []
+        for dirname, subdirs, filenames in os.walk(self.package):
+            for filename in filenames:
+                files.append(os.path.relpath(os.path.join(dirname, filename),
+                                             self.package).replace(os.sep, '/'))
+        return sorted(files)
+
+    def test_matches(self):
+        self.assertTrue(PackageSlimmer.matches('a/b/__pycache__', ['__pycache__']))
+        self.assertTrue(PackageSlimmer.matches('x.dist-info/RECORD', ['*.dist-info/RECORD']))
+        self.assertTrue(PackageSlimmer.matches('lib/x.dist-info/RECORD', ['*.dist-info/RECORD']))
+        self.assertFalse(PackageSlimmer.matches('testsuite/a.py', ['tests']))
+        self.assertFalse(PackageSlimmer.matches('x.dist-info/METADATA', ['*.dist-info/RECORD']))
+
+    def test_slim_removes_excluded_files(self):
+        with mock.patch('shutil.which', return_value=None):
+            report = PackageSlimmer.slim(self.package, ['*.md', 'tests'])
+        self.assertEqual(self.remaining(), ['requests-2.21.0.dist-info/METADATA',
+                                            'requests.egg-info/entry_points.txt',
+                                            'requests/__init__.py'])
+        self.assertEqual(report['requests'], (220, 100))
+        self.assertEqual(report['requests-2.21.0.dist-info'], (50, 20))
+        self.assertEqual(report['README.md'], (10, 0))
+
+    def test_defaults_keep_runtime_files(self):
+        with mock.patch('shutil.which', return_value=None):
+            PackageSlimmer.slim(self.package)
+        self.assertEqual(self.remaining(), ['README.md',
+                                            'requests-2.21.0.dist-info/METADATA',
+                                            'requests.egg-info/entry_points.txt',
+                                            'requests/__init__.py',
+                                            'requests/tests/test_api.py'])
+
+    def test_report_sizes(self):
+        with mock.patch('click.echo') as echo, mock.patch('click.secho') as secho:
+            PackageSlimmer.print_report({'requests': (3 * 1024 * 1024, 512)})
+        self.assertIn('3.00 MB', echo.call_args[0][0])
+        self.assertIn('0.5 KB', echo.call_args[0][0])
+        self.assertIn('3.00 MB', secho.call_args[0][0])
+
+    def test_strips_shared_objects(self):
+        Path(self.package, 'requests', 'speedups.so').write_bytes(b'\x7fELF' + b'0' * 10)
+        Path(self.package, 'requests', 'notes.so.txt').write_bytes(b'text')
+        with mock.patch('shutil.which', return_value='/usr/bin/strip'), \
+                mock.patch('maniplecli.util.shell.Shell.run',
+                           return_value=(0, b'', b'')) as run:
+            PackageSlimmer.slim(self.package)
+        run.assert_called_once()
+        self.assertEqual(run.call_args[0][0],
+                         ['/usr/bin/strip', '--strip-unneeded',
+                          os.path.join(self.package, 'requests', 'speedups.so')])
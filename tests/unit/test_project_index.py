@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase, mock
+from maniplecli.util.project_index import ProjectIndex
+from maniplecli.util.tf_cache import TerraformCache
+
+ROOT_TF = """
+resource "aws_lambda_function" "root_fn" {
+  function_name = "root_fn"
+  handler = "root_fn.handler"
+}
+
+module "outer" {
+  source = "./outer"
+  prefix = "app"
+}
+
+module "pair" {
+  source = "./pair"
+  first = "fn_one"
+  second = "fn_two"
+}
+"""
+
+OUTER_TF = """
+variable "prefix" {}
+
+variable "timeout" {
+  default = 30
+}
+
+module "inner" {
+  source = "./inner"
+  inner_name = "inner"
+  handler = "${var.prefix}.handler"
+  timeout = "${var.timeout}"
+}
+"""
+
+INNER_TF = """
+resource "aws_lambda_function" "fn" {
+  function_name = "${var.inner_name}"
+  handler = "${var.handler}"
+  timeout = "${var.timeout}"
+}
+"""
+
+PAIR_TF = """
+resource "aws_lambda_function" "one" {
+  function_name = "${var.first}"
+}
+
+resource "aws_lambda_function" "two" {
+  function_name = "${var.second}"
+}
+"""
+
+
+class TestProjectIndex(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        for path, text in [('main.tf', ROOT_TF), ('outer/main.tf', OUTER_TF),
+                           ('outer/inner/main.tf', INNER_TF),
+                           ('pair/main.tf', PAIR_TF)]:
+            Path(self.tmp_dir, path).parent.mkdir(parents=True, exist_ok=True)
+            Path(self.tmp_dir, path).write_text(text)
+        self.path = mock.patch.object(
+            TerraformCache, 'cache_path',
+            return_value=os.path.join(self.tmp_dir, '.maniple', 'tf_cache.json'))
+        self.path.start()
+        self.addCleanup(self.path.stop)
+        TerraformCache.entries = None
+        self.tf = TerraformCache.load(os.path.join(self.tmp_dir, 'main.tf'))
+
+    def test_nested_module_variables(self):
+        index = ProjectIndex.build(self.tf, self.tmp_dir)
+        entry = index.get('inner')
+        self.assertEqual(entry['address'], 'module.outer.module.inner')
+        self.assertEqual(entry['source'], os.path.join(self.tmp_dir, 'outer', 'inner'))
+        self.assertEqual(index.attributes('inner'),
+                         {'function_name': 'inner', 'handler': 'app.handler',
+                          'timeout': 30})
+
+    def test_module_split_across_files(self):
+        first, second = PAIR_TF.split('\n\n')
+        Path(self.tmp_dir, 'pair/main.tf').write_text(first)
+        Path(self.tmp_dir, 'pair/two.tf').write_text(second)
+        index = ProjectIndex.build(self.tf, self.tmp_dir)
+        self.assertEqual(index.get('fn_two')['file'],
+                         os.path.join(self.tmp_dir, 'pair', 'two.tf'))
+        self.assertEqual(index.get('root_fn')['file'], os.path.join(self.tmp_dir, 'main.tf'))
+
+    def test_module_with_many_functions(self):
+        index = ProjectIndex.build(self.tf, self.tmp_dir)
+        self.assertEqual(index.get('fn_two')['address'],
+                         'module.pair.aws_lambda_function.two')
+        self.assertIsNone(index.get('pair'))
+        self.assertEqual(index.possible_resources(),
+                         [(1, 'inner', 'module'), (2, 'fn_one', 'module'),
+                          (3, 'fn_two', 'module'), (4, 'root_fn', 'resource')])
+
+    def test_missing_module_source(self):
+        self.tf['module']['gone'] = {'source': './gone'}
+        index = ProjectIndex.build(self.tf, self.tmp_dir)
+        self.assertEqual(index.missing,
+                         [('gone', os.path.join(self.tmp_dir, 'gone'))])
+
+    def test_index_reused_until_a_module_changes(self):
+        index = ProjectIndex.for_terraform(self.tf, self.tmp_dir)
+        self.assertIs(ProjectIndex.for_terraform(self.tf, self.tmp_dir), index)
+        Path(self.tmp_dir, 'outer/inner/main.tf').write_text(
+            INNER_TF.replace('${var.inner_name}', 'renamed'))
+        rebuilt = ProjectIndex.for_terraform(self.tf, self.tmp_dir)
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.attributes('inner')['function_name'], 'renamed')
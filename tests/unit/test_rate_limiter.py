@@ -0,0 +1,17 @@
+import threading
+import time
+
+from unittest import TestCase
+from maniplecli.util.rate_limiter import RateLimiter
+
+
+class TestRateLimiter(TestCase):
+    def test_calls_are_spaced(self):
+        limiter = RateLimiter(50)
+        start = time.monotonic()
+        threads = [threading.Thread(target=limiter.acquire) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(time.monotonic() - start >= 4 / 50)
@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+
+from botocore.exceptions import ClientError
+from unittest import TestCase
+from maniplecli.util.s3_uploader import S3Uploader, MB
+
+
+def write_in_chunks(data, size=300 * 1024):
+    def write(writer):
+        for start in range(0, len(data), size):
+            writer.write(data[start:start + size])
+    return write
+
+
+class FakeS3():
+    """In memory stand-in for the s3 client calls used by S3Uploader."""
+
+    def __init__(self, fail_on_part=None):
+        self.objects = {}
+        self.uploads = {}
+        self.fail_on_part = fail_on_part
+        self.uploaded_parts = []
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None,
+                    Callback=None, Config=None):
+        with open(Filename, 'rb') as f:
+            data = f.read()
+        self.objects[(Bucket, Key)] = (data, (ExtraArgs or {}).get('Metadata'))
+        Callback(len(data))
+
+    def create_multipart_upload(self, Bucket, Key, Metadata=None):
+        upload_id = 'upload-{}'.format(len(self.uploads))
+        self.uploads[upload_id] = {'parts': {}, 'metadata': Metadata}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber == self.fail_on_part:
+            raise ClientError({'Error': {'Code': 'RequestTimeout'}}, 'UploadPart')
+        self.uploads[UploadId]['parts'][PartNumber] = Body
+        self.uploaded_parts.append(PartNumber)
+        return {'ETag': '"etag-{}"'.format(PartNumber)}
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0):
+        if UploadId not in self.uploads:
+            raise ClientError({'Error': {'Code': 'NoSuchUpload'}}, 'ListParts')
+        parts = [{'PartNumber': n, 'ETag': '"etag-{}"'.format(n), 'Size': len(body)}
+                 for n, body in sorted(self.uploads[UploadId]['parts'].items())]
+        return {'Parts': parts, 'IsTruncated': False}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        data = b''.join(upload['parts'][part['PartNumber']]
+                        for part in MultipartUpload['Parts'])
+        self.objects[(Bucket, Key)] = (data, upload['metadata'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+
+class TestS3Uploader(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, 'package.zip')
+        self.data = os.urandom(5 * MB + 123)
+        with open(self.file_path, 'wb') as f:
+            f.write(self.data)
+        self.config = S3Uploader.transfer_config(chunk_size_mb=1, concurrency=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_small_file_single_upload(self):
+        s3 = FakeS3()
+        stats = S3Uploader.upload(s3, self.file_path, 'bucket', 'key',
+                                  S3Uploader.transfer_config(chunk_size_mb=8),
+                                  {'maniple-digest': 'abc'})
+        self.assertEqual(s3.objects[('bucket', 'key')],
+                         (self.data, {'maniple-digest': 'abc'}))
+        self.assertEqual(stats['bytes'], len(self.data))
+        self.assertTrue(stats['mbps'] > 0)
+
+    def test_multipart_upload(self):
+        s3 = FakeS3()
+        stats = S3Uploader.upload(s3, self.file_path, 'bucket', 'key',
+                                  self.config, {'maniple-digest': 'abc'})
+        self.assertEqual(s3.objects[('bucket', 'key')],
+                         (self.data, {'maniple-digest': 'abc'}))
+        self.assertEqual(sorted(s3.uploaded_parts), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(stats['resumed_parts'], 0)
+        self.assertFalse(os.path.exists(S3Uploader.state_path(self.file_path)))
+
+    def test_interrupted_upload_resumes(self):
+        s3 = FakeS3(fail_on_part=4)
+        self.config.max_concurrency = 1
+        with self.assertRaises(ClientError):
+            S3Uploader.upload(s3, self.file_path, 'bucket', 'key', self.config)
+        self.assertTrue(os.path.exists(S3Uploader.state_path(self.file_path)))
+
+        sent = s3.uploaded_parts
+        self.assertEqual(sent[:3], [1, 2, 3])
+        s3.fail_on_part = None
+        s3.uploaded_parts = []
+        stats = S3Uploader.upload(s3, self.file_path, 'bucket', 'key', self.config)
+        self.assertEqual(stats['resumed_parts'], len(sent))
+        self.assertEqual(sorted(sent + s3.uploaded_parts), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(s3.objects[('bucket', 'key')][0], self.data)
+
+    def test_changed_file_restarts_upload(self):
+        s3 = FakeS3(fail_on_part=2)
+        self.config.max_concurrency = 1
+        with self.assertRaises(ClientError):
+            S3Uploader.upload(s3, self.file_path, 'bucket', 'key', self.config)
+        with open(self.file_path, 'ab') as f:
+            f.write(b'changed')
+
+        s3.fail_on_part = None
+        stats = S3Uploader.upload(s3, self.file_path, 'bucket', 'key', self.config)
+        self.assertEqual(stats['resumed_parts'], 0)
+        self.assertEqual(s3.objects[('bucket', 'key')][0], self.data + b'changed')
+        self.assertEqual(s3.uploads, {})
+
+    def test_stream_upload(self):
+        s3 = FakeS3()
+        stats = S3Uploader.stream(s3, write_in_chunks(self.data), 'bucket', 'key',
+                                  self.config, {'maniple-digest': 'abc'})
+        self.assertEqual(s3.objects[('bucket', 'key')],
+                         (self.data, {'maniple-digest': 'abc'}))
+        self.assertEqual(stats['parts'], 6)
+        self.assertEqual(stats['bytes'], len(self.data))
+
+    def test_failed_stream_is_aborted(self):
+        s3 = FakeS3(fail_on_part=2)
+        with self.assertRaises(ClientError):
+            S3Uploader.stream(s3, write_in_chunks(self.data), 'bucket', 'key',
+                              self.config)
+        self.assertEqual(s3.uploads, {})
+        self.assertEqual(s3.objects, {})
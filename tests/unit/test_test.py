@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+
+from click.testing import CliRunner
+from pathlib import Path
+from unittest import TestCase, mock
+from maniplecli.commands.test import cli as run_tests
+
+
+class TestTestCommand(TestCase):
+    def setUp(self):
+        self.runner = CliRunner()
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        for name in ['tests/test_handler.py', 'tests/unit/test_app.py',
+                     'tests/test_index.js']:
+            Path(self.root, name).parent.mkdir(parents=True, exist_ok=True)
+            Path(self.root, name).write_text('')
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.root)
+        self.runs = []
+        self.return_codes = {}
+
+    def shell_run(self, cmd, pwd):
+        self.runs.append((cmd, str(pwd), os.getcwd()))
+        runtime = 'nodejs' if 'npm' in cmd else 'python'
+        return self.return_codes.get(runtime, 0), b'', b''
+
+    def invoke(self, *args):
+        results = [{'name': 'py', 'runtime': 'python3.6', 'error': None},
+                    {'name': 'js', 'runtime': 'nodejs8.10', 'error': None}]
+        with mock.patch('maniplecli.util.config_loader.ConfigLoader.load_config',
+                        return_value={'name': None, 'tf_file': 'main.tf'}), \
+                mock.patch('maniplecli.util.config_loader.ConfigLoader.resolve_all',
+                           return_value=results), \
+                mock.patch('maniplecli.commands.test.Shell.run', side_effect=self.shell_run):
+            return self.runner.invoke(run_tests, list(args))
+
+    def test_mixed_runtimes_run_both_suites(self):
+        result = self.invoke()
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(sorted((cmd if isinstance(cmd, str) else ' '.join(cmd), pwd)
+                                for cmd, pwd, cwd in self.runs),
+                         [('npm test', self.root),
+                          ('python -m unittest test_app.py',
+                           os.path.join(self.root, 'tests', 'unit')),
+                          ('python -m unittest test_handler.py',
+                           os.path.join(self.root, 'tests'))])
+        self.assertEqual({cwd for cmd, pwd, cwd in self.runs}, {self.root})
+
+    def test_failure_still_runs_the_other_suite(self):
+        self.return_codes['python'] = 1
+        result = self.invoke('-f', 'test_handler.py')
+        self.assertEqual(result.exit_code, 1)
+        self.assertEqual([pwd for cmd, pwd, cwd in self.runs],
+                         [os.path.join(self.root, 'tests')])
+        self.assertIn('Single file tests not supported for nodejs', result.output)
@@ -0,0 +1,64 @@
+import hcl
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase, mock
+from maniplecli.util.tf_cache import TerraformCache
+
+MAIN_TF = """
+resource "aws_lambda_function" "fn" {
+  function_name = "fn"
+  handler = "fn.handler"
+  runtime = "python3.6"
+}
+"""
+
+
+class TestTerraformCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.tf_file = os.path.join(self.tmp_dir, 'main.tf')
+        with open(self.tf_file, 'w') as f:
+            f.write(MAIN_TF)
+        self.path = mock.patch.object(
+            TerraformCache, 'cache_path',
+            return_value=os.path.join(self.tmp_dir, '.maniple', 'tf_cache.json'))
+        self.path.start()
+        self.addCleanup(self.path.stop)
+        TerraformCache.entries = None
+        self.addCleanup(setattr, TerraformCache, 'entries', None)
+
+    def load(self):
+        with mock.patch('maniplecli.util.tf_cache.hcl.load', side_effect=hcl.load) as parse:
+            tf = TerraformCache.load(self.tf_file)
+        return tf, parse.call_count
+
+    def test_unchanged_file_is_parsed_once(self):
+        tf, parses = self.load()
+        self.assertEqual(parses, 1)
+        tf['resource']['aws_lambda_function']['fn']['runtime'] = 'changed'
+        tf, parses = self.load()
+        self.assertEqual(parses, 0)
+        self.assertEqual(tf['resource']['aws_lambda_function']['fn']['runtime'], 'python3.6')
+
+    def test_changed_file_is_parsed_again(self):
+        self.load()
+        with open(self.tf_file, 'a') as f:
+            f.write('variable "region" {}\n')
+        tf, parses = self.load()
+        self.assertEqual(parses, 1)
+        self.assertIn('variable', tf)
+
+    def test_cache_is_kept_on_disk(self):
+        self.load()
+        # A new process only has the file
+        TerraformCache.entries = None
+        tf, parses = self.load()
+        self.assertEqual(parses, 0)
+        self.assertEqual(tf['resource']['aws_lambda_function']['fn']['handler'], 'fn.handler')
+
+    def test_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            TerraformCache.load(os.path.join(self.tmp_dir, 'other.tf'))
@@ -0,0 +1,68 @@
+import json
+import os
+import shutil
+import tempfile
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from unittest import TestCase, mock
+from maniplecli.util.tf_cache import TerraformCache
+from maniplecli.util.tf_directory import TerraformDirectory
+
+FILES = {
+    'lambda.tf': 'resource "aws_lambda_function" "fn" {\n'
+                 '  function_name = "fn"\n  runtime = "python3.6"\n}\n',
+    'api.tf.json': json.dumps({'resource': {'aws_lambda_function': {
+        'api': {'function_name': 'api', 'runtime': 'nodejs8.10'}}}}),
+    'variables.tf': 'variable "stage" {\n  default = "dev"\n}\n'
+                    'locals {\n  prefix = "app"\n}\n',
+    'outputs.tf': 'locals {\n  suffix = "v1"\n}\n',
+    'lambda_override.tf': 'resource "aws_lambda_function" "fn" {\n'
+                          '  runtime = "python3.7"\n}\n',
+    'README.md': 'not terraform'
+}
+
+
+class TestTerraformDirectory(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        for name, text in FILES.items():
+            Path(self.tmp_dir, name).write_text(text)
+        self.path = mock.patch.object(
+            TerraformCache, 'cache_path',
+            return_value=os.path.join(self.tmp_dir, '.maniple', 'tf_cache.json'))
+        self.path.start()
+        self.addCleanup(self.path.stop)
+        TerraformCache.entries = None
+
+    def test_files_merged_with_origins(self):
+        tf, origins = TerraformDirectory.load(self.tmp_dir)
+        functions = tf['resource']['aws_lambda_function']
+        self.assertEqual(sorted(functions), ['api', 'fn'])
+        self.assertEqual(functions['fn'], {'function_name': 'fn', 'runtime': 'python3.7'})
+        self.assertEqual(tf['locals'], {'prefix': 'app', 'suffix': 'v1'})
+        self.assertEqual(origins['resource.aws_lambda_function.api'],
+                         os.path.join(self.tmp_dir, 'api.tf.json'))
+        self.assertEqual(origins['resource.aws_lambda_function.fn'],
+                         os.path.join(self.tmp_dir, 'lambda.tf'))
+        self.assertEqual(origins['local.suffix'], os.path.join(self.tmp_dir, 'outputs.tf'))
+
+    def test_parsed_in_parallel_once(self):
+        with mock.patch('maniplecli.util.tf_directory.ProcessPoolExecutor',
+                        wraps=ProcessPoolExecutor) as pool:
+            first = TerraformDirectory.load(self.tmp_dir, workers=2)
+            self.assertEqual(pool.call_count, 1)
+            with mock.patch('maniplecli.util.tf_directory.parse') as parse:
+                self.assertEqual(TerraformDirectory.load(self.tmp_dir, workers=2), first)
+            parse.assert_not_called()
+            self.assertEqual(pool.call_count, 1)
+
+    def test_signature_changes_with_new_file(self):
+        signature = TerraformDirectory.signature(self.tmp_dir)
+        Path(self.tmp_dir, 'extra.tf').write_text('variable "extra" {}\n')
+        self.assertNotEqual(TerraformDirectory.signature(self.tmp_dir), signature)
+
+    def test_empty_directory(self):
+        with self.assertRaises(FileNotFoundError):
+            TerraformDirectory.load(os.path.join(self.tmp_dir, 'missing'))
@@ -0,0 +1,89 @@
+import hcl
+import os
+import shutil
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase, mock
+from maniplecli.util.tf_cache import TerraformCache
+from maniplecli.util.tf_evaluator import TerraformEvaluator
+
+MAIN_TF = """
+variable "stage" {
+  default = "dev"
+}
+
+variable "region" {
+  default = "us-east-1"
+}
+
+variable "sizes" {
+  default = {
+    dev = 128
+    prod = 1024
+  }
+}
+
+locals {
+  prefix = "${var.stage}-app"
+  bucket = "${lower(format("%s-%s", local.prefix, var.region))}"
+}
+"""
+
+
+class TestTerraformEvaluator(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = mock.patch.object(
+            TerraformCache, 'cache_path',
+            return_value=os.path.join(self.tmp_dir, '.maniple', 'tf_cache.json'))
+        self.path.start()
+        self.addCleanup(self.path.stop)
+        TerraformCache.entries = None
+        TerraformEvaluator.configure([])
+        self.addCleanup(TerraformEvaluator.configure, [])
+        self.tf = hcl.loads(MAIN_TF)
+
+    def evaluator(self):
+        return TerraformEvaluator.for_terraform(self.tf, self.tmp_dir)
+
+    def test_locals_and_functions(self):
+        evaluator = self.evaluator()
+        self.assertEqual(evaluator.evaluate('s3://${local.bucket}/${var.stage}/fn.zip'),
+                         's3://dev-app-us-east-1/dev/fn.zip')
+        self.assertEqual(evaluator.evaluate('${lookup(var.sizes, var.stage)}'), 128)
+        self.assertEqual(evaluator.evaluate('${var.sizes["prod"]}'), 1024)
+
+    def test_unresolved_expressions_are_kept(self):
+        evaluator = self.evaluator()
+        self.assertEqual(evaluator.evaluate('${data.aws_iam_role.role.arn}'),
+                         '${data.aws_iam_role.role.arn}')
+        self.assertEqual(evaluator.evaluate('${var.missing}-${var.stage}'),
+                         '${var.missing}-dev')
+
+    def test_tfvars_precedence(self):
+        Path(self.tmp_dir, 'terraform.tfvars').write_text('stage = "test"\nregion = "eu-west-1"\n')
+        Path(self.tmp_dir, 'b.auto.tfvars').write_text('stage = "qa"\n')
+        self.assertEqual(self.evaluator().evaluate('${local.bucket}'), 'qa-app-eu-west-1')
+
+        var_file = Path(self.tmp_dir, 'prod.tfvars')
+        var_file.write_text('stage = "prod"\n')
+        TerraformEvaluator.configure([str(var_file)])
+        self.assertEqual(self.evaluator().evaluate('${local.bucket}'), 'prod-app-eu-west-1')
+
+    def test_reloaded_when_tfvars_change(self):
+        tfvars = Path(self.tmp_dir, 'terraform.tfvars')
+        tfvars.write_text('stage = "test"\n')
+        evaluator = self.evaluator()
+        self.assertIs(self.evaluator(), evaluator)
+        tfvars.write_text('stage = "staging"\n')
+        self.assertEqual(self.evaluator().evaluate('${var.stage}'), 'staging')
+
+    def test_module_arguments_evaluated_by_caller(self):
+        module_tf = hcl.loads('variable "name" {}\nvariable "memory" {\n  default = 256\n}\n')
+        module = self.evaluator().module(module_tf, self.tmp_dir,
+                                         {'source': './fn', 'name': '${local.prefix}-fn'})
+        self.assertEqual(module.evaluate({'function_name': '${var.name}',
+                                          'memory_size': '${var.memory}'}),
+                         {'function_name': 'dev-app-fn', 'memory_size': 256})
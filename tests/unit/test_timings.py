@@ -0,0 +1,61 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from unittest import TestCase
+from maniplecli.util.shell import Shell
+from maniplecli.util.timings import Timings
+
+
+class TestTimings(TestCase):
+    def setUp(self):
+        Timings.enable()
+        self.addCleanup(Timings.disable)
+
+    def rows(self):
+        return {(row['function'], row['stage']): row
+                for row in Timings.report()['stages']}
+
+    def test_nested_stage_time_is_not_counted_twice(self):
+        with Timings.stage('outer'):
+            with Timings.stage('inner'):
+                time.sleep(0.05)
+                Timings.add_bytes(10)
+        rows = self.rows()
+        self.assertTrue(rows[(None, 'inner')]['seconds'] >= 0.05)
+        self.assertTrue(rows[(None, 'outer')]['seconds'] < 0.05)
+        self.assertEqual(rows[(None, 'inner')]['bytes'], 10)
+        self.assertEqual(rows[(None, 'outer')]['bytes'], 0)
+
+    def test_stages_by_function_and_subprocesses(self):
+        def deploy(name):
+            with Timings.function(name), Timings.stage('pip'):
+                Shell.run([sys.executable, '-c', 'pass'], os.getcwd())
+        threads = [threading.Thread(target=deploy, args=(name,)) for name in 'ab']
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rows = self.rows()
+        self.assertEqual(sorted(rows), [('a', 'pip'), ('b', 'pip')])
+        self.assertEqual(rows[('a', 'pip')]['subprocesses'], 1)
+        self.assertEqual(rows[('b', 'pip')]['calls'], 1)
+
+    def test_json_report(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'timings.json')
+        with Timings.stage('zip'):
+            pass
+        Timings.finish(show=False, json_path=path)
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual([row['stage'] for row in report['stages']], ['zip'])
+        # Nothing is recorded once finished
+        with Timings.stage('zip'):
+            pass
+        self.assertEqual(self.rows()[(None, 'zip')]['calls'], 1)
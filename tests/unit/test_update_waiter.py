@@ -0,0 +1,71 @@
+import boto3
+
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+from unittest import TestCase
+from maniplecli.util.update_waiter import UpdateWaiter
+
+
+class FakeLambda():
+    """
+    Answers get_function_configuration with the next status of each function.
+    """
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = []
+
+    def get_function_configuration(self, FunctionName):
+        self.calls.append(FunctionName)
+        status = self.statuses[FunctionName].pop(0)
+        if isinstance(status, Exception):
+            raise status
+        return {'LastUpdateStatus': status,
+                'LastUpdateStatusReason': 'bad zip' if status == 'Failed' else None}
+
+
+class TestUpdateWaiter(TestCase):
+    def test_waits_for_every_function(self):
+        client = FakeLambda({
+            'a': ['InProgress', 'InProgress', 'Successful'],
+            'b': ['Successful'],
+            'c': ['InProgress', 'Failed'],
+            'd': [ClientError({'Error': {'Code': 'ResourceNotFoundException'}},
+                              'GetFunctionConfiguration')]
+        })
+        results = UpdateWaiter.wait(client, ['a', 'b', 'c', 'd'], delay=0)
+        self.assertEqual({name: result['status'] for name, result in results.items()},
+                         {'a': 'Successful', 'b': 'Successful',
+                          'c': 'Failed', 'd': 'Error'})
+        self.assertEqual(results['c']['reason'], 'bad zip')
+        self.assertEqual(client.calls.count('a'), 3)
+        self.assertEqual(UpdateWaiter.failed(results), ['c', 'd'])
+
+    def test_timeout(self):
+        client = FakeLambda({'a': ['InProgress'] * 10})
+        results = UpdateWaiter.wait(client, ['a'], timeout=0.05, delay=0.02)
+        self.assertEqual(results['a']['status'], 'TimedOut')
+
+    def test_settle_time_counts_from_the_update_call(self):
+        UpdateWaiter.record_update('early')
+        self.addCleanup(UpdateWaiter.updates.pop, 'early')
+        UpdateWaiter.updates['early'] -= 30
+        client = FakeLambda({'early': ['Successful'], 'unrecorded': ['Successful']})
+        names = ['early', 'unrecorded']
+        results = UpdateWaiter.wait(client, names, timeout=1, delay=0,
+                                    updated_at=UpdateWaiter.update_times(names))
+        self.assertGreaterEqual(results['early']['seconds'], 30)
+        self.assertEqual(results['early']['status'], 'Successful')
+        self.assertLess(results['unrecorded']['seconds'], 1)
+
+    def test_stubbed_client(self):
+        client = boto3.client('lambda', region_name='us-east-1',
+                              aws_access_key_id='testing',
+                              aws_secret_access_key='testing')
+        stubber = Stubber(client)
+        for status in ['InProgress', 'Successful']:
+            stubber.add_response('get_function_configuration',
+                                 {'LastUpdateStatus': status}, {'FunctionName': 'fn'})
+        with stubber:
+            results = UpdateWaiter.wait(client, ['fn'], delay=0)
+        stubber.assert_no_pending_responses()
+        self.assertEqual(results['fn']['status'], 'Successful')